@@ -12,14 +12,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
 import streamlit as st
 import requests
+import numpy as np
 
 from PIL import Image
 
 from telescope.tasks import AVAILABLE_TASKS
 from telescope.metrics.result import MultipleResult
+from telescope.metrics.bertscore.metric import BATCH_SIZE as BERTSCORE_BATCH_SIZE
+from telescope.metrics.progress import progress_hook
+from telescope.metrics.tokenization import tokenization_run
+from telescope.filters.filter import reduction
 from telescope.collection_testsets import CollectionTestsets
+from telescope.testset import MultipleTestset
 
 available_tasks = {t.name: t for t in AVAILABLE_TASKS}
 
@@ -58,6 +65,7 @@ filters = st.sidebar.multiselect(
     help = ("For named-entities, the following languages are available: ar, zh, nl, en, fr, de, ru and uk")
 )
 
+length_interval = (0, 100)
 if "length" in available_filters:
     st.sidebar.subheader("Segment length constraints:")
     length_interval = st.sidebar.slider(
@@ -95,6 +103,28 @@ if task != "classification":
     sample_ratio = st.sidebar.slider(
         "Proportion (P) of the initial sample:", 0.0, 1.0, value=0.5, step=0.1
     )
+    workers = st.sidebar.number_input(
+        "Number of processes:",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=1,
+        step=1,
+        help="Processes used to spread the bootstrap partitions and metrics.",
+    )
+
+metric_kwargs = {}
+if "BERTScore" in metrics or metric == "BERTScore":
+    st.sidebar.subheader("BERTScore settings:")
+    metric_kwargs["BERTScore"] = {
+        "batch_size": st.sidebar.number_input(
+            "Maximum batch size:",
+            min_value=1,
+            max_value=1024,
+            value=BERTSCORE_BATCH_SIZE,
+            step=8,
+            help="The batch size shrinks for long segments to stay within the memory budget.",
+        )
+    }
 
 # --------------------- Streamlit APP Caching functions! --------------------------
 
@@ -106,49 +136,59 @@ def hash_metrics(metrics):
     return " ".join([m.name for m in metrics])
 
 
-st.cache(
-    hash_funcs={CollectionTestsets: CollectionTestsets.hash_func},
+@st.cache(
+    hash_funcs={
+        CollectionTestsets: CollectionTestsets.hash_func,
+        MultipleTestset: MultipleTestset.hash_func,
+    },
     suppress_st_warning=True,
     show_spinner=False,
     allow_output_mutation=True,
     ttl=cache_time,
     max_entries=cache_max_entries,
 )
-def apply_filters(testset, filters, ref_name, source_language, target_language, labels):
+def apply_filters(testset, filters, ref_name, source_language, target_language, labels, length_interval):
 
+    masks = []
     for filter in filters:
         with st.spinner(f"Applying {filter} filter for reference {ref_name}..." ):
             if filter == "length":
-                testset.apply_filter(available_filters[filter](testset, *length_interval))
+                masks.append(available_filters[filter](testset, *length_interval).mask())
             elif filter == "named-entities":
-                testset.apply_filter(available_filters[filter](testset, source_language,target_language))
+                progress_bar = st.progress(0)
+                with progress_hook(lambda name, done, total: progress_bar.progress(done / total)):
+                    masks.append(available_filters[filter](testset, source_language,target_language).mask())
+                progress_bar.empty()
             else:
-                testset.apply_filter(available_filters[filter](testset))
-
-    # HACK
-    # I'll add a new prefix to all testset filenames to "fool" streamlit cache
-    if "length" in filters:
-        filter_prefix = " ".join([f for f in filters]) + str(length_interval)
-    else:
-        filter_prefix = " ".join([f for f in filters])
-    testset.filenames = [filter_prefix + f for f in testset.filenames]
-    return testset
+                masks.append(available_filters[filter](testset).mask())
+    mask = np.logical_and.reduce(masks)
+    # The filtered testset has a new digest, so its metric results are cached apart.
+    testset.apply_mask(mask)
+    return testset, reduction(mask)
 
 
 @st.cache(
-    hash_funcs={CollectionTestsets: CollectionTestsets.hash_func},
+    hash_funcs={
+        CollectionTestsets: CollectionTestsets.hash_func,
+        MultipleTestset: MultipleTestset.hash_func,
+    },
     show_spinner=False,
     allow_output_mutation=True,
     ttl=cache_time,
     max_entries=cache_max_entries,
 )
-def run_metric(testset, metric, ref_filename, language, labels):
-    with st.spinner(f"Running {metric} for reference {ref_filename}..."):
+def run_metric(testset, metric, ref_filename, language, labels, metric_kwargs):
+    # Tokenized segments are released when the outermost run exits.
+    with tokenization_run(), st.spinner(f"Running {metric} for reference {ref_filename}..."):
         if labels == [" "]:
-            metric = available_metrics[metric](language=language)
+            metric = available_metrics[metric](language=language, **metric_kwargs.get(metric, {}))
         else:
             metric = available_metrics[metric](labels=labels)
-        return metric.multiple_comparison(testset)
+        progress_bar = st.progress(0)
+        with progress_hook(lambda name, done, total: progress_bar.progress(done / total)):
+            result = metric.multiple_comparison(testset)
+        progress_bar.empty()
+        return result
 
 
 def run_all_metrics(collection, metrics, filters):
@@ -166,25 +206,25 @@ def run_all_metrics(collection, metrics, filters):
     if filters:
         for ref_name in refs_names:
             testset = collection_testsets.testsets[ref_name]
-            corpus_size = len(testset)
-            collection_testsets.testsets[ref_name] = apply_filters(testset,filters,ref_name,
+            collection_testsets.testsets[ref_name], reduced = apply_filters(testset,filters,ref_name,
                                                                 source_language,
                                                                 target_language,
-                                                                labels)
-            st.success("Corpus reduced in {:.2f}%".format(
-                (1 - (len(collection_testsets.testsets[ref_name]) / corpus_size)) 
-                    * 100) + " for reference " + ref_name)
-
-    return {
-        ref_name: {metric: run_metric(
-                            collection_testsets.testsets[ref_name], 
-                            metric, 
-                            ref_name,
-                            target_language,
-                            labels) 
-        for metric in metrics}
-        for ref_name in refs_names
-        }
+                                                                labels,
+                                                                length_interval)
+            st.success("Corpus reduced in {:.2f}%".format(reduced) + " for reference " + ref_name)
+
+    with tokenization_run():
+        return {
+            ref_name: {metric: run_metric(
+                                collection_testsets.testsets[ref_name], 
+                                metric, 
+                                ref_name,
+                                target_language,
+                                labels,
+                                metric_kwargs) 
+            for metric in metrics}
+            for ref_name in refs_names
+            }
 @st.cache
 def rename_system(system_name,sys_id):
     st.session_state[sys_id + "_name"] = system_name
@@ -245,7 +285,7 @@ if collection_testsets:
         if task != "classification":
             available_tasks[task].plots_interface(metric, metrics, available_metrics,
                                                 results, collection_testsets, ref_filename,
-                                                num_samples, sample_ratio)
+                                                num_samples, sample_ratio, workers)
         else:
             available_tasks[task].plots_interface(metric, metrics, available_metrics,
                                                 results, collection_testsets, ref_filename)
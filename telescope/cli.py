@@ -18,18 +18,27 @@ MT-Telescope command line interface (CLI)
 Main commands:
     - score     Used to download Machine Translation metrics.
 """
-from typing import List, Union, Tuple
+from typing import Callable, Dict, List, Union, Tuple
 import os
 import click
 import json
+import numpy as np
 import pandas as pd
+from functools import partial, wraps
 
 from telescope.metrics import AVAILABLE_METRICS, AVAILABLE_CLASSIFICATION_METRICS, AVAILABLE_MT_METRICS, PairwiseResult
 from telescope.filters import AVAILABLE_FILTERS, AVAILABLE_CLASSIFICATION_FILTERS
+from telescope.filters.filter import combine_masks, reduction
 from telescope.tasks import AVAILABLE_NLG
 from telescope.metrics.result import MultipleResult
+from telescope.metrics.metric import MergeableShards
+from telescope.metrics.bootstrap import new_seed, run_bootstraps
+from telescope.metrics.cache import segment_cache
+from telescope.metrics.tokenization import tokenization_run
 from telescope.testset import PairwiseTestset, MultipleTestset
 from telescope.collection_testsets import NLGTestsets, ClassTestsets
+from telescope.utils import file_lines
+from telescope.shards import load_shards, merge_shards, parse_shard, shard_bounds, write_shard
 from telescope.plot import ClassificationPlot, NLGPlot
 from telescope.plotting import (
     plot_segment_comparison,
@@ -46,7 +55,7 @@ available_nlg_tasks = {t.name: t for t in AVAILABLE_NLG}
 
 
 def readlines(ctx, param, file: click.File) -> List[str]:
-    return [l.strip() for l in file.readlines()]
+    return file_lines(file)
 
 
 def output_folder_exists(ctx, param, output_folder):
@@ -55,9 +64,72 @@ def output_folder_exists(ctx, param, output_folder):
     return output_folder
 
 
+def shard_option(ctx, param, shard):
+    if shard is None:
+        return None
+    try:
+        return parse_shard(shard)
+    except ValueError as err:
+        raise click.BadParameter(str(err))
+
+
+def metric_kwargs(
+    comet_batch_size: int = None, comet_max_tokens: int = None, bertscore_batch_size: int = None
+) -> Dict[str, dict]:
+    """ Extra constructor arguments of the metrics that take them. """
+    return {
+        "COMET": {"batch_size": comet_batch_size, "max_tokens": comet_max_tokens},
+        "BERTScore": {"batch_size": bertscore_batch_size},
+    }
+
+
+def model_batch_options(command: Callable) -> Callable:
+    """
+    Adds the batch size options of the model-based metrics to a command. The command
+    receives them as `model_kwargs`, the extra constructor arguments of each metric.
+    """
+
+    @wraps(command)
+    def with_model_kwargs(
+        *args, comet_batch_size: int, comet_max_tokens: int, bertscore_batch_size: int, **kwargs
+    ):
+        model_kwargs = metric_kwargs(comet_batch_size, comet_max_tokens, bertscore_batch_size)
+        return command(*args, model_kwargs=model_kwargs, **kwargs)
+
+    options = [
+        click.option(
+            "--comet_batch_size",
+            required=False,
+            default=None,
+            type=click.IntRange(min=1),
+            help="Maximum number of segments in a COMET batch (env COMET_BATCH_SIZE, default 64).",
+        ),
+        click.option(
+            "--comet_max_tokens",
+            required=False,
+            default=None,
+            type=click.IntRange(min=1),
+            help="Maximum number of padded tokens in a COMET batch (env COMET_MAX_TOKENS, default 4096).",
+        ),
+        click.option(
+            "--bertscore_batch_size",
+            required=False,
+            default=None,
+            type=click.IntRange(min=1),
+            help="Maximum number of segments in a BERTScore batch (env BERTSCORE_BATCH_SIZE, default 64).",
+        ),
+    ]
+    # Applied last to first, as if they were stacked on the command.
+    for option in reversed(options):
+        with_model_kwargs = option(with_model_kwargs)
+    return with_model_kwargs
+
+
 @click.group()
-def telescope():
-    pass
+@click.pass_context
+def telescope(ctx):
+    # Tokenized segments are shared by every metric and system of a command.
+    ctx.with_resource(tokenization_run())
 
 
 @telescope.command()
@@ -157,6 +229,14 @@ def telescope():
     type=float,
     help="Folder you wish to use to save plots.",
 )
+@click.option(
+    "--workers",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes used in Bootstrap resampling.",
+)
+@model_batch_options
 def compare(
     source: click.File,
     system_x: click.File,
@@ -172,36 +252,34 @@ def compare(
     bootstrap: bool,
     num_splits: int,
     sample_ratio: float,
+    workers: int,
+    model_kwargs: Dict[str, dict],
 ):
     testset = PairwiseTestset(
-        src=[l.strip() for l in source.readlines()],
-        system_x=[l.strip() for l in system_x.readlines()],
-        system_y=[l.strip() for l in system_y.readlines()],
-        ref=[l.strip() for l in reference.readlines()],
+        src=file_lines(source),
+        system_x=file_lines(system_x),
+        system_y=file_lines(system_y),
+        ref=file_lines(reference),
         language_pair="X-" + language,
         filenames=[source.name, system_x.name, system_y.name, reference.name],
     )
-    corpus_size = len(testset)
     if filter:
         filters = [available_filters[f](testset) for f in filter if (f != "length" and f!= "named-entities")]
         if "length" in filter:
             filters.append(available_filters["length"](testset, int(length_min_val*100), int(length_max_val*100)))
-        elif "named-entities":
+        if "named-entities" in filter:
             filters.append(available_filters["named-entities"](testset, testset.source_language,
                                                             testset.target_language)) 
 
+        mask = combine_masks(filters)
+        testset.apply_mask(mask)
 
-        for filter in filters:
-            testset.apply_filter(filter)
-
-        if (1 - (len(testset) / corpus_size)) * 100 == 100:
+        if reduction(mask) == 100:
             click.secho("The current filters reduce the Corpus on 100%!", fg="ref")
             return
     
         click.secho(
-            "Filters Successfully applied. Corpus reduced in {:.2f}%.".format(
-                (1 - (len(testset) / corpus_size)) * 100
-            ),
+            "Filters Successfully applied. Corpus reduced in {:.2f}%.".format(reduction(mask)),
             fg="green",
         )
 
@@ -224,25 +302,24 @@ def compare(
         )
 
     results = {
-        m: available_metrics[m](language=testset.target_language).pairwise_comparison(
+        m: available_metrics[m](language=testset.target_language, **model_kwargs.get(m, {})).pairwise_comparison(
             testset
         )
         for m in metric
     }
+    report_cache_stats()
 
     # results_dict = PairwiseResult.results_to_dict(list(results.values()))
     results_df = PairwiseResult.results_to_dataframe(list(results.values()))
     if bootstrap:
-        bootstrap_results = []
-        for m in metric:
-            bootstrap_result = available_metrics[m].bootstrap_resampling(
-                testset, num_splits, sample_ratio, results[m]
-            )
-            bootstrap_results.append(
-                available_metrics[m]
-                .bootstrap_resampling(testset, num_splits, sample_ratio, results[m])
-                .stats
+        bootstraps = [
+            partial(
+                available_metrics[m].bootstrap_resampling,
+                testset, num_splits, sample_ratio, results[m], seed=new_seed()
             )
+            for m in metric
+        ]
+        bootstrap_results = [result.stats for result in run_bootstraps(bootstraps, workers)]
         bootstrap_results = {
             k: [dic[k] for dic in bootstrap_results] for k in bootstrap_results[0]
         }
@@ -254,6 +331,7 @@ def compare(
         if not output_folder.endswith("/"):
             output_folder += "/"
         results_df.to_json(output_folder + "results.json", orient="index", indent=4)
+        save_testset_identity(testset, output_folder)
         plot_segment_comparison(results[seg_metric], output_folder)
         plot_pairwise_distributions(results[seg_metric], output_folder)
         plot_bucket_comparison(results[seg_metric], output_folder)
@@ -298,12 +376,14 @@ def compare(
     multiple=True,
     help="MT metric to run.",
 )
+@model_batch_options
 def score(
     source: List[str],
     translation: List[str],
     reference: List[str],
     language: str,
     metric: Union[Tuple[str], str],
+    model_kwargs: Dict[str, dict],
 ):
     metrics = metric
     for metric in metrics:
@@ -311,7 +391,7 @@ def score(
             raise click.ClickException(f"{metric} does not support '{language}'")
     results = []
     for metric in metrics:
-        metric = available_metrics[metric](language)
+        metric = available_metrics[metric](language, **model_kwargs.get(metric, {}))
         results.append(metric.score(source, translation, reference))
 
     for result in results:
@@ -351,27 +431,42 @@ def seg_metric_in_metrics(seg_metric, metrics):
 
 def apply_filter(collection,filter,length_min_val,length_max_val):
     for ref_name in collection.refs_names:
-        corpus_size = len(collection.testsets[ref_name])
-        
+        testset = collection.testsets[ref_name]
+        filters = []
         for f in filter:
             if f == "length":
-                fil = available_filters[f](collection.testsets[ref_name], int(length_min_val*100), 
-                                    int(length_max_val*100))
+                fil = available_filters[f](testset, int(length_min_val*100), int(length_max_val*100))
             elif f == "named-entities":
-                fil = available_filters[f](collection.testsets[ref_name], collection.source_language, 
-                                                                            collection.target_language)
+                fil = available_filters[f](testset, collection.source_language, collection.target_language)
             else:
-                fil = available_filters[f](collection.testsets[ref_name])
-            collection.testsets[ref_name].apply_filter(fil)
+                fil = available_filters[f](testset)
+            filters.append(fil)
+
+        mask = combine_masks(filters)
+        testset.apply_mask(mask)
 
-        if (1 - (len(collection.testsets[ref_name]) / corpus_size)) * 100 == 100:
+        if reduction(mask) == 100:
             click.secho("For reference " + ref_name + ", the current filters reduce the Corpus on 100%!", fg="green")
             return
     
         click.secho( "Filters Successfully applied. Corpus reduced in {:.2f}%.".format(
-            (1 - (len(collection.testsets[ref_name]) / corpus_size)) * 100) + " for reference " + ref_name,
+            reduction(mask)) + " for reference " + ref_name,
                 fg="green" )
 
+def save_testset_identity(testset, saving_dir):
+    """ Writes the digest of the scored testset next to its results. """
+    with open(saving_dir + "testset.json", "w") as testset_file:
+        json.dump({"digest": testset.digest, "segments": len(testset)}, testset_file, indent=4)
+
+def report_cache_stats():
+    """ Prints the hits and misses of the segment cache, if any metric used it. """
+    cache = segment_cache()
+    if cache is None or cache.hits + cache.misses == 0:
+        return
+    stats = cache.stats()
+    click.secho("Segment cache: {} hits, {} misses ({} entries, {:.1f} MB).".format(
+        stats["hits"], stats["misses"], stats["entries"], stats["size"] / 2 ** 20), fg="bright_blue")
+
 def display_table(collection, ref_filename, systems_names, results):
     results_dicts = MultipleResult.results_to_dict(list(results.values()), systems_names)
 
@@ -385,18 +480,16 @@ def display_table(collection, ref_filename, systems_names, results):
 
     return results_dicts
 
-def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,num_splits,sample_ratio):
+def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,num_splits,sample_ratio,workers=1):
 
     testset = collection.testsets[ref_filename]
-    bootstrap_results = []
-
-    for m in metric:
-        bootstrap_results.append(
-            available_metrics[m]
-            .multiple_bootstrap_resampling(testset, num_splits, sample_ratio, system_x,
-                                    system_y, collection.target_language, results[m])
-            .stats)
-            
+    bootstraps = [
+        partial(available_metrics[m].multiple_bootstrap_resampling, testset, num_splits, sample_ratio,
+                system_x, system_y, collection.target_language, results[m], seed=new_seed())
+        for m in metric
+    ]
+    bootstrap_results = [result.stats for result in run_bootstraps(bootstraps, workers)]
+
     bootstrap_results = {k: [dic[k] for dic in bootstrap_results] for k in bootstrap_results[0]}      
     bootstrap_df = pd.DataFrame.from_dict(bootstrap_results)
     bootstrap_df.index = metric
@@ -406,6 +499,84 @@ def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,nu
 
     return bootstrap_df
 
+def all_pairs_bootstrap_result(collection,ref_filename,results,metric,num_splits,sample_ratio,workers=1):
+
+    testset = collection.testsets[ref_filename]
+    bootstraps = [
+        partial(available_metrics[m].all_pairs_bootstrap_resampling, testset, num_splits, sample_ratio,
+                collection.target_language, results[m], seed=new_seed())
+        for m in metric
+    ]
+    all_pairs_results = run_bootstraps(bootstraps, workers)
+
+    click.secho("\nAll-pairs bootstrap resampling results (% of partitions where the row system wins):", 
+                fg="yellow")
+    for all_pairs in all_pairs_results:
+        click.secho("metric: " + all_pairs.metric, fg="yellow")
+        click.secho(str(all_pairs.results_to_dataframe(collection.systems_names)), fg="yellow")
+
+    return all_pairs_results
+
+def saving_folder(output_folder, ref_filename):
+    """ Folder of the results of a reference, created if needed. """
+    if not output_folder.endswith("/"):
+        output_folder += "/"
+    saving_dir = output_folder + ref_filename.replace("/","_") + "/"
+    if not os.path.exists(saving_dir):
+        os.makedirs(saving_dir)
+    return saving_dir
+
+def report_nlg_results(collection, ref_filename, testset, results, metric, seg_metric, task, output_folder, bootstrap,
+                       all_pairs, num_splits, sample_ratio, system_x, system_y, workers=1):
+    """
+    Displays and saves the results of a reference: results table, bootstrap resampling and plots.
+
+    :param system_x: Filename of system x (the first system if it is None or unknown).
+    :param system_y: Filename of system y (the second system if it is None or unknown).
+    """
+    systems_index = collection.systems_indexes
+    systems_names = collection.systems_names
+    results_dicts = display_table(collection,ref_filename,systems_names,results)
+
+    if bootstrap and len(systems_index.values()) > 1: 
+        if system_x in systems_index and system_y in systems_index:
+            x_id = systems_index[system_x]
+            y_id = systems_index[system_y]
+    
+        else:
+            x_id = collection.indexes_of_systems()[0]
+            y_id = collection.indexes_of_systems()[1]
+
+        bootstrap_df = bootstrap_result(collection,ref_filename,results,metric,x_id,y_id,num_splits,sample_ratio,
+                                        workers)
+
+    all_pairs_results = []
+    if all_pairs and len(systems_index.values()) > 1:
+        all_pairs_results = all_pairs_bootstrap_result(collection,ref_filename,results,metric,num_splits,
+                                                    sample_ratio,workers)
+    
+    if output_folder != "":
+        saving_dir = saving_folder(output_folder, ref_filename)
+
+        with open(saving_dir + "results.json", "w") as result_file:
+            json.dump(results_dicts, result_file, indent=4)
+        save_testset_identity(testset, saving_dir)
+
+        if bootstrap and len(systems_index.values()) > 1:
+            x_name = systems_names[x_id]
+            y_name = systems_names[y_id]
+            filename = saving_dir + x_name + "-" + y_name + "_bootstrap_results.json"
+            bootstrap_df.to_json(filename, orient="index", indent=4)
+
+        if all_pairs_results:
+            with open(saving_dir + "all_pairs_bootstrap_results.json", "w") as result_file:
+                json.dump({res.metric: res.results_to_dict(systems_names) for res in all_pairs_results}, 
+                          result_file, indent=4)
+
+        plot = NLGPlot(seg_metric,metric,available_metrics,results,collection,ref_filename,task,num_splits,sample_ratio,
+                       workers)
+        plot.display_plots_cli(saving_dir,system_x,system_y,all_pairs_results)
+
 
 @telescope.command()
 @click.option(
@@ -492,6 +663,11 @@ def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,nu
     help="Folder you wish to use to save plots.",
 )
 @click.option("--bootstrap", is_flag=True)
+@click.option(
+    "--all_pairs",
+    is_flag=True,
+    help="Bootstrap resampling between every pair of systems.",
+)
 @click.option(
     "--system_x",
     "-x",
@@ -520,6 +696,13 @@ def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,nu
     type=float,
     help="Proportion (P) of the initial sample.",
 )
+@click.option(
+    "--workers",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes used in Bootstrap resampling.",
+)
 @click.option(
     "--systems_names",
     "-n",
@@ -527,6 +710,15 @@ def bootstrap_result(collection,ref_filename,results,metric,system_x,system_y,nu
     type=click.File(),
     help="File that contains the names of the systems per line.",
 )
+@model_batch_options
+@click.option(
+    "--shard",
+    required=False,
+    default=None,
+    callback=shard_option,
+    type=str,
+    help="Score only the i-th of N slices of the segments (e.g. 2/8) and save partial results for `merge`.",
+)
 def n_compare_nlg(
     source: click.File,
     system_output: Tuple[click.File],
@@ -540,12 +732,19 @@ def n_compare_nlg(
     seg_metric: str,
     output_folder: str,
     bootstrap: bool,
+    all_pairs: bool,
     num_splits: int,
     sample_ratio: float,
     system_x: click.File,
     system_y: click.File,
-    systems_names: click.File
+    workers: int,
+    systems_names: click.File,
+    model_kwargs: Dict[str, dict],
+    shard: Tuple[int, int],
 ):  
+    if shard is not None and output_folder == "":
+        raise click.BadParameter("Sharded runs need an output folder for their partial results.",
+                                 param_hint="--shard")
     collection = NLGTestsets.read_data_cli(source,systems_names,system_output,reference,language)
 
     click.secho("Systems:\n" + collection.display_systems(), fg="bright_blue")
@@ -554,47 +753,125 @@ def n_compare_nlg(
         apply_filter(collection,filter,length_min_val,length_max_val)   
 
     metric = seg_metric_in_metrics(seg_metric,metric)
-    systems_index = collection.systems_indexes
-    systems_names =  collection.systems_names
     language = collection.language_pair.split("-")[1]
+    metrics = {m: available_metrics[m](language=language, **model_kwargs.get(m, {})) for m in metric}
+    if shard is not None:
+        unmergeable = [m for m in metric if not isinstance(metrics[m], MergeableShards)]
+        if unmergeable:
+            raise click.BadParameter(f"{', '.join(unmergeable)} can not be scored in shards.",
+                                     param_hint="--shard")
 
     for ref_filename in collection.refs_names:
         testset = collection.testsets[ref_filename]
-        results = {
-            m: available_metrics[m](language=language).multiple_comparison(testset) 
-            for m in metric }
-
-        results_dicts = display_table(collection,ref_filename,systems_names,results)
-
-        if bootstrap and len(systems_index.values()) > 1: 
-            if system_x.name in systems_index and system_y.name in systems_index:
-                x_id = systems_index[system_x.name]
-                y_id = systems_index[system_y.name]
-        
-            else:
-                x_id = collection.indexes_of_systems()[0]
-                y_id = collection.indexes_of_systems()[1]
-
-            bootstrap_df = bootstrap_result(collection,ref_filename,results,metric,x_id,y_id,num_splits,sample_ratio)
-        
-        if output_folder != "":
-            if not output_folder.endswith("/"):
-                output_folder += "/"    
-            saving_dir = output_folder + ref_filename.replace("/","_") + "/"
-            if not os.path.exists(saving_dir):
-                os.makedirs(saving_dir)
+        if shard is not None:
+            digest, size = testset.digest, len(testset)
+            bounds = shard_bounds(size, *shard)
+            testset.take_rows(np.arange(*bounds))
+            results = {m: metrics[m].multiple_comparison(testset) for m in metric} if len(testset) > 0 else {}
+            path = write_shard(saving_folder(output_folder, ref_filename), collection, ref_filename, testset,
+                               results, metrics, seg_metric, task, shard, bounds, digest, size)
+            click.secho(f"Shard {shard[0]}/{shard[1]} of {ref_filename} (segments {bounds[0]} to {bounds[1]} "
+                        f"of {size}) saved to {path}.", fg="green")
+            continue
+
+        results = {m: metrics[m].multiple_comparison(testset) for m in metric}
+
+        for m, result in results.items():
+            if result.dedup_ratio > 0:
+                click.secho(f"{m}: {result.dedup_ratio:.2%} of the segments are repeated across systems and "
+                            "were scored once.", fg="yellow")
+
+        report_nlg_results(collection, ref_filename, testset, results, metric, seg_metric, task, output_folder,
+                           bootstrap, all_pairs, num_splits, sample_ratio, system_x.name if system_x else None,
+                           system_y.name if system_y else None, workers)
+    report_cache_stats()
 
-            with open(saving_dir + "results.json", "w") as result_file:
-                json.dump(results_dicts, result_file, indent=4)
 
-            if bootstrap and len(systems_index.values()) > 1:
-                x_name = systems_names[x_id]
-                y_name = systems_names[y_id]
-                filename = saving_dir + x_name + "-" + y_name + "_bootstrap_results.json"
-                bootstrap_df.to_json(filename, orient="index", indent=4)
+@telescope.command()
+@click.option(
+    "--shards",
+    "-i",
+    required=True,
+    multiple=True,
+    type=click.Path(exists=True),
+    help="Shard file or folder with shard files. This option can be multiple.",
+)
+@click.option(
+    "--output_folder",
+    "-o",
+    required=False,
+    default="",
+    callback=output_folder_exists,
+    type=str,
+    help="Folder you wish to use to save plots.",
+)
+@click.option("--bootstrap", is_flag=True)
+@click.option(
+    "--all_pairs",
+    is_flag=True,
+    help="Bootstrap resampling between every pair of systems.",
+)
+@click.option(
+    "--system_x",
+    "-x",
+    required=False,
+    type=str,
+    help="System X NLG outputs (filename given to the shards) for segment-level comparison and bootstrap resampling.",
+)
+@click.option(
+    "--system_y",
+    "-y",
+    required=False,
+    type=str,
+    help="System Y NLG outputs (filename given to the shards) for segment-level comparison and bootstrap resampling.",
+)
+@click.option(
+    "--num_splits",
+    required=False,
+    default=300,
+    type=int,
+    help="Number of random partitions used in Bootstrap resampling.",
+)
+@click.option(
+    "--sample_ratio",
+    required=False,
+    default=0.5,
+    type=float,
+    help="Proportion (P) of the initial sample.",
+)
+@click.option(
+    "--workers",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes used in Bootstrap resampling.",
+)
+def merge(
+    shards: Tuple[str],
+    output_folder: str,
+    bootstrap: bool,
+    all_pairs: bool,
+    system_x: str,
+    system_y: str,
+    num_splits: int,
+    sample_ratio: float,
+    workers: int,
+):
+    """ Merges the partial results of `n-compare-nlg --shard i/N` runs into the results of the whole testsets. """
+    try:
+        shards = load_shards(list(shards))
+        collection, results_per_ref = merge_shards(shards, available_metrics)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    first = next(iter(shards.values()))[0]
+    metric = tuple(first["metrics"])
+    click.secho("Systems:\n" + collection.display_systems(), fg="bright_blue")
 
-            plot = NLGPlot(seg_metric,metric,available_metrics,results,collection,ref_filename,task,num_splits,sample_ratio)
-            plot.display_plots_cli(saving_dir,system_x,system_y)
+    for ref_filename in collection.refs_names:
+        report_nlg_results(collection, ref_filename, collection.testsets[ref_filename], results_per_ref[ref_filename],
+                           metric, first["seg_metric"], first["task"], output_folder, bootstrap, all_pairs,
+                           num_splits, sample_ratio, system_x, system_y, workers)
 
 
 @telescope.command()
@@ -710,6 +987,7 @@ def n_compare_classification(
 
             with open(saving_dir + "results.json", "w") as result_file:
                 json.dump(results_dicts, result_file, indent=4)
+            save_testset_identity(testset, saving_dir)
             
             plot = ClassificationPlot(seg_metric,metric,available_class_metrics,results,
                 collection, ref_filename, "classification")
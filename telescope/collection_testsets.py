@@ -1,6 +1,6 @@
 from typing import List, Tuple, Dict
-from telescope.testset import Testset, MultipleTestset
-from telescope.utils import read_lines
+from telescope.testset import Testset, MultipleTestset, TextColumn, label_columns
+from telescope.utils import content_digest, file_lines, read_lines
 
 import streamlit as st
 import click
@@ -54,9 +54,14 @@ class CollectionTestsets:
             text += "--> " + sys_filename + " : " + self.systems_names[sys_id] + " \n"
         return text
 
+    @property
+    def digest(self) -> str:
+        """ Identity of the collection: a digest of the content of its testsets. """
+        return content_digest([self.task] + [testset.digest for testset in self.testsets.values()])
+
     @staticmethod
     def hash_func(collection):
-        return " ".join(collection.filenames)
+        return collection.digest
 
     @staticmethod
     def validate_files(src,refs,systems_names,outputs) -> None:
@@ -134,10 +139,14 @@ class CollectionTestsets:
     @staticmethod
     def create_testsets(files:list) -> Dict[str, Testset]:
         source_file, sources, _, references, _, _, systems_indexes, _, outputs = files
+        # Every text column is stored once: the testsets of all references share the
+        # sources and outputs.
+        sources = TextColumn.from_lines(sources)
+        outputs = {sys_id: TextColumn.from_lines(output) for sys_id, output in outputs.items()}
         testsets = {}
         for ref_filename, ref in references.items():
             filenames = list(source_file.name) + list(ref_filename) + list(systems_indexes.keys())
-            testsets[ref_filename] = MultipleTestset(sources, ref, outputs, filenames)
+            testsets[ref_filename] = MultipleTestset(sources, TextColumn.from_lines(ref), outputs, filenames)
         return testsets
     
     @classmethod
@@ -158,7 +167,7 @@ class CollectionTestsets:
             
             id = 1
             for sys_file,sys_name in zip(systems_output,sys_names):
-                data = [l.strip() for l in sys_file.readlines()]
+                data = file_lines(sys_file)
                 sys_id = "Sys " + str(id)
                 id += 1
                 systems_indexes[sys_file.name] = sys_id
@@ -168,7 +177,7 @@ class CollectionTestsets:
         else:
             id = 1
             for sys_file in systems_output:
-                data = [l.strip() for l in sys_file.readlines()]
+                data = file_lines(sys_file)
                 sys_id = "Sys " + str(id)
                 id += 1
                 systems_indexes[sys_file.name] = sys_id
@@ -178,13 +187,13 @@ class CollectionTestsets:
         references,refs_indexes = {},{}
         for ref in reference:
             if ref.name not in references:
-                data = [l.strip() for l in ref.readlines()]
+                data = file_lines(ref)
                 ref_id = "Ref " + str(cls.ref_ids)
                 cls.ref_ids += 1
                 references[ref.name] = data
                 refs_indexes[ref.name] = ref_id
 
-        src = [l.strip() for l in source.readlines()]
+        src = file_lines(source)
         files = [source,src,reference,references,refs_indexes,systems_output,systems_indexes,systems_names,outputs]
 
         testsets = cls.create_testsets(files)
@@ -398,6 +407,32 @@ class ClassTestsets(CollectionTestsets):
         super().__init__(src_name, refs_names, refs_indexes, systems_indexes, systems_names, filenames, 
                 testsets)
         self.labels = labels
+        self.encode_testsets()
+
+    @property
+    def digest(self) -> str:
+        return content_digest([super().digest] + list(self.labels))
+
+    def encode_testsets(self) -> None:
+        """
+        Stores the true and predicted labels of every testset as label codes of one
+        vocabulary (the labels followed by any unseen label). Outputs shared by
+        several testsets are encoded once.
+        """
+        testsets = list(self.testsets.values())
+        outputs = {}
+        for testset in testsets:
+            for name, output in testset.systems_output.items():
+                outputs.setdefault(id(output), output)
+        columns = label_columns(
+            [testset.ref for testset in testsets] + list(outputs.values()), self.labels
+        )
+        encoded = dict(zip(outputs, columns[len(testsets) :]))
+        for testset, ref in zip(testsets, columns):
+            testset.ref = ref
+            testset.systems_output = {
+                name: encoded[id(output)] for name, output in testset.systems_output.items()
+            }
     
     @staticmethod
     def upload_labels() -> List[str]:
@@ -12,9 +12,10 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections import Counter
 from typing import List
 
+import numpy as np
+import pandas as pd
 from telescope.filters.filter import Filter
 from telescope.testset import Testset
 
@@ -25,17 +26,6 @@ class DuplicatesFilter(Filter):
     def __init__(self, testset: Testset, *args):
         self.testset = testset
 
-    def apply_filter(self) -> List[int]:
-        counter = Counter(self.testset.src)
-        sources = []
-
-        for i, item in enumerate(self.testset):
-            src = item[0]
-            if counter[src] == 0:
-                continue
-            # if counter > 1 we set it to 0 to skip the next time it appears
-            if counter[src] > 1:
-                counter[src] = 0
-
-            sources.append(i)
-        return sources
+    def mask(self) -> np.ndarray:
+        """ Keeps the first segment of each source. """
+        return ~pd.Series(list(self.testset.src), dtype=object).duplicated(keep="first").to_numpy()
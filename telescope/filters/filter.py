@@ -15,6 +15,7 @@
 import abc
 from typing import List
 
+import numpy as np
 from telescope.testset import Testset
 
 
@@ -25,6 +26,28 @@ class Filter:
         self.testset = testset
 
     @abc.abstractmethod
+    def mask(self) -> np.ndarray:
+        """ Boolean mask of the elements to keep """
+        return NotImplementedError
+
     def apply_filter(self) -> List[int]:
         """ Returns the indexes of elements to keep """
-        return NotImplementedError
+        return np.flatnonzero(self.mask()).tolist()
+
+
+def combine_masks(filters: List[Filter], operator: str = "and") -> np.ndarray:
+    """
+    Mask of the elements kept by all the filters ("and") or by any of them ("or").
+    Every filter is computed on the rows of its testset before any is applied.
+    """
+    masks = [np.asarray(f.mask(), dtype=bool) for f in filters]
+    if operator == "and":
+        return np.logical_and.reduce(masks)
+    elif operator == "or":
+        return np.logical_or.reduce(masks)
+    raise Exception(f"{operator} is not a valid filter operator.")
+
+
+def reduction(mask: np.ndarray) -> float:
+    """ Percentage of the corpus removed by a mask. """
+    return (1 - np.count_nonzero(mask) / len(mask)) * 100 if len(mask) else 0.0
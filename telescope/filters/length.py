@@ -12,11 +12,41 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List
+from collections import OrderedDict
 
-import pandas as pd
+import numpy as np
 from telescope.filters.filter import Filter
-from telescope.testset import Testset
+from telescope.testset import Testset, column_digest
+
+# Buckets of 5 percentiles of the reference length: 0, 5, ..., 95.
+NUM_BUCKETS = 20
+BUCKET_WIDTH = 100 // NUM_BUCKETS
+
+# Buckets of the last references seen, by digest: they outlive the testsets that
+# are rebuilt on every rerun of the app.
+MAX_CACHED_BUCKETS = 16
+_BUCKETS = OrderedDict()
+
+
+def length_buckets(lengths: np.ndarray) -> np.ndarray:
+    """
+    Percentile bucket of each length, as `pd.qcut` into NUM_BUCKETS quantiles of the
+    lengths ranked with ties in order of appearance (`rank(method="first")`).
+    A single length, that has no quantiles, is ranked with an extra empty segment.
+    """
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if len(lengths) == 1:
+        return length_buckets(np.append(lengths, 0))[:1]
+
+    ranks = np.empty(len(lengths), dtype=np.float64)
+    ranks[np.argsort(lengths, kind="stable")] = np.arange(1, len(lengths) + 1)
+    # Quantile edges of the ranks 1..n, computed as pandas does.
+    edges = np.quantile(ranks, np.linspace(0, 1, NUM_BUCKETS + 1))
+    buckets = np.searchsorted(edges, ranks, side="left") - 1
+    # The lowest edge belongs to the first bucket.
+    buckets[ranks == edges[0]] = 0
+    return buckets * BUCKET_WIDTH
 
 
 class LengthFilter(Filter):
@@ -28,30 +58,27 @@ class LengthFilter(Filter):
         self.max_value = max_value
         assert self.min_value < self.max_value, f"Length Filter min value can't be smaller than max value ({min_value} > {max_value})."
 
-    def apply_filter(self) -> List[int]:
-        dataframe = pd.DataFrame()
-
-        if len(self.testset.ref) != 1:
-            dataframe["ref"] = self.testset.ref
-        else:
-            dataframe["ref"] = self.testset.ref + [""]
-
-        dataframe["lengths"] = [len(ref) for ref in list(dataframe["ref"])]
-        dataframe["bins"], retbins = pd.qcut(
-            dataframe["lengths"].rank(method="first"),
-            len(range(0, 100, 5)),
-            labels=range(0, 100, 5),
-            retbins=True,
-        )
-        if len(self.testset.ref) != 1:
-            length_buckets = list(dataframe["bins"])
-        else:
-            length_buckets = [list(dataframe["bins"])[0]]
-        return [
-            i
-            for i in range(len(self.testset))
-            if (
-                length_buckets[i] >= self.min_value
-                and length_buckets[i] < self.max_value
-            )
-        ]
+    def buckets(self) -> np.ndarray:
+        """
+        Length bucket of each reference. Buckets are kept on the testset until its
+        references change and by the digest of the references, so new length
+        intervals reuse them, even on a testset read again.
+        """
+        ref = self.testset.ref
+        cached = self.testset.length_buckets
+        if cached is None or cached[0] is not ref:
+            digest = column_digest(ref)
+            if digest in _BUCKETS:
+                _BUCKETS.move_to_end(digest)
+            else:
+                lengths = np.fromiter(map(len, ref), dtype=np.int64, count=len(ref))
+                _BUCKETS[digest] = length_buckets(lengths)
+                if len(_BUCKETS) > MAX_CACHED_BUCKETS:
+                    _BUCKETS.popitem(last=False)
+            cached = (ref, _BUCKETS[digest])
+            self.testset.length_buckets = cached
+        return cached[1]
+
+    def mask(self) -> np.ndarray:
+        buckets = self.buckets()
+        return (buckets >= self.min_value) & (buckets < self.max_value)
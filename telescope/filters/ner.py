@@ -12,23 +12,162 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List
 
+import numpy as np
 import stanza
+from stanza.pipeline.core import DownloadMethod
+from stanza.resources.common import DEFAULT_MODEL_DIR, load_resources_json
 from telescope.filters.filter import Filter
+from telescope.metrics.cache import SegmentCache
+from telescope.metrics.progress import report_progress
 from telescope.testset import Testset
+from telescope.utils import telescope_cache_folder
 
 STANZA_NER_LANGS = ["ar", "zh", "nl", "en", "fr", "de", "ru", "uk"]
 
+if "NER_BATCH_SIZE" in os.environ:
+    BATCH_SIZE = int(os.environ["NER_BATCH_SIZE"])
+else:
+    BATCH_SIZE = 64
+
+if "NER_WORKERS" in os.environ:
+    WORKERS = int(os.environ["NER_WORKERS"])
+else:
+    WORKERS = 1
+
+if "NER_CACHE_SIZE" in os.environ:
+    NER_CACHE_SIZE = int(float(os.environ["NER_CACHE_SIZE"]) * 2 ** 20)
+else:
+    NER_CACHE_SIZE = 64 * 2 ** 20
+
+# Pipeline of a worker process, loaded once by `init_worker`.
+_ENGINE = None
+
+
+def load_pipeline(language: str) -> stanza.Pipeline:
+    """ Stanza NER pipeline. Models are only downloaded when they are not present. """
+    return stanza.Pipeline(
+        lang=language, processors="tokenize,ner", download_method=DownloadMethod.REUSE_RESOURCES
+    )
+
+
+def model_version(language: str, model_dir: str = DEFAULT_MODEL_DIR) -> str:
+    """
+    Version of the NER models Stanza loads for a language: name, size and modification
+    time of the files in their folder. Empty when the models are not downloaded yet.
+    """
+    if os.path.exists(os.path.join(model_dir, "resources.json")):
+        # Some languages (e.g. zh) are aliases of the folder their models are in.
+        language = load_resources_json(model_dir).get(language, {}).get("alias", language)
+    folder = os.path.join(model_dir, language, "ner")
+    if not os.path.isdir(folder):
+        return ""
+    files = []
+    for name in sorted(os.listdir(folder)):
+        info = os.stat(os.path.join(folder, name))
+        files.append(f"{name}:{info.st_size}:{info.st_mtime_ns}")
+    return ",".join(files)
+
+
+class EntityCache(SegmentCache):
+    """ Entity spans of segments, in a table of their own with its own size limit. """
+
+    def __init__(self, path: str, max_size: int = NER_CACHE_SIZE, timeout: float = 60.0):
+        super().__init__(path, max_size, timeout, table="entities")
+
+    @staticmethod
+    def entity_key(language: str, version: str, segment: str) -> str:
+        """ Hash of the language, the version of the NER models and a segment. """
+        return SegmentCache.key(language, version, segment)
+
+    def fetch_entities(
+        self,
+        language: str,
+        version: str,
+        segments: List[str],
+        compute: Callable[[List[str]], List[List[list]]],
+    ) -> List[List[list]]:
+        """
+        Entity spans of each segment. Only the segments that are not cached (once per
+        distinct segment) are passed to compute.
+
+        :param language: Language of the segments.
+        :param version: Version of the NER models (see `model_version`).
+        :param segments: Segments.
+        :param compute: Function that returns the entity spans of each segment.
+        """
+        keys = [self.entity_key(language, version, segment) for segment in segments]
+        return self.fetch_keys(keys, lambda ids: compute([segments[i] for i in ids]))
+
+
+_ENTITY_CACHE = None
+
+
+def entity_cache() -> EntityCache:
+    """ Cache of the entities found by the filter, or None when it is disabled. """
+    global _ENTITY_CACHE
+    if NER_CACHE_SIZE <= 0:
+        return None
+    if _ENTITY_CACHE is None:
+        _ENTITY_CACHE = EntityCache(telescope_cache_folder() + "named_entities.sqlite")
+    return _ENTITY_CACHE
+
+
+def entity_spans(engine: stanza.Pipeline, segments: List[str]) -> List[List[list]]:
+    """
+    Named entities of each segment as [start char, end char, type] spans, running the
+    pipeline on all the segments at once.
+    """
+    # Blank segments have no entities and are not sent to the pipeline.
+    texts = [i for i, segment in enumerate(segments) if segment.strip()]
+    docs = engine([stanza.Document([], text=segments[i]) for i in texts])
+    spans = [[] for _ in segments]
+    for i, doc in zip(texts, docs):
+        spans[i] = [[ent.start_char, ent.end_char, ent.type] for ent in doc.ents]
+    return spans
+
+
+def init_worker(language: str) -> None:
+    global _ENGINE
+    _ENGINE = load_pipeline(language)
+
+
+def worker_entity_spans(segments: List[str]) -> List[List[list]]:
+    return entity_spans(_ENGINE, segments)
+
 
 class NERFilter(Filter):
     name = "named-entities"
 
-    def __init__(self, testset: Testset, source_language: str, target_language:str, *args):
+    def __init__(
+        self,
+        testset: Testset,
+        source_language: str,
+        target_language: str,
+        *args,
+        batch_size: int = BATCH_SIZE,
+        workers: int = WORKERS,
+    ):
+        """
+        :param batch_size: Number of segments given to the Stanza pipeline at once.
+        :param workers: Number of processes running the pipeline. Each one loads it once.
+        """
         super().__init__(testset)
         self.set_language(source_language, target_language)
-        stanza.download(self.language)
-        self.engine = stanza.Pipeline(lang=self.language, processors="tokenize,ner")
+        self.batch_size = batch_size
+        self.workers = workers
+        self._engine = None
+
+    @property
+    def engine(self) -> stanza.Pipeline:
+        """ Pipeline of this process, only loaded when the filter runs serially. """
+        if self._engine is None:
+            self._engine = load_pipeline(self.language)
+        return self._engine
 
     def set_language(self, source_language: str, target_language:str) -> None:
         if source_language in STANZA_NER_LANGS:
@@ -42,11 +181,37 @@ class NERFilter(Filter):
                 "{} is not supperted by Stanza NER.".format(source_language + "-" + target_language)
             )
 
-    def apply_filter(self) -> List[int]:
-        segments_with_ne = []
-        for i, segment in enumerate(self.segments):
-            doc = self.engine(segment)
-            if doc.ents:
-                segments_with_ne.append(i)
+    def mask(self) -> np.ndarray:
+        segments = list(self.segments)
+        cache = entity_cache()
+        # Until the models are downloaded, their version is unknown and nothing is cached.
+        version = model_version(self.language) if cache is not None else ""
+        if version:
+            spans = cache.fetch_entities(self.language, version, segments, self.entities)
+        else:
+            spans = self.entities(segments)
+        return np.array([len(segment_spans) > 0 for segment_spans in spans], dtype=bool)
+
+    def entities(self, segments: List[str]) -> List[List[list]]:
+        """ Entity spans of each segment, computed by batches. """
+        batches = [
+            segments[i : i + self.batch_size] for i in range(0, len(segments), self.batch_size)
+        ]
+        if self.workers > 1 and len(batches) > 1:
+            # Spawned workers do not inherit the torch state of this process.
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(batches)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.language,),
+            ) as executor:
+                return self.collect(executor.map(worker_entity_spans, batches), len(segments))
+        return self.collect((entity_spans(self.engine, batch) for batch in batches), len(segments))
 
-        return segments_with_ne
+    def collect(self, batches_spans, total: int) -> List[List[list]]:
+        """ Spans of the batches, in order, reporting the progress after each batch. """
+        spans = []
+        for batch_spans in batches_spans:
+            spans.extend(batch_spans)
+            report_progress(self.name, len(spans), total)
+        return spans
@@ -18,7 +18,7 @@ from .precision import Precision
 from .recall import Recall
 from .f1_score import F1Score
 
-from .result import MetricResult, PairwiseResult, BootstrapResult
+from .result import MetricResult, PairwiseResult, BootstrapResult, AllPairsBootstrapResult
 
 
 AVAILABLE_METRICS = [
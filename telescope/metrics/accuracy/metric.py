@@ -1,27 +1,18 @@
 from typing import List
 
-from telescope.metrics.metric import Metric
+from telescope.metrics.classification import ClassificationMetric, ConfusionMatrix
 from telescope.metrics.result import MetricResult
 
-from sklearn.metrics import accuracy_score, multilabel_confusion_matrix
 
-
-class Accuracy(Metric):
+class Accuracy(ClassificationMetric):
 
     name = "Accuracy"
     segment_level = True
 
-    def score(self, src: List[str], cand: List[str], ref: List[str]) -> MetricResult:
-        score = accuracy_score(ref, cand)
-        labels = self.labels
-        number_of_labels = len(labels)
-        label_scores = []
-
-        matrix = multilabel_confusion_matrix(ref, cand, labels=labels)
-
-        for i in range(number_of_labels):
-            tn,fp,fn,tp = list(list(matrix[i][0]) + list(matrix[i][1]))
-            label_scores.append((tp+tn)/(tn+fp+fn+tp))
-
+    def result_from_matrix(
+        self, src: List[str], cand: List[str], ref: List[str], matrix: ConfusionMatrix
+    ) -> MetricResult:
+        score = matrix.accuracy()
+        label_scores = [matrix.label_accuracy(label) for label in self.labels]
 
         return MetricResult(score,label_scores, src, cand, ref, self.name)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+BERTScore embedding cache
+==============
+BERTScore compares the contextual embeddings of candidates and references. When
+several systems are scored against the same references, every reference sentence
+would be encoded once per system (and once per reference file for candidates).
+Encoded sentences are kept in a bounded in-memory LRU cache per model and layer.
+
+Set BERTSCORE_EMBEDDING_CACHE to the memory budget in megabytes (default 1024).
+When BERTSCORE_EMBEDDING_SPILL points to a directory, embeddings evicted from
+memory are appended to a memory-mapped file in that directory instead of being
+dropped.
+"""
+import os
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import torch
+
+if "BERTSCORE_EMBEDDING_CACHE" in os.environ:
+    CACHE_SIZE = int(float(os.environ["BERTSCORE_EMBEDDING_CACHE"]) * 2 ** 20)
+else:
+    CACHE_SIZE = 1024 * 2 ** 20
+
+if "BERTSCORE_EMBEDDING_SPILL" in os.environ:
+    SPILL_DIR = os.environ["BERTSCORE_EMBEDDING_SPILL"]
+else:
+    SPILL_DIR = None
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = CACHE_SIZE, spill_dir: str = SPILL_DIR):
+        """
+        :param max_size: Maximum size (in bytes) of the embeddings kept in memory.
+        :param spill_dir: Directory of the memory-mapped file that receives the
+            embeddings evicted from memory. If None they are dropped.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._memory = OrderedDict()
+        self._spill_file = None
+        self._spill_index = {}
+        self._spill_elements = 0
+        self._spill_map = None
+        if spill_dir is not None:
+            self._spill_file = tempfile.NamedTemporaryFile(dir=spill_dir, suffix=".embeddings")
+
+    @staticmethod
+    def nbytes(emb: torch.Tensor, idf: torch.Tensor) -> int:
+        return emb.element_size() * emb.nelement() + idf.element_size() * idf.nelement()
+
+    def __contains__(self, sentence: str) -> bool:
+        return sentence in self._memory or sentence in self._spill_index
+
+    def __len__(self) -> int:
+        return len(self._memory.keys() | self._spill_index.keys())
+
+    def get(self, sentence: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        """ (embeddings, idf weights) of the tokens of a sentence or None. """
+        if sentence in self._memory:
+            self._memory.move_to_end(sentence)
+            return self._memory[sentence]
+        if sentence in self._spill_index:
+            emb, idf = self._read_spilled(sentence)
+            self.put(sentence, emb, idf)
+            return emb, idf
+        return None
+
+    def put(self, sentence: str, emb: torch.Tensor, idf: torch.Tensor) -> None:
+        if sentence in self._memory:
+            return
+        self._memory[sentence] = (emb, idf)
+        self.size += self.nbytes(emb, idf)
+        while self.size > self.max_size and len(self._memory) > 1:
+            evicted, (evicted_emb, evicted_idf) = self._memory.popitem(last=False)
+            self.size -= self.nbytes(evicted_emb, evicted_idf)
+            if self._spill_file is not None and evicted not in self._spill_index:
+                self._spill(evicted, evicted_emb, evicted_idf)
+
+    def _spill(self, sentence: str, emb: torch.Tensor, idf: torch.Tensor) -> None:
+        rows = torch.cat([emb.float(), idf.float().unsqueeze(-1)], dim=-1).numpy()
+        self._spill_file.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+        self._spill_file.flush()
+        self._spill_index[sentence] = (self._spill_elements, rows.shape)
+        self._spill_elements += rows.size
+
+    def _read_spilled(self, sentence: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self._spill_map is None or self._spill_map.size < self._spill_elements:
+            self._spill_map = np.memmap(self._spill_file.name, dtype=np.float32, mode="r")
+        offset, shape = self._spill_index[sentence]
+        rows = np.array(self._spill_map[offset : offset + shape[0] * shape[1]]).reshape(shape)
+        rows = torch.from_numpy(rows)
+        return rows[:, :-1], rows[:, -1]
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self.size = 0
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(model_type: str, num_layers: int) -> EmbeddingCache:
+    """ Embedding cache shared by every BERTScore instance using the same model and layer. """
+    return EmbeddingCache()
@@ -12,35 +12,133 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Tuple
 
 import bert_score
+import torch
+from bert_score.utils import get_bert_embedding, greedy_cos_idf, sent_encode
+from telescope.metrics.bertscore.embeddings import get_embedding_cache
 from telescope.metrics.bertscore.result import BERTScoreResult
-from telescope.metrics.metric import Metric
+from telescope.metrics.metric import IndependentSegments, Metric
+from telescope.metrics.progress import report_progress
+from telescope.metrics.utils import length_batches
 
+if "BERTSCORE_BATCH_SIZE" in os.environ:
+    BATCH_SIZE = int(os.environ["BERTSCORE_BATCH_SIZE"])
+else:
+    BATCH_SIZE = 64
 
-class BERTScore(Metric):
+# Memory budget of a batch, in padded tokens.
+if "BERTSCORE_MAX_TOKENS" in os.environ:
+    MAX_TOKENS = int(os.environ["BERTSCORE_MAX_TOKENS"])
+else:
+    MAX_TOKENS = 8192
+
+
+@lru_cache(maxsize=2)
+def get_scorer(language: str) -> bert_score.BERTScorer:
+    """ BERTScorer of a language, loaded once per process. """
+    return bert_score.BERTScorer(lang=language, idf=False, rescale_with_baseline=False)
+
+
+class BERTScore(IndependentSegments, Metric):
 
     name = "BERTScore"
     segment_level = True
 
+    def __init__(self, language: str = "X", batch_size: int = None, max_tokens: int = None, **kwargs):
+        """
+        :param language: Language of the evaluated text.
+        :param batch_size: Maximum number of segments per batch (BERTSCORE_BATCH_SIZE by default).
+        :param max_tokens: Maximum number of padded tokens per batch (BERTSCORE_MAX_TOKENS by default).
+        """
+        super().__init__(language)
+        self.batch_size = BATCH_SIZE if batch_size is None else batch_size
+        self.max_tokens = MAX_TOKENS if max_tokens is None else max_tokens
+
+    @property
+    def model_id(self) -> str:
+        model = bert_score.utils.lang2model.get(self.language.lower(), self.language)
+        return f"{model}@bert_score-{bert_score.__version__}"
+
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> BERTScoreResult:
-        precision, recall, f1 = bert_score.score(
-            cands=cand,
-            refs=ref,
-            idf=False,
-            batch_size=3,
-            lang=self.language,
-            rescale_with_baseline=False,
-            verbose=True,
+        return self.result_from_segments(
+            src, cand, ref, self.cached_segments(src, cand, ref, self.segment_values)
         )
+
+    def result_from_segments(
+        self, src: List[str], cand: List[str], ref: List[str], values: List[List[float]]
+    ) -> BERTScoreResult:
+        precision, recall, f1 = map(list, zip(*values))
         return BERTScoreResult(
-            sum(f1.tolist()) / len(f1.tolist()),
-            f1.tolist(),
+            sum(f1) / len(f1),
+            f1,
             src,
             cand,
             ref,
             self.name,
-            precision.tolist(),
-            recall.tolist(),
+            precision,
+            recall,
+            values,
         )
+
+    def segment_values(self, src: List[str], cand: List[str], ref: List[str]) -> List[List[float]]:
+        """
+        [precision, recall, f1] of each segment. Every distinct sentence is encoded
+        once and its embeddings are kept in the embedding cache of the model, so
+        references shared by several systems are not encoded again. Sentences and
+        segments are processed in length-sorted batches whose size adapts to the
+        longest item so that every batch fits in max_tokens.
+        """
+        scorer = get_scorer(self.language)
+        cache = get_embedding_cache(scorer.model_type, scorer.num_layers)
+        tokenizer = scorer._tokenizer
+        idf_dict = defaultdict(lambda: 1.0)
+        idf_dict[tokenizer.sep_token_id] = 0
+        idf_dict[tokenizer.cls_token_id] = 0
+
+        embeddings = {sentence: cache.get(sentence) for sentence in dict.fromkeys(list(cand) + list(ref))}
+        missing = [sentence for sentence, stats in embeddings.items() if stats is None]
+        total = len(missing) + len(cand)
+        done = 0
+
+        lengths = [len(sent_encode(tokenizer, sentence)) for sentence in missing]
+        for batch in length_batches(lengths, self.batch_size, self.max_tokens):
+            sentences = [missing[i] for i in batch]
+            embs, masks, padded_idf = get_bert_embedding(
+                sentences, scorer._model, tokenizer, idf_dict, device=scorer.device
+            )
+            embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu()
+            for i, sentence in enumerate(sentences):
+                sequence_len = masks[i].sum().item()
+                embeddings[sentence] = (embs[i, :sequence_len], padded_idf[i, :sequence_len])
+                cache.put(sentence, *embeddings[sentence])
+            done += len(batch)
+            report_progress(self.name, done, total)
+
+        values = [None] * len(cand)
+        lengths = [max(len(embeddings[c][0]), len(embeddings[r][0])) for c, r in zip(cand, ref)]
+        with torch.no_grad():
+            for batch in length_batches(lengths, self.batch_size, self.max_tokens):
+                ref_stats = self.pad_stats([embeddings[ref[i]] for i in batch], scorer.device)
+                hyp_stats = self.pad_stats([embeddings[cand[i]] for i in batch], scorer.device)
+                precision, recall, f1 = greedy_cos_idf(*ref_stats, *hyp_stats)
+                for i, scores in zip(batch, zip(precision.tolist(), recall.tolist(), f1.tolist())):
+                    values[i] = list(scores)
+                done += len(batch)
+                report_progress(self.name, done, total)
+        return values
+
+    @staticmethod
+    def pad_stats(stats: List[Tuple[torch.Tensor, torch.Tensor]], device) -> tuple:
+        """ Padded embeddings, mask and idf weights of a batch of sentences (as in bert_score). """
+        embs = [emb.to(device) for emb, _ in stats]
+        idfs = [idf.to(device) for _, idf in stats]
+        lengths = torch.tensor([emb.size(0) for emb in embs], dtype=torch.long)
+        emb_pad = torch.nn.utils.rnn.pad_sequence(embs, batch_first=True, padding_value=2.0)
+        idf_pad = torch.nn.utils.rnn.pad_sequence(idfs, batch_first=True)
+        mask = torch.arange(int(lengths.max())).expand(len(lengths), -1) < lengths.unsqueeze(1)
+        return emb_pad, mask.to(device), idf_pad
@@ -28,8 +28,9 @@ class BERTScoreResult(MetricResult):
         metric: str,
         precision: List[float],
         recall: List[float],
+        values: list = None,
     ) -> None:
-        super().__init__(sys_score, seg_scores, src, cand, ref, metric)
+        super().__init__(sys_score, seg_scores, src, cand, ref, metric, values)
         self.precision = precision
         self.recall = recall
         self.f1 = seg_scores
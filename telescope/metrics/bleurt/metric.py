@@ -15,14 +15,14 @@
 import os
 
 from telescope.metrics.bleurt.result import BLEURTResult
-from telescope.metrics.metric import Metric
+from telescope.metrics.metric import IndependentSegments, Metric
 from telescope.utils import telescope_cache_folder
 from torchnlp.download import download_file_maybe_extract
 
 from bleurt import score
 
 
-class BLEURT(Metric):
+class BLEURT(IndependentSegments, Metric):
 
     name = "BLEURT"
     segment_level = True
@@ -60,8 +60,19 @@ class BLEURT(Metric):
     def language_support(self, language):
         return language == "en"
 
+    @property
+    def model_id(self) -> str:
+        return self.model
+
     def score(self, src, cand, ref):
-        scores = self.scorer.score(references=ref, candidates=cand)
+        return self.result_from_segments(
+            src, cand, ref, self.cached_segments(src, cand, ref, self.segment_values)
+        )
+
+    def result_from_segments(self, src, cand, ref, values):
         return BLEURTResult(
-            sum(scores) / len(scores), scores, src, cand, ref, self.name, self.model
+            sum(values) / len(values), values, src, cand, ref, self.name, self.model, values
         )
+
+    def segment_values(self, src, cand, ref):
+        return self.scorer.score(references=ref, candidates=cand)
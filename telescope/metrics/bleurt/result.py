@@ -27,8 +27,9 @@ class BLEURTResult(MetricResult):
         ref: List[str],
         metric: str,
         model: str,
+        values: list = None,
     ) -> None:
-        super().__init__(sys_score, seg_scores, src, cand, ref, metric)
+        super().__init__(sys_score, seg_scores, src, cand, ref, metric, values)
         self.model = model
 
     def __str__(self):
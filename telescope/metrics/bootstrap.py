@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Vectorized bootstrap resampling
+==============
+All the resampled ids of a bootstrap run form a (num_samples, sample_size) integer
+matrix. Instead of building python lists for every partition, the matrix is drawn
+in chunks of rows (in parallel when workers > 1) and each chunk is turned into a
+(rows, n) matrix of counts, i.e. how many times each segment was picked in each
+partition. Resampled means are then a single matrix product between the counts and
+the segment scores. Chunks hold a fixed range of partitions whatever the number
+of workers, so the floating point sums of a partition never depend on it.
+
+Corpus-level metrics (BLEU, chrF, TER, ...) are resampled the same way through
+their per-segment sufficient statistics: the counts matrix sums the statistics
+of each partition and the metric recomputes its score from those sums.
+"""
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, NamedTuple, Union
+
+import numpy as np
+
+if "TELESCOPE_BOOTSTRAP_CHUNK" in os.environ:
+    MAX_CHUNK_ELEMENTS = int(os.environ["TELESCOPE_BOOTSTRAP_CHUNK"])
+else:
+    MAX_CHUNK_ELEMENTS = 2 ** 24
+
+# Maximum number of partitions of a chunk, small enough to spread the chunks of a
+# run over the workers.
+MAX_CHUNK_ROWS = 64
+
+
+class SharedPool(NamedTuple):
+    """ Process pool shared by several bootstrap runs, and its number of processes. """
+
+    executor: Executor
+    workers: int
+
+
+Workers = Union[int, SharedPool]
+
+
+def new_seed() -> int:
+    """ Seed of a bootstrap run drawn from the numpy global random state. """
+    return int(np.random.randint(0, 2 ** 31 - 1))
+
+
+def chunk_rows(n: int, sample_size: int, max_elements: int = MAX_CHUNK_ELEMENTS) -> int:
+    """ Number of partitions that can be processed at once without exceeding max_elements. """
+    return max(1, min(MAX_CHUNK_ROWS, max_elements // max(n, sample_size, 1)))
+
+
+def partition_ids(n: int, sample_size: int, seed: int, start: int, stop: int) -> np.ndarray:
+    """
+    Resampled ids (with replacement) of the partitions start to stop. Every partition
+    has its own random stream derived from (seed, partition number), so a partition
+    is the same no matter how the partitions are chunked or spread across workers.
+
+    :return: (stop - start, sample_size) integer matrix.
+    """
+    return np.array(
+        [
+            np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(row,))).integers(
+                0, n, size=sample_size
+            )
+            for row in range(start, stop)
+        ],
+        dtype=np.int64,
+    ).reshape(stop - start, sample_size)
+
+
+def sample_counts(indices: np.ndarray, n: int) -> np.ndarray:
+    """ Converts a (rows, sample_size) matrix of ids into a (rows, n) matrix of counts. """
+    rows = indices.shape[0]
+    offsets = (np.arange(rows, dtype=np.int64) * n)[:, None]
+    counts = np.bincount((indices + offsets).ravel(), minlength=rows * n)
+    return counts.reshape(rows, n)
+
+
+def _map_block(
+    function: Callable, n: int, sample_size: int, seed: int, max_elements: int, block: range
+) -> list:
+    rows = chunk_rows(n, sample_size, max_elements)
+    return [
+        function(partition_ids(n, sample_size, seed, start, min(start + rows, block.stop)))
+        for start in range(block.start, block.stop, rows)
+    ]
+
+
+def map_partitions(
+    function: Callable,
+    n: int,
+    num_samples: int,
+    sample_size: int,
+    seed: int = None,
+    workers: Workers = 1,
+    max_elements: int = MAX_CHUNK_ELEMENTS,
+) -> list:
+    """
+    Applies a function to the resampled ids of all partitions, in chunks of rows.
+    With more than one worker the chunks are split into contiguous blocks that run
+    in a process pool (the function must be picklable): a pool of its own, or the
+    pool shared with other bootstrap runs (see `run_bootstraps`). The chunks are
+    the same for any number of workers.
+
+    :param function: Function that receives a (rows, sample_size) matrix of ids.
+    :param n: Size of the testset.
+    :param num_samples: Number of testset splits.
+    :param sample_size: Number of segments in each split.
+    :param seed: Seed of the bootstrap run. If None it is drawn with `new_seed`.
+    :param workers: Number of processes or shared process pool.
+    :param max_elements: Maximum number of elements kept in memory per chunk.
+    :return: List with the outputs of the function for each chunk, in order.
+    """
+    seed = new_seed() if seed is None else seed
+    run_block = partial(_map_block, function, n, sample_size, seed, max_elements)
+    executor = None
+    if isinstance(workers, SharedPool):
+        executor, workers = workers
+    rows = chunk_rows(n, sample_size, max_elements)
+    chunks = -(-num_samples // rows)
+    if workers <= 1 or chunks <= 1:
+        return run_block(range(num_samples))
+
+    # Blocks start on chunk boundaries.
+    bounds = np.linspace(0, chunks, min(workers, chunks) + 1).astype(int) * rows
+    blocks = [range(start, min(stop, num_samples)) for start, stop in zip(bounds[:-1], bounds[1:])]
+    if executor is not None:
+        futures = [executor.submit(run_block, block) for block in blocks]
+        return [output for future in futures for output in future.result()]
+    with ProcessPoolExecutor(max_workers=len(blocks)) as executor:
+        return [output for outputs in executor.map(run_block, blocks) for output in outputs]
+
+
+def _counts_product(stats: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    return sample_counts(indices, stats.shape[0]) @ stats
+
+
+def resample_sums(
+    stats: np.ndarray,
+    num_samples: int,
+    sample_size: int,
+    seed: int = None,
+    workers: Workers = 1,
+    max_elements: int = MAX_CHUNK_ELEMENTS,
+) -> np.ndarray:
+    """
+    Sums the rows of a (n, k) matrix of per-segment statistics for every partition.
+
+    :param stats: (n, k) matrix with the statistics of each segment.
+    :param num_samples: Number of testset splits.
+    :param sample_size: Number of segments in each split.
+    :param seed: Seed of the bootstrap run. If None it is drawn with `new_seed`.
+    :param workers: Number of processes or shared process pool.
+    :param max_elements: Maximum number of elements kept in memory per chunk.
+    :return: (num_samples, k) matrix with the summed statistics of each partition.
+    """
+    stats = np.asarray(stats)
+    chunks = map_partitions(
+        partial(_counts_product, stats),
+        stats.shape[0],
+        num_samples,
+        sample_size,
+        seed,
+        workers,
+        max_elements,
+    )
+    return np.concatenate(chunks, axis=0)
+
+
+def resample_means(
+    seg_scores: List[np.ndarray],
+    num_samples: int,
+    sample_size: int,
+    seed: int = None,
+    workers: Workers = 1,
+    max_elements: int = MAX_CHUNK_ELEMENTS,
+) -> np.ndarray:
+    """
+    Computes the resampled mean of several aligned segment-level score lists. All
+    lists are resampled with the same ids.
+
+    :param seg_scores: List with the segment scores of each system.
+    :param num_samples: Number of testset splits.
+    :param sample_size: Number of segments in each split.
+    :param seed: Seed of the bootstrap run. If None it is drawn with `new_seed`.
+    :param workers: Number of processes or shared process pool.
+    :param max_elements: Maximum number of elements kept in memory per chunk.
+    :return: (num_samples, len(seg_scores)) matrix with the resampled means.
+    """
+    scores = np.column_stack([np.asarray(s, dtype=np.float64) for s in seg_scores])
+    return resample_sums(scores, num_samples, sample_size, seed, workers, max_elements) / sample_size
+
+
+def run_bootstraps(bootstraps: List[Callable], workers: int = 1) -> list:
+    """
+    Runs several bootstrap calls (e.g. one per metric) that accept a `workers` keyword.
+    With more than one call and worker, the calls run side by side and submit blocks
+    of their partitions to a single pool of `workers` processes, so the partitions of
+    all calls keep every process busy. Every call should carry its own seed so
+    results do not depend on the number of workers.
+
+    :param bootstraps: Callables (e.g. functools.partial) returning a BootstrapResult.
+    :param workers: Number of processes.
+    :return: List with the BootstrapResult of each call, in order.
+    """
+    if workers > 1 and len(bootstraps) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pool = SharedPool(executor, workers)
+            # Threads only submit partitions and combine their results.
+            with ThreadPoolExecutor(max_workers=len(bootstraps)) as threads:
+                futures = [threads.submit(bootstrap, workers=pool) for bootstrap in bootstraps]
+                return [future.result() for future in futures]
+    return [bootstrap(workers=workers) for bootstrap in bootstraps]
+
+
+def count_wins(x_scores: np.ndarray, y_scores: np.ndarray, higher_is_better: bool = True) -> List[int]:
+    """
+    Returns [x wins, y wins, ties] over all partitions. A system wins a partition
+    with a higher score, or with a lower one if higher_is_better is False.
+    """
+    x_scores, y_scores = np.asarray(x_scores), np.asarray(y_scores)
+    if not higher_is_better:
+        x_scores, y_scores = -x_scores, -y_scores
+    return [
+        int(np.count_nonzero(x_scores > y_scores)),
+        int(np.count_nonzero(y_scores > x_scores)),
+        int(np.count_nonzero(x_scores == y_scores)),
+    ]
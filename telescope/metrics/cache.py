@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Segment score cache
+==============
+Scores of model-based metrics (COMET, BERTScore, ...) are stored on disk, in a
+sqlite database under the telescope cache folder, so that the same segments are
+never sent to a model twice. Each entry is keyed by a hash of the metric, its
+model, the language and the (src, cand, ref) triplet of the segment.
+
+The database is shared by every process (WAL journal, busy timeout) and its size
+is bounded: once it grows over TELESCOPE_CACHE_SIZE megabytes, the least recently
+used entries are evicted. Setting TELESCOPE_CACHE_SIZE to 0 disables the cache.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Tuple
+
+from telescope.utils import telescope_cache_folder
+
+if "TELESCOPE_CACHE_SIZE" in os.environ:
+    CACHE_SIZE = int(float(os.environ["TELESCOPE_CACHE_SIZE"]) * 2 ** 20)
+else:
+    CACHE_SIZE = 512 * 2 ** 20
+
+# Maximum number of sqlite host parameters used in a single query.
+QUERY_CHUNK = 500
+
+
+class SegmentCache:
+    def __init__(
+        self,
+        path: str,
+        max_size: int = CACHE_SIZE,
+        timeout: float = 60.0,
+        table: str = "segments",
+    ):
+        """
+        :param path: Path of the sqlite database.
+        :param max_size: Maximum size (in bytes) of the cached entries.
+        :param timeout: Seconds a process waits for a lock held by another process.
+        :param table: Table of the entries. Each table has its own max_size.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # sqlite connections must not be shared with forked processes.
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_access "
+                f"ON {self.table} (last_access)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def key(*fields) -> str:
+        """ Hash of the given fields. """
+        return hashlib.blake2b("\x1f".join(map(str, fields)).encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def segment_key(namespace: Tuple[str, ...], src: str, cand: str, ref: str) -> str:
+        """ Hash of the metric namespace (name, model, language) and a segment. """
+        return SegmentCache.key(*namespace, src, cand, ref)
+
+    def get_many(self, keys: List[str]) -> dict:
+        """ Cached values of the given keys. Missing keys are not returned. """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start : start + QUERY_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", chunk
+            ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+            if rows:
+                self.connection.execute(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key IN ({marks})", [now, *chunk]
+                )
+        return found
+
+    def put_many(self, values: Dict[str, object]) -> None:
+        """ Stores the values and evicts the least recently used entries if needed. """
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            value = json.dumps(value)
+            rows.append((key, value, len(key) + len(value), now))
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        self.evict()
+
+    def evict(self) -> None:
+        """ Removes the least recently used entries until the cache fits max_size. """
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            total = self.connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()[0]
+            if total > self.max_size:
+                self.connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                    "(SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS total "
+                    f"FROM {self.table}) WHERE total > ?)",
+                    (self.max_size,),
+                )
+
+    def fetch(
+        self,
+        namespace: Tuple[str, ...],
+        src: List[str],
+        cand: List[str],
+        ref: List[str],
+        compute: Callable[[List[str], List[str], List[str]], list],
+    ) -> list:
+        """
+        Per-segment values of a metric. Only the segments that are not cached (once
+        per distinct segment) are passed to compute and the result is merged with
+        the cached values.
+
+        :param namespace: Metric name, model and language.
+        :param src: Sources (metrics that do not use them can pass any list).
+        :param cand: Candidates.
+        :param ref: References.
+        :param compute: Function that returns one JSON serializable value per segment.
+        :return: List with the value of each segment.
+        """
+        aligned = len(src) == len(cand)
+        sources = src if aligned else [""] * len(cand)
+        keys = [self.segment_key(namespace, s, c, r) for s, c, r in zip(sources, cand, ref)]
+        return self.fetch_keys(
+            keys,
+            lambda ids: compute(
+                [src[i] for i in ids] if aligned else src,
+                [cand[i] for i in ids],
+                [ref[i] for i in ids],
+            ),
+        )
+
+    def fetch_keys(self, keys: List[str], compute: Callable[[List[int]], list]) -> list:
+        """
+        Values of the given keys. The values that are not cached are computed once
+        per distinct key and stored.
+
+        :param keys: Key of each value.
+        :param compute: Function that returns one JSON serializable value for each of
+            the given positions of keys.
+        :return: List with the value of each key.
+        """
+        values = self.get_many(keys)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in values:
+                missing.setdefault(key, i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_values = compute(list(missing.values()))
+            new_values = dict(zip(missing.keys(), new_values))
+            self.put_many(new_values)
+            values.update(new_values)
+
+        return [values[key] for key in keys]
+
+    def stats(self) -> dict:
+        """ Hit/miss counters of this process and the size of the cache. """
+        entries, size = self.connection.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size": size}
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+
+
+_SEGMENT_CACHE = None
+
+
+def segment_cache() -> SegmentCache:
+    """ Segment cache shared by all metrics, or None when the cache is disabled. """
+    global _SEGMENT_CACHE
+    if CACHE_SIZE <= 0:
+        return None
+    if _SEGMENT_CACHE is None:
+        _SEGMENT_CACHE = SegmentCache(telescope_cache_folder() + "segment_scores.sqlite")
+    return _SEGMENT_CACHE
@@ -14,16 +14,31 @@
 # limitations under the License.
 from typing import List
 
-import sacrebleu
+import numpy as np
+from sacrebleu.metrics import CHRF
 from telescope.metrics.chrf.result import chrFResult
-from telescope.metrics.metric import Metric
+from telescope.metrics.metric import Metric, SufficientStatistics
 
 
-class chrF(Metric):
+class chrF(SufficientStatistics, Metric):
 
     name = "chrF"
-    segment_level = False
+    segment_level = True
 
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> chrFResult:
-        chrf = sacrebleu.corpus_chrf(cand, [ref])
-        return chrFResult(chrf.score/100, [], src, cand, ref, self.name)
+        return self.result_from_statistics(src, cand, ref, self.segment_statistics(src, cand, ref))
+
+    def result_from_statistics(
+        self, src: List[str], cand: List[str], ref: List[str], stats: np.ndarray
+    ) -> chrFResult:
+        chrf = CHRF()
+        seg_scores = [chrf._compute_score_from_stats(row).score / 100 for row in stats.tolist()]
+        sys_score = self.score_from_statistics(stats.sum(axis=0))
+        return chrFResult(sys_score, seg_scores, src, cand, ref, self.name, stats)
+
+    def segment_statistics(self, src: List[str], cand: List[str], ref: List[str]) -> np.ndarray:
+        """ Character n-gram matches and hypothesis/reference totals of each segment. """
+        return np.array(CHRF()._extract_corpus_statistics(cand, [ref]), dtype=np.int32)
+
+    def score_from_statistics(self, stats: np.ndarray) -> float:
+        return CHRF()._compute_score_from_stats(stats.tolist()).score / 100
@@ -12,9 +12,28 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from typing import List
+
+import numpy as np
 from telescope.metrics.result import MetricResult
 
 
 class chrFResult(MetricResult):
+    def __init__(
+        self,
+        sys_score: float,
+        seg_scores: List[float],
+        src: List[str],
+        cand: List[str],
+        ref: List[str],
+        metric: str,
+        stats: np.ndarray = None,
+    ) -> None:
+        """
+        :param stats: (segments, statistics) matrix with the character and word n-gram
+            counts of each segment.
+        """
+        super().__init__(sys_score, seg_scores, src, cand, ref, metric)
+        self.stats = stats
     def __str__(self):
         return f"{self.metric}({self.sys_score}, Beta = 2, ngram_order = 6)"
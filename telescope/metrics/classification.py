@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Classification scoring core
+==============
+Labels are encoded to integer codes once and every classification metric of a
+system (accuracy, macro precision/recall/f1, per-label scores and confusion plots)
+is derived from a single confusion matrix built with `np.bincount`. Label columns
+of classification testsets are already encoded and are counted directly, so a
+matrix costs one pass over the codes; lists of strings are encoded first.
+The matrix of a system is built once per evaluation run and shared by every
+classification metric (`shared_confusion_matrix`), which derives its result
+from it (`ClassificationMetric.result_from_matrix`). Macro-averaged
+metrics also have per-segment label statistics (`MacroAveragedMetric`).
+"""
+import abc
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+from telescope.metrics.metric import Metric, SufficientStatistics
+from telescope.metrics.result import MetricResult
+from telescope.metrics.tokenization import register_run_cache
+from telescope.testset import LabelColumn, column_digest, label_columns
+
+# Matrices of the last systems of a run, by digest of their columns and labels.
+MAX_SHARED_MATRICES = 32
+_SHARED_MATRICES = OrderedDict()
+_SHARED_MATRICES_LOCK = threading.Lock()
+register_run_cache(_SHARED_MATRICES)
+
+
+def encode_labels(
+    ref: List[str], cand: List[str], labels: List[str] = ()
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Integer codes of the true and predicted labels. Label columns that share a
+    vocabulary are used as they are.
+
+    :param labels: Labels that are part of the vocabulary, even when unseen.
+    :return: Vocabulary (the given labels followed by the other labels found in
+        ref or cand, sorted), codes of ref and codes of cand.
+    """
+    if not (
+        isinstance(ref, LabelColumn)
+        and isinstance(cand, LabelColumn)
+        and ref.vocabulary == cand.vocabulary
+    ):
+        ref, cand = label_columns([ref, cand], labels)
+    known = set(ref.vocabulary)
+    vocabulary = ref.vocabulary + [label for label in labels if label not in known]
+    return vocabulary, ref.codes, cand.codes
+
+
+class ConfusionMatrix:
+    def __init__(self, matrix: np.ndarray, labels: List[str]):
+        """
+        :param matrix: (L, L) matrix with the number of segments of each true label
+            (rows) predicted as each label (columns).
+        :param labels: Label of each row and column.
+        """
+        self.matrix = matrix
+        self.labels = labels
+        self.index = {label: i for i, label in enumerate(labels)}
+
+    @classmethod
+    def from_codes(cls, true: np.ndarray, pred: np.ndarray, labels: List[str]) -> "ConfusionMatrix":
+        num_labels = len(labels)
+        codes = true.astype(np.int64) * num_labels + pred
+        matrix = np.bincount(codes, minlength=num_labels * num_labels)
+        matrix = matrix.reshape(num_labels, num_labels)
+        matrix.setflags(write=False)
+        return cls(matrix, labels)
+
+    @property
+    def total(self) -> int:
+        return int(self.matrix.sum())
+
+    def accuracy(self) -> float:
+        """ Fraction of segments whose predicted label is the true label. """
+        return float(np.trace(self.matrix) / self.total) if self.total else 0.0
+
+    def statistics(self) -> np.ndarray:
+        """ Number of true labels, predicted labels and true positives of each label. """
+        true_positives = np.diag(self.matrix)
+        return np.concatenate([self.matrix.sum(axis=1), self.matrix.sum(axis=0), true_positives])
+
+    def macro_average(self, score: str) -> float:
+        """ Macro-averaged precision, recall or f1 (see `macro_average`). """
+        return macro_average(self.statistics(), score)
+
+    def label_matrix(self, label: str) -> np.ndarray:
+        """
+        One-vs-rest matrix of a label, as sklearn's `multilabel_confusion_matrix`:
+        [[tn, fp], [fn, tp]].
+        """
+        i = self.index[label]
+        tp = self.matrix[i, i]
+        fn = self.matrix[i].sum() - tp
+        fp = self.matrix[:, i].sum() - tp
+        return np.array([[self.total - tp - fn - fp, fp], [fn, tp]])
+
+    def label_accuracy(self, label: str) -> float:
+        """ Accuracy of the one-vs-rest classification of a label. """
+        (tn, _), (_, tp) = self.label_matrix(label)
+        return float((tn + tp) / self.total) if self.total else 0.0
+
+    def reindexed(self, labels: List[str]) -> np.ndarray:
+        """ Confusion matrix restricted to (and ordered as) the given labels. """
+        index = [self.index[label] for label in labels]
+        return self.matrix[np.ix_(index, index)]
+
+
+def confusion_matrix(ref: List[str], cand: List[str], labels: List[str] = ()) -> ConfusionMatrix:
+    """
+    Confusion matrix of a system.
+
+    :param labels: Labels that are always part of the matrix, even when unseen.
+    """
+    vocabulary, true, pred = encode_labels(ref, cand, labels)
+    return ConfusionMatrix.from_codes(true, pred, vocabulary)
+
+
+def shared_confusion_matrix(
+    ref: List[str], cand: List[str], labels: List[str] = ()
+) -> ConfusionMatrix:
+    """
+    Confusion matrix of a system, built once per (ref, cand, labels) and shared by
+    the classification metrics until the end of the run. Matrices are read-only.
+    """
+    key = (column_digest(ref), column_digest(cand), tuple(labels))
+    with _SHARED_MATRICES_LOCK:
+        if key in _SHARED_MATRICES:
+            _SHARED_MATRICES.move_to_end(key)
+            return _SHARED_MATRICES[key]
+    matrix = confusion_matrix(ref, cand, labels)
+    with _SHARED_MATRICES_LOCK:
+        _SHARED_MATRICES[key] = matrix
+        if len(_SHARED_MATRICES) > MAX_SHARED_MATRICES:
+            _SHARED_MATRICES.popitem(last=False)
+    return matrix
+
+
+class ClassificationMetric(Metric):
+    """ Metric derived from the confusion matrix of a system. """
+
+    def score(self, src: List[str], cand: List[str], ref: List[str]) -> MetricResult:
+        return self.result_from_matrix(
+            src, cand, ref, shared_confusion_matrix(ref, cand, self.labels)
+        )
+
+    @abc.abstractmethod
+    def result_from_matrix(
+        self, src: List[str], cand: List[str], ref: List[str], matrix: ConfusionMatrix
+    ) -> MetricResult:
+        """ MetricResult of a system from its confusion matrix (see `confusion_matrix`). """
+        pass
+
+
+def label_statistics(ref: List[str], cand: List[str]) -> np.ndarray:
+    """
+    Per-segment confusion counts for every label found in ref or cand.
+
+    :return: (n, 3 * L) matrix with the one-hot true labels, the one-hot predicted
+        labels and the one-hot true positives of each segment.
+    """
+    labels, true, pred = encode_labels(ref, cand)
+    codes = np.stack([true, pred]).astype(np.int64)
+    n, num_labels = codes.shape[1], len(labels)
+    stats = np.zeros((n, 3 * num_labels), dtype=np.int64)
+    rows = np.arange(n)
+    stats[rows, codes[0]] = 1
+    stats[rows, num_labels + codes[1]] = 1
+    correct = codes[0] == codes[1]
+    stats[rows[correct], 2 * num_labels + codes[0][correct]] = 1
+    return stats
+
+
+def macro_average(stats: np.ndarray, score: str) -> float:
+    """
+    Macro-averaged precision, recall or f1 from the summed label statistics. As in
+    sklearn, only labels present in the true or predicted labels are averaged and
+    undefined scores count as 0.
+    """
+    true, pred, tp = np.split(np.asarray(stats, dtype=np.float64), 3)
+    if score == "precision":
+        numerator, denominator = tp, pred
+    elif score == "recall":
+        numerator, denominator = tp, true
+    elif score == "f1":
+        numerator, denominator = 2 * tp, true + pred
+    else:
+        raise Exception(f"{score} is not a valid classification score.")
+
+    per_label = np.divide(
+        numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0
+    )
+    present = (true + pred) > 0
+    return float(per_label[present].mean()) if present.any() else 0.0
+
+
+class MacroAveragedMetric(SufficientStatistics, ClassificationMetric):
+    """ Macro-averaged precision, recall or f1, with the label counts as sufficient statistics. """
+
+    # "precision", "recall" or "f1" (see `macro_average`).
+    average = None
+
+    def result_from_matrix(
+        self, src: List[str], cand: List[str], ref: List[str], matrix: ConfusionMatrix
+    ) -> MetricResult:
+        return MetricResult(matrix.macro_average(self.average), [], src, cand, ref, self.name)
+
+    def segment_statistics(self, src: List[str], cand: List[str], ref: List[str]) -> np.ndarray:
+        return label_statistics(ref, cand)
+
+    def score_from_statistics(self, stats: np.ndarray) -> float:
+        return macro_average(stats, self.average)
+
+    def result_from_statistics(
+        self, src: List[str], cand: List[str], ref: List[str], stats: np.ndarray
+    ) -> MetricResult:
+        score = self.score_from_statistics(stats.sum(axis=0))
+        return MetricResult(score, [], src, cand, ref, self.name)
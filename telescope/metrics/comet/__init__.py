@@ -1,2 +1,3 @@
 from .metric import COMET
+from .registry import get_runner, warm_up
 from .result import COMETResult
@@ -15,13 +15,9 @@
 import os
 from typing import List
 
-import torch
-from pytorch_lightning.trainer.trainer import Trainer
+from telescope.metrics.comet.registry import BATCH_SIZE, MAX_TOKENS, get_runner
 from telescope.metrics.comet.result import COMETResult
-from telescope.metrics.metric import Metric
-from torch.utils.data import DataLoader
-
-from comet import download_model, load_from_checkpoint
+from telescope.metrics.metric import IndependentSegments, Metric
 
 if "COMET_MODEL" in os.environ:
     MODELNAME = os.environ["COMET_MODEL"]
@@ -29,30 +25,54 @@ else:
     MODELNAME = "wmt20-comet-da"
 
 
-class COMET(Metric):
+class COMET(IndependentSegments, Metric):
 
     name = "COMET"
     system_only = False
 
-    def __init__(self, language=None, modelname: str = MODELNAME, **kwargs):
+    def __init__(
+        self,
+        language=None,
+        modelname: str = MODELNAME,
+        batch_size: int = None,
+        max_tokens: int = None,
+        **kwargs,
+    ):
+        """
+        :param language: Language of the evaluated text.
+        :param modelname: Name of the COMET model.
+        :param batch_size: Maximum number of segments per batch (COMET_BATCH_SIZE by default).
+        :param max_tokens: Maximum number of padded tokens per batch (COMET_MAX_TOKENS by default).
+        """
+        self.language = language
         self.modelname = modelname
-        self.model = load_from_checkpoint(download_model(modelname))
+        self.batch_size = BATCH_SIZE if batch_size is None else batch_size
+        self.max_tokens = MAX_TOKENS if max_tokens is None else max_tokens
+
+    @property
+    def runner(self):
+        # The model is loaded on first use: cached segments and merged shards do not need it.
+        return get_runner(self.modelname)
+
+    @property
+    def model(self):
+        return self.runner.model
+
+    @property
+    def model_id(self) -> str:
+        return self.modelname
 
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> COMETResult:
-        data = {"src": src, "mt": cand, "ref": ref}
-        data = [dict(zip(data, t)) for t in zip(*data.values())]
-        dataloader = DataLoader(
-            dataset=data,
-            batch_size=16,
-            collate_fn=lambda x: self.model.prepare_sample(x, inference=True),
-            num_workers=4,
+        return self.result_from_segments(
+            src, cand, ref, self.cached_segments(src, cand, ref, self.segment_values)
         )
-        cuda = 1 if torch.cuda.is_available() else 0
-        trainer = Trainer(gpus=cuda, deterministic=True, logger=False)
-        predictions = trainer.predict(
-            self.model, dataloaders=dataloader, return_predictions=True
-        )
-        scores = torch.cat(predictions, dim=0).tolist()
+
+    def result_from_segments(
+        self, src: List[str], cand: List[str], ref: List[str], values: List[float]
+    ) -> COMETResult:
         return COMETResult(
-            sum(scores) / len(scores), scores, src, cand, ref, self.name, self.modelname
+            sum(values) / len(values), values, src, cand, ref, self.name, self.modelname, values
         )
+
+    def segment_values(self, src: List[str], cand: List[str], ref: List[str]) -> List[float]:
+        return self.runner.predict(src, cand, ref, self.batch_size, self.max_tokens)
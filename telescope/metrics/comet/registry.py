@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+COMET model registry
+==============
+Loading a COMET checkpoint takes several seconds, so loaded models are kept in a
+process-wide registry and shared by every COMET instance. Each model comes with a
+runner that keeps its pytorch-lightning Trainer alive between calls.
+
+Segments are sorted by length and packed into batches of at most COMET_BATCH_SIZE
+segments and COMET_MAX_TOKENS padded tokens, so that short segments are not
+padded to the length of long ones. Scores are returned in the original order.
+
+The registry keeps at most COMET_REGISTRY_SIZE models; the least recently used
+one is released when a new model is loaded. Servers can call `warm_up` at
+start-up so that the first request does not pay the loading time.
+"""
+import os
+import threading
+from collections import OrderedDict
+from itertools import chain
+from typing import List
+
+import torch
+from pytorch_lightning.trainer.trainer import Trainer
+from torch.utils.data import DataLoader
+
+from comet import download_model, load_from_checkpoint
+from telescope.metrics.utils import length_batches
+
+if "COMET_REGISTRY_SIZE" in os.environ:
+    REGISTRY_SIZE = int(os.environ["COMET_REGISTRY_SIZE"])
+else:
+    REGISTRY_SIZE = 2
+
+if "COMET_BATCH_SIZE" in os.environ:
+    BATCH_SIZE = int(os.environ["COMET_BATCH_SIZE"])
+else:
+    BATCH_SIZE = 64
+
+if "COMET_MAX_TOKENS" in os.environ:
+    MAX_TOKENS = int(os.environ["COMET_MAX_TOKENS"])
+else:
+    MAX_TOKENS = 4096
+
+if "COMET_NUM_WORKERS" in os.environ:
+    NUM_WORKERS = int(os.environ["COMET_NUM_WORKERS"])
+else:
+    NUM_WORKERS = 0
+
+
+class COMETRunner:
+    def __init__(self, modelname: str):
+        """
+        :param modelname: Name of the COMET model (downloaded if needed).
+        """
+        self.modelname = modelname
+        self.model = load_from_checkpoint(download_model(modelname))
+        self.model.eval()
+        self._trainer = None
+        self._lock = threading.Lock()
+
+    @property
+    def trainer(self) -> Trainer:
+        if self._trainer is None:
+            cuda = 1 if torch.cuda.is_available() else 0
+            self._trainer = Trainer(gpus=cuda, deterministic=True, logger=False)
+        return self._trainer
+
+    def segment_lengths(self, *texts: List[str]) -> List[int]:
+        """ Number of tokens of the longest text (src, mt or ref) of each segment. """
+        tokenizer = getattr(getattr(self.model, "encoder", None), "tokenizer", None)
+        if tokenizer is None:
+            counts = [[len(text.split()) for text in column] for column in texts]
+        else:
+            counts = [
+                [len(ids) for ids in tokenizer(list(column), add_special_tokens=True)["input_ids"]]
+                for column in texts
+            ]
+        return [max(lengths) for lengths in zip(*counts)]
+
+    def predict(
+        self,
+        src: List[str],
+        cand: List[str],
+        ref: List[str],
+        batch_size: int = BATCH_SIZE,
+        max_tokens: int = MAX_TOKENS,
+    ) -> List[float]:
+        """
+        Segment scores of the model, computed in length-sorted batches.
+
+        :param batch_size: Maximum number of segments in a batch.
+        :param max_tokens: Maximum number of padded tokens in a batch.
+        """
+        data = {"src": src, "mt": cand, "ref": ref}
+        data = [dict(zip(data, t)) for t in zip(*data.values())]
+        if not data:
+            return []
+        batches = length_batches(self.segment_lengths(src, cand, ref), batch_size, max_tokens)
+        # Each item of the dataset is already a batch, so automatic batching is disabled.
+        dataloader = DataLoader(
+            dataset=[[data[i] for i in batch] for batch in batches],
+            batch_size=None,
+            collate_fn=lambda x: self.model.prepare_sample(x, inference=True),
+            num_workers=NUM_WORKERS,
+        )
+        # The Trainer keeps state between calls, so calls are serialized.
+        with self._lock:
+            predictions = self.trainer.predict(
+                self.model, dataloaders=dataloader, return_predictions=True
+            )
+        scores = [None] * len(data)
+        for i, score in zip(chain(*batches), torch.cat(predictions, dim=0).tolist()):
+            scores[i] = score
+        return scores
+
+
+_RUNNERS = OrderedDict()
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_runner(modelname: str) -> COMETRunner:
+    """ Shared runner of a COMET model, loading the model on first use. """
+    with _REGISTRY_LOCK:
+        if modelname in _RUNNERS:
+            _RUNNERS.move_to_end(modelname)
+            return _RUNNERS[modelname]
+
+        runner = COMETRunner(modelname)
+        _RUNNERS[modelname] = runner
+        while len(_RUNNERS) > max(REGISTRY_SIZE, 1):
+            _RUNNERS.popitem(last=False)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        return runner
+
+
+def warm_up(modelnames: List[str]) -> None:
+    """ Loads the models and runs them once so that the first request is not delayed. """
+    for modelname in modelnames:
+        get_runner(modelname).predict(["Hello world."], ["Hello world."], ["Hello world."])
+
+
+def clear_registry() -> None:
+    """ Releases every loaded model. """
+    with _REGISTRY_LOCK:
+        _RUNNERS.clear()
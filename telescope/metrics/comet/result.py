@@ -25,8 +25,9 @@ class COMETResult(MetricResult):
         ref: list,
         metric: str,
         model: str,
+        values: list = None,
     ) -> None:
-        super().__init__(sys_score, seg_scores, src, cand, ref, metric)
+        super().__init__(sys_score, seg_scores, src, cand, ref, metric, values)
         self.model = model
 
     def __str__(self):
@@ -12,153 +12,196 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections import Counter
-from itertools import chain
-from typing import List
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Sequence, Tuple
 
-from sacrebleu.metrics.bleu import _get_tokenizer
-from telescope.metrics.metric import Metric
+import numpy as np
+from telescope.metrics.metric import MergeableShards, Metric
 from telescope.metrics.result import MetricResult
-
-
-class GLEU(Metric):
+from telescope.metrics.tokenization import token_cache
+
+if "GLEU_WORKERS" in os.environ:
+    WORKERS = int(os.environ["GLEU_WORKERS"])
+else:
+    WORKERS = 1
+
+# Number of segments scored at once (bounds the memory of the n-gram arrays).
+if "GLEU_CHUNK" in os.environ:
+    CHUNK_SIZE = int(os.environ["GLEU_CHUNK"])
+else:
+    CHUNK_SIZE = 50000
+
+
+def tokenizer_name(language: str) -> str:
+    """ Name of the sacrebleu tokenizer used for a language. """
+    if language == "zh":
+        return "zh"
+    elif language == "ja":
+        return "ja-mecab"
+    return "13a"
+
+
+def tokenize_segments(
+    segments: List[str], language: str, lowercase: bool, tokenize: bool
+) -> List[np.ndarray]:
+    """
+    Ids of the units over which GLEU counts n-grams, taken from the shared token
+    cache. sacrebleu tokenizers return a string, so with tokenize=True the n-grams
+    are n-grams of characters of the tokenized segment; with tokenize=False they
+    are n-grams of space separated words.
+    """
+    tokenizer = tokenizer_name(language) + "-chars" if tokenize else "space"
+    return token_cache().token_ids(tokenizer, lowercase, segments)
+
+
+def unit_ids(sequences: List[Sequence]) -> Tuple[np.ndarray, int]:
+    """
+    Dense integer ids of the units (token ids, characters or words) of all sequences.
+
+    :return: Concatenated ids of all sequences and the number of distinct units.
+    """
+    if all(isinstance(s, np.ndarray) for s in sequences):
+        units = np.concatenate(sequences).astype(np.int64) if sequences else np.zeros(0, dtype=np.int64)
+    elif all(isinstance(s, str) for s in sequences):
+        units = np.frombuffer("".join(sequences).encode("utf-32-le"), dtype=np.uint32)
+    else:
+        vocab = {}
+        ids = np.fromiter(
+            (vocab.setdefault(unit, len(vocab)) for seq in sequences for unit in seq), dtype=np.int64
+        )
+        return ids, len(vocab)
+    if len(units) == 0:
+        return np.zeros(0, dtype=np.int64), 0
+    present = np.flatnonzero(np.bincount(units))
+    lookup = np.zeros(int(present[-1]) + 1, dtype=np.int64)
+    lookup[present] = np.arange(len(present))
+    return lookup[units], len(present)
+
+
+def segment_gleu(
+    hypotheses: List[Sequence], references: List[Sequence], min_len: int = 1, max_len: int = 4
+) -> np.ndarray:
+    """
+    Sentence GLEU of aligned hypotheses and references, computed for all segments
+    at once. Every n-gram gets an exact integer key: a rolling polynomial of its
+    unit ids (base = vocabulary size + 1, so keys of different orders never
+    collide) or, when that could overflow int64, the dense id of the pair (key of
+    its (n-1)-gram prefix, id of its last unit). The clipped overlaps are then a
+    join between the (segment, n-gram) counts of both sides.
+
+    :return: Array with the GLEU of each segment.
+    """
+    n = len(hypotheses)
+    sequences = list(hypotheses) + list(references)
+    lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+    hyp_lengths, ref_lengths = lengths[:n], lengths[n:]
+
+    orders = range(min_len, max_len + 1)
+    tpfp = sum(np.maximum(hyp_lengths - order + 1, 0) for order in orders)
+    tpfn = sum(np.maximum(ref_lengths - order + 1, 0) for order in orders)
+    n_all = np.maximum(tpfp, tpfn)
+    scores = np.zeros(n)
+    if not (n_all > 0).any():
+        return scores
+
+    tokens, vocab_size = unit_ids(sequences)
+    seq_of = np.repeat(np.arange(2 * n), lengths)
+    remaining = np.repeat(np.cumsum(lengths), lengths) - np.arange(len(tokens))
+    base = vocab_size + 1
+    rolling = n * base ** max_len < 2 ** 62
+
+    # (sequence, n-gram key) of every n-gram of the requested orders.
+    grams, gram_seqs = [], []
+    prefix, num_keys = np.zeros(len(tokens), dtype=np.int64), 1
+    for order in range(1, max_len + 1):
+        valid = np.flatnonzero(remaining >= order)
+        keys = prefix[valid] * base + tokens[valid + order - 1] + 1
+        if not rolling:
+            keys = np.unique(keys, return_inverse=True)[1] + num_keys
+            num_keys = int(keys.max(initial=num_keys - 1)) + 1
+        prefix = np.zeros(len(tokens), dtype=np.int64)
+        prefix[valid] = keys
+        if order >= min_len:
+            grams.append(keys)
+            gram_seqs.append(seq_of[valid])
+    num_keys = base ** max_len if rolling else num_keys
+
+    grams, gram_seqs = np.concatenate(grams), np.concatenate(gram_seqs)
+    keys = (gram_seqs % n) * num_keys + grams
+    hyp_keys, hyp_counts = np.unique(keys[gram_seqs < n], return_counts=True)
+    ref_keys, ref_counts = np.unique(keys[gram_seqs >= n], return_counts=True)
+    if len(hyp_keys) and len(ref_keys):
+        idx = np.minimum(np.searchsorted(ref_keys, hyp_keys), len(ref_keys) - 1)
+        match = ref_keys[idx] == hyp_keys
+        overlap = np.minimum(hyp_counts[match], ref_counts[idx[match]])
+        tp = np.bincount(hyp_keys[match] // num_keys, weights=overlap, minlength=n).astype(np.int64)
+    else:
+        tp = np.zeros(n, dtype=np.int64)
+
+    # GLEU = min(precision, recall) = tp / max(tpfp, tpfn)
+    np.divide(tp, n_all, out=scores, where=n_all > 0)
+    return scores
+
+
+def score_chunk(
+    language: str, lowercase: bool, tokenize: bool, segments: tuple
+) -> np.ndarray:
+    cand, ref = segments
+    return segment_gleu(
+        tokenize_segments(cand, language, lowercase, tokenize),
+        tokenize_segments(ref, language, lowercase, tokenize),
+    )
+
+
+class GLEU(MergeableShards, Metric):
 
     name = "GLEU"
     segment_level = True
 
-    def __init__(self, language: str, lowercase: bool = False, tokenize: bool = True):
-        super().__init__(language)
-        if language == "zh":
-            self.tokenizer = _get_tokenizer("zh")()
-        elif language == "ja":
-            self.tokenizer = _get_tokenizer("ja-mecab")()
-        else:
-            self.tokenizer = _get_tokenizer("13a")()
-
+    def __init__(
+        self,
+        language: str = "X",
+        labels: List[str] = [" "],
+        lowercase: bool = False,
+        tokenize: bool = True,
+        workers: int = WORKERS,
+        **kwargs
+    ):
+        """
+        :param language: Language of the evaluated text.
+        :param labels: Unused, kept for the common metric signature.
+        :param lowercase: Lowercase the segments.
+        :param tokenize: Tokenize the segments with the sacrebleu tokenizer of the language.
+        :param workers: Number of processes used to score chunks of segments.
+        """
+        super().__init__(language, labels)
         self.lowercase = lowercase
         self.tokenize = tokenize
+        self.workers = workers
 
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> MetricResult:
-        org_cand = cand
-        org_ref = ref
-        if self.tokenize:
-            cand = [self.tokenizer(c.strip("\n")) for c in cand]
-            ref = [self.tokenizer(r.strip("\n")) for r in ref]
+        chunk_size = CHUNK_SIZE
+        if self.workers > 1:
+            chunk_size = min(chunk_size, -(-len(cand) // self.workers))
+        chunks = [
+            (cand[i : i + chunk_size], ref[i : i + chunk_size])
+            for i in range(0, len(cand), max(chunk_size, 1))
+        ]
+        run_chunk = partial(score_chunk, self.language, self.lowercase, self.tokenize)
+        if self.workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+                scores = list(executor.map(run_chunk, chunks))
         else:
-            cand = [c.strip("\n").split(" ") for c in cand]
-            ref = [r.strip("\n").split(" ") for r in ref]
+            scores = [run_chunk(chunk) for chunk in chunks]
 
-        if self.lowercase:
-            cand = [c.lower() for c in cand]
-            ref = [r.lower() for r in ref]
-
-        segment_gleu = [self.sentence_gleu(r, h) for r, h in zip(ref, cand)]
+        segment_gleu = np.concatenate(scores).tolist() if scores else []
         corpus_gleu = sum(segment_gleu) / len(segment_gleu)
-        cand = [" ".join(seg) for seg in cand]
-        ref = [" ".join(seg) for seg in ref]
-        return MetricResult(
-            corpus_gleu, segment_gleu, src, org_cand, org_ref, self.name
-        )
-
-    def sentence_gleu(self, reference, hypothesis, min_len=1, max_len=4):
-        references = [
-            reference,
-        ]
-        return self.algorithm(
-            [references], [hypothesis], min_len=min_len, max_len=max_len
-        )
-
-    def algorithm(self, list_of_references, hypotheses, min_len=1, max_len=4):
-        """Original code from NLTK:
-        https://www.nltk.org/_modules/nltk/translate/gleu_score.html
-
-        """
-        assert len(list_of_references) == len(
-            hypotheses
-        ), "The number of hypotheses and their reference(s) should be the same"
-
-        # sum matches and max-token-lengths over all sentences
-        corpus_n_match = 0
-        corpus_n_all = 0
-
-        for references, hypothesis in zip(list_of_references, hypotheses):
-            hyp_ngrams = Counter(self.everygrams(hypothesis, min_len, max_len))
-            tpfp = sum(hyp_ngrams.values())  # True positives + False positives.
-
-            hyp_counts = []
-            for reference in references:
-                ref_ngrams = Counter(self.everygrams(reference, min_len, max_len))
-                tpfn = sum(ref_ngrams.values())  # True positives + False negatives.
-
-                overlap_ngrams = ref_ngrams & hyp_ngrams
-                tp = sum(overlap_ngrams.values())  # True positives.
-
-                # While GLEU is defined as the minimum of precision and
-                # recall, we can reduce the number of division operations by one by
-                # instead finding the maximum of the denominators for the precision
-                # and recall formulae, since the numerators are the same:
-                #     precision = tp / tpfp
-                #     recall = tp / tpfn
-                #     gleu_score = min(precision, recall) == tp / max(tpfp, tpfn)
-                n_all = max(tpfp, tpfn)
-
-                if n_all > 0:
-                    hyp_counts.append((tp, n_all))
-
-            # use the reference yielding the highest score
-            if hyp_counts:
-                n_match, n_all = max(hyp_counts, key=lambda hc: hc[0] / hc[1])
-                corpus_n_match += n_match
-                corpus_n_all += n_all
-
-        # corner case: empty corpus or empty references---don't divide by zero!
-        if corpus_n_all == 0:
-            gleu_score = 0.0
-        else:
-            gleu_score = corpus_n_match / corpus_n_all
+        return MetricResult(corpus_gleu, segment_gleu, src, cand, ref, self.name)
 
-        return gleu_score
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> MetricResult:
+        return MetricResult(sum(values) / len(values), values, src, cand, ref, self.name)
 
-    def pad_sequence(
-        self,
-        sequence,
-        n,
-        pad_left=False,
-        pad_right=False,
-        left_pad_symbol=None,
-        right_pad_symbol=None,
-    ):
-        sequence = iter(sequence)
-        if pad_left:
-            sequence = chain((left_pad_symbol,) * (n - 1), sequence)
-        if pad_right:
-            sequence = chain(sequence, (right_pad_symbol,) * (n - 1))
-        return sequence
-
-    def ngrams(
-        self,
-        sequence,
-        n,
-        pad_left=False,
-        pad_right=False,
-        left_pad_symbol=None,
-        right_pad_symbol=None,
-    ):
-        sequence = self.pad_sequence(
-            sequence, n, pad_left, pad_right, left_pad_symbol, right_pad_symbol
-        )
-        history = []
-        while n > 1:
-            history.append(next(sequence))
-            n -= 1
-        for item in sequence:
-            history.append(item)
-            yield tuple(history)
-            del history[0]
-
-    def everygrams(self, sequence, min_len=1, max_len=-1, **kwargs):
-        if max_len == -1:
-            max_len = len(sequence)
-        for n in range(min_len, max_len + 1):
-            for ng in self.ngrams(sequence, n, **kwargs):
-                yield ng
+    def sentence_gleu(self, reference, hypothesis, min_len=1, max_len=4):
+        return float(segment_gleu([hypothesis], [reference], min_len, max_len)[0])
@@ -13,12 +13,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import abc
-from typing import List, Tuple, Dict
+from typing import Callable, List, Tuple, Dict
 from itertools import combinations
+from functools import partial
 
 import numpy as np
-from telescope.metrics.result import BootstrapResult, MetricResult, PairwiseResult, MultipleResult
-from telescope.testset import PairwiseTestset, MultipleTestset
+from telescope.metrics.cache import segment_cache
+from telescope.metrics.bootstrap import (
+    Workers,
+    count_wins,
+    map_partitions,
+    new_seed,
+    resample_means,
+    resample_sums,
+)
+from telescope.metrics.result import (
+    AllPairsBootstrapResult,
+    BootstrapResult,
+    MetricResult,
+    PairwiseResult,
+    MultipleResult,
+)
+from telescope.testset import PairwiseTestset, MultipleTestset, take
 
 
 class Metric(metaclass=abc.ABCMeta):
@@ -27,6 +43,10 @@ class Metric(metaclass=abc.ABCMeta):
 
     name = None
     segment_level = True
+    sufficient_statistics = False
+    independent_segments = False
+    # False for error rates (e.g. TER): a lower score wins a bootstrap partition.
+    higher_is_better = True
 
     def __init__(self, language: str = "X", labels: List[str] = [" "]):
         if not self.language_support(language):
@@ -44,18 +64,56 @@ class Metric(metaclass=abc.ABCMeta):
     def language_support(cls, language: str):
         return True
 
+    @property
+    def model_id(self) -> str:
+        """ Name (and version) of the model behind the metric. Part of the segment cache keys. """
+        return self.name
+
+    def cached_segments(
+        self, src: List[str], cand: List[str], ref: List[str], compute: Callable
+    ) -> list:
+        """
+        Per-segment values of the metric through the disk segment cache. Only the
+        segments that were never scored with the same model and language are passed
+        to compute.
+
+        :param compute: Function (src, cand, ref) -> one JSON serializable value per segment.
+        """
+        cache = segment_cache()
+        if cache is None:
+            return compute(src, cand, ref)
+        namespace = (self.name, self.model_id, str(getattr(self, "language", None)))
+        return cache.fetch(namespace, src, cand, ref, compute)
+
+    def score_systems(
+        self, src: List[str], systems_output: Dict[str, List[str]], ref: List[str]
+    ) -> Tuple[Dict[str, MetricResult], float]:
+        """
+        Scores several systems at once.
+
+        :return: Result of each system and the share of segments that were duplicates.
+        """
+        return {name: self.score(src, output, ref) for name, output in systems_output.items()}, 0.0
+
+    def shard_values(self, result: MetricResult) -> list:
+        """
+        Per-segment values of a result, written to the partial results of a shard
+        (one JSON serializable value per segment). Only metrics that are
+        `MergeableShards` can be scored in shards.
+        """
+        return result.seg_scores
+
     def pairwise_comparison(self, testset: PairwiseTestset):
         """ Function that scores the two candidate systems inside a paired testset. """
-        x_result = self.score(testset.src, testset.system_x, testset.ref)
-        y_result = self.score(testset.src, testset.system_y, testset.ref)
-        return PairwiseResult(x_result, y_result)
+        results, _ = self.score_systems(
+            testset.src, {"x": testset.system_x, "y": testset.system_y}, testset.ref
+        )
+        return PairwiseResult(results["x"], results["y"])
 
     def multiple_comparison(self, testset: MultipleTestset):
         """ Function that scores the multiple candidate systems inside a testset. """
-        ref = testset.ref
-        src = testset.src
-        systems_metric_results = {name: self.score(src,output,ref) for name,output in testset.systems_output.items()}
-        return MultipleResult(systems_metric_results)
+        systems_metric_results, dedup_ratio = self.score_systems(testset.src, testset.systems_output, testset.ref)
+        return MultipleResult(systems_metric_results, dedup_ratio)
 
     @classmethod
     def bootstrap_resampling(
@@ -64,6 +122,8 @@ class Metric(metaclass=abc.ABCMeta):
         num_samples: int,
         sample_ratio: float,
         pairwise_result: PairwiseResult = None,
+        seed: int = None,
+        workers: Workers = 1,
     ):
 
         """
@@ -74,66 +134,126 @@ class Metric(metaclass=abc.ABCMeta):
         :param num_samples: Number of testset splits.
         :param sample_ratio: % of the testset to be used in each partition.
         :param pairwise_result: Precomputed scores between two systems.
+        :param seed: Seed of the bootstrap run. If None it is drawn from numpy global random state.
+        :param workers: Number of processes (or shared process pool) used to spread the partitions.
         :return: BootstrapResult object
         """
-
-        def update_wins(x_score: int, y_score: int, wins: Tuple[int]):
-            if y_score > x_score:
-                wins[1] += 1
-            elif y_score < x_score:
-                wins[0] += 1
-            else:
-                wins[2] += 1
-            return wins
-
-        def recompute_sys_scores(pairwise_result: PairwiseResult) -> (float, float):
-            if cls.segment_level and pairwise_result is not None:
-                reduces_x_scr = [
-                    pairwise_result.x_result.seg_scores[i] for i in reduced_ids
-                ]
-                reduces_y_scr = [
-                    pairwise_result.y_result.seg_scores[i] for i in reduced_ids
-                ]
-                return (
-                    sum(reduces_x_scr) / len(reduces_x_scr),
-                    sum(reduces_y_scr) / len(reduces_y_scr),
-                )
-            else:
-                result = cls(testset.target_language).pairwise_comparison(
-                    PairwiseTestset(
-                        reduced_src,
-                        reduced_x,
-                        reduced_y,
-                        reduced_ref,
-                        language_pair=testset.language_pair,
-                        filenames=testset.filenames,
-                    )
-                )
-                return (result.x_result.sys_score, result.y_result.sys_score)
-
         n = len(testset)
-        ids = list(range(n))
         sample_size = max(int(n * sample_ratio), 1)
+        seed = new_seed() if seed is None else seed
+
+        if cls.sufficient_statistics:
+            results = [pairwise_result.x_result, pairwise_result.y_result] if pairwise_result else []
+            scores = cls(testset.target_language).resample_statistics(
+                testset.src,
+                [testset.system_x, testset.system_y],
+                testset.ref,
+                num_samples,
+                sample_size,
+                seed,
+                workers,
+                result_statistics(results),
+            )
+        elif cls.segment_level and pairwise_result is not None:
+            scores = resample_means(
+                [pairwise_result.x_result.seg_scores, pairwise_result.y_result.seg_scores],
+                num_samples,
+                sample_size,
+                seed,
+                workers,
+            )
+        else:
+            scores = np.concatenate(
+                map_partitions(
+                    partial(
+                        rescore_partitions,
+                        cls,
+                        testset.target_language,
+                        testset.src,
+                        testset.ref,
+                        {"x": testset.system_x, "y": testset.system_y},
+                    ),
+                    n,
+                    num_samples,
+                    sample_size,
+                    seed,
+                    workers,
+                )
+            )
 
-        x_scores, y_scores = [], []
-        wins = [0, 0, 0]
-        for _ in range(num_samples):
-            # Subsample the gold and system outputs (with replacement)
-            reduced_ids = np.random.choice(ids, size=sample_size, replace=True)
-
-            # Calculate accuracy on the reduced sample and save stats
-            reduced_src = [testset[i][0] for i in reduced_ids]
-            reduced_x = [testset[i][1] for i in reduced_ids]
-            reduced_y = [testset[i][2] for i in reduced_ids]
-            reduced_ref = [testset[i][3] for i in reduced_ids]
+        x_scores, y_scores = scores[:, 0], scores[:, 1]
+        wins = count_wins(x_scores, y_scores, cls.higher_is_better)
+        return BootstrapResult(x_scores.tolist(), y_scores.tolist(), wins, cls.name)
 
-            x_result, y_result = recompute_sys_scores(pairwise_result)
-            wins = update_wins(x_result, y_result, wins)
-            x_scores.append(x_result)
-            y_scores.append(y_result)
 
-        return BootstrapResult(x_scores, y_scores, wins, cls.name)
+    @classmethod
+    def resample_systems(
+        cls,
+        testset: MultipleTestset,
+        num_samples: int,
+        sample_ratio: float,
+        systems: List[str],
+        language: str,
+        multiple_result: MultipleResult = None,
+        seed: int = None,
+        workers: Workers = 1,
+    ) -> np.ndarray:
+        """
+        Computes the system-level score of several systems on the same bootstrap partitions.
 
+        :param testset: Testset
+        :param num_samples: Number of testset splits.
+        :param sample_ratio: % of the testset to be used in each partition.
+        :param systems: Ids of the systems to resample.
+        :param language: Language of the evaluated text.
+        :param multiple_result: Precomputed scores of multiple systems.
+        :param seed: Seed of the bootstrap run. If None it is drawn from numpy global random state.
+        :param workers: Number of processes (or shared process pool) used to spread the partitions.
+        :return: (num_samples, len(systems)) matrix with the resampled system-level scores.
+        """
+        n = len(testset)
+        sample_size = max(int(n * sample_ratio), 1)
+        seed = new_seed() if seed is None else seed
+
+        if cls.sufficient_statistics:
+            results = []
+            if multiple_result is not None:
+                results = [multiple_result.systems_metric_results[system] for system in systems]
+            return cls(language, [" "]).resample_statistics(
+                testset.src,
+                [testset.systems_output[system] for system in systems],
+                testset.ref,
+                num_samples,
+                sample_size,
+                seed,
+                workers,
+                result_statistics(results),
+            )
+        elif cls.segment_level and multiple_result is not None:
+            return resample_means(
+                [multiple_result.systems_metric_results[system].seg_scores for system in systems],
+                num_samples,
+                sample_size,
+                seed,
+                workers,
+            )
+        return np.concatenate(
+            map_partitions(
+                partial(
+                    rescore_partitions,
+                    cls,
+                    language,
+                    testset.src,
+                    testset.ref,
+                    {system: testset.systems_output[system] for system in systems},
+                ),
+                n,
+                num_samples,
+                sample_size,
+                seed,
+                workers,
+            )
+        )
 
     @classmethod
     def multiple_bootstrap_resampling(
@@ -145,6 +265,8 @@ class Metric(metaclass=abc.ABCMeta):
         system_y: str,
         language: str,
         multiple_result: MultipleResult = None,
+        seed: int = None,
+        workers: Workers = 1,
     ):
 
         """
@@ -158,65 +280,223 @@ class Metric(metaclass=abc.ABCMeta):
         :param system_x: Name of system x.
         :param system_y: Name of system x.
         :param ref_filename: Filename of reference.
+        :param seed: Seed of the bootstrap run. If None it is drawn from numpy global random state.
+        :param workers: Number of processes (or shared process pool) used to spread the partitions.
         :return: BootstrapResult object.
         """
+        scores = cls.resample_systems(
+            testset, num_samples, sample_ratio, [system_x, system_y], language,
+            multiple_result, seed, workers,
+        )
+        x_scores, y_scores = scores[:, 0], scores[:, 1]
+        wins = count_wins(x_scores, y_scores, cls.higher_is_better)
+        return BootstrapResult(x_scores.tolist(), y_scores.tolist(), wins, cls.name)
 
-        def update_wins(x_score: int, y_score: int, wins: Tuple[int]):
-            if y_score > x_score:
-                wins[1] += 1
-            elif y_score < x_score:
-                wins[0] += 1
-            else:
-                wins[2] += 1
-            return wins
-
-        def recompute_sys_scores(multiple_result: MultipleResult) -> (float, float):
-            if cls.segment_level and multiple_result is not None:
-                reduces_x_scr = [
-                    multiple_result.systems_metric_results[system_x].seg_scores[i] 
-                    for i in reduced_ids
-                ]
-                reduces_y_scr = [
-                    multiple_result.systems_metric_results[system_y].seg_scores[i] 
-                    for i in reduced_ids
-                ]
-                return (
-                    sum(reduces_x_scr) / len(reduces_x_scr),
-                    sum(reduces_y_scr) / len(reduces_y_scr),
-                )
-            else:
-                result = cls(language, [" "]).multiple_comparison(
-                    MultipleTestset(
-                        reduced_src,
-                        reduced_ref,
-                        reducted_n_systems_output,
-                        filenames=testset.filenames,
-                    )
-                )
-                return (result.systems_metric_results[system_x].sys_score, 
-                        result.systems_metric_results[system_y].sys_score)
+    @classmethod
+    def all_pairs_bootstrap_resampling(
+        cls,
+        testset: MultipleTestset,
+        num_samples: int,
+        sample_ratio: float,
+        language: str,
+        multiple_result: MultipleResult = None,
+        seed: int = None,
+        workers: Workers = 1,
+    ) -> AllPairsBootstrapResult:
+        """
+        Bootstrap resampling between every pair of systems of the testset. Every system
+        is scored once per partition, on the same partitions, and the pairwise
+        win-rates are derived from those scores.
 
-        n = len(testset)
-        ids = list(range(n))
-        sample_size = max(int(n * sample_ratio), 1)
+        :param testset: Testset
+        :param num_samples: Number of testset splits.
+        :param sample_ratio: % of the testset to be used in each partition.
+        :param language: Language of the evaluated text.
+        :param multiple_result: Precomputed scores of multiple systems.
+        :param seed: Seed of the bootstrap run. If None it is drawn from numpy global random state.
+        :param workers: Number of processes (or shared process pool) used to spread the partitions.
+        :return: AllPairsBootstrapResult object.
+        """
+        systems = list(testset.systems_output.keys())
+        scores = cls.resample_systems(
+            testset, num_samples, sample_ratio, systems, language, multiple_result, seed, workers
+        )
+        return AllPairsBootstrapResult(systems, scores, cls.name, cls.higher_is_better)
+
+
+class MergeableShards(metaclass=abc.ABCMeta):
+    """
+    Metrics that can be scored in shards: `merge_shards` rebuilds the exact result
+    of the whole testset from the `shard_values` of all its shards (by default,
+    the segment scores of the result).
+    """
+
+    @abc.abstractmethod
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> MetricResult:
+        """ MetricResult of a system from the `shard_values` of all its segments, in order. """
+        pass
+
+
+class SufficientStatistics(MergeableShards):
+    """
+    Corpus-level metrics with per-segment sufficient statistics. Summing any subset
+    of rows and calling `score_from_statistics` must give the score of that subset,
+    so bootstrap partitions and shards are scored from the statistics.
+    """
 
-        x_scores, y_scores = [], []
-        wins = [0, 0, 0]
+    sufficient_statistics = True
 
-        for _ in range(num_samples):
-            # Subsample the gold and system outputs (with replacement)
-            reduced_ids = np.random.choice(ids, size=sample_size, replace=True)
+    @abc.abstractmethod
+    def segment_statistics(self, src: List[str], cand: List[str], ref: List[str]) -> np.ndarray:
+        """ (segments, statistics) matrix with the sufficient statistics of each segment. """
+        pass
+
+    @abc.abstractmethod
+    def score_from_statistics(self, stats: np.ndarray) -> float:
+        """ System-level score from the summed sufficient statistics of a set of segments. """
+        pass
 
-            # Calculate accuracy on the reduced sample and save stats
-            reduced_src = [testset.src[i] for i in reduced_ids]
-            reduced_ref = [testset.ref[i] for i in reduced_ids]
-            reducted_n_systems_output = { system: [output[i] for i in reduced_ids]
-                for system, output in testset.systems_output.items()}
+    @abc.abstractmethod
+    def result_from_statistics(
+        self, src: List[str], cand: List[str], ref: List[str], stats: np.ndarray
+    ) -> MetricResult:
+        """ MetricResult of a system from the `segment_statistics` of its segments. """
+        pass
 
+    def shard_values(self, result: MetricResult) -> list:
+        """ Sufficient statistics of each segment. """
+        stats = getattr(result, "stats", None)
+        if stats is None:
+            stats = self.segment_statistics(result.src, result.cand, result.ref)
+        return np.asarray(stats).tolist()
+
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> MetricResult:
+        return self.result_from_statistics(src, cand, ref, np.array(values))
+
+    def resample_statistics(
+        self,
+        src: List[str],
+        systems: List[List[str]],
+        ref: List[str],
+        num_samples: int,
+        sample_size: int,
+        seed: int = None,
+        workers: Workers = 1,
+        stats: List[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Bootstrap resampling through the sufficient statistics of each system.
 
-            x_result, y_result = recompute_sys_scores(multiple_result)
-            wins = update_wins(x_result, y_result, wins)
-            x_scores.append(x_result)
-            y_scores.append(y_result)
+        :param stats: Precomputed statistics of each system (e.g. from their results).
+        :return: (num_samples, len(systems)) matrix with the system-level scores.
+        """
+        if stats is None:
+            stats = [self.segment_statistics(src, cand, ref) for cand in systems]
+        stats = [np.asarray(s) for s in stats]
+        sums = resample_sums(np.hstack(stats), num_samples, sample_size, seed, workers)
+        splits = np.cumsum([s.shape[1] for s in stats])[:-1]
+        return np.column_stack(
+            [
+                [self.score_from_statistics(row) for row in system_sums]
+                for system_sums in np.split(sums, splits, axis=1)
+            ]
+        )
+
+
+class IndependentSegments(MergeableShards):
+    """
+    Metrics whose segment scores only depend on the (src, cand, ref) triplet of the
+    segment (e.g. model-based metrics). Every distinct triplet is scored once
+    across systems, through the disk segment cache.
+    """
+
+    independent_segments = True
 
-        return BootstrapResult(x_scores, y_scores, wins, cls.name)
+    @abc.abstractmethod
+    def segment_values(self, src: List[str], cand: List[str], ref: List[str]) -> list:
+        """ One JSON serializable value per segment. """
+        pass
+
+    @abc.abstractmethod
+    def result_from_segments(
+        self, src: List[str], cand: List[str], ref: List[str], values: list
+    ) -> MetricResult:
+        """ MetricResult of a system from the `segment_values` of its segments. """
+        pass
+
+    def score_systems(
+        self, src: List[str], systems_output: Dict[str, List[str]], ref: List[str]
+    ) -> Tuple[Dict[str, MetricResult], float]:
+        """
+        Scores several systems at once. The distinct (src, cand, ref) triplets of all
+        systems are collected in one pass, scored once and scattered back to the
+        result of each system.
+
+        :return: Result of each system and the share of segments that were duplicates.
+        """
+        aligned = len(src) == len(ref)
+        triplets, codes = {}, {}
+        for name, output in systems_output.items():
+            sources = src if aligned else [""] * len(output)
+            codes[name] = [
+                triplets.setdefault((s, cand, r), len(triplets))
+                for s, cand, r in zip(sources, output, ref)
+            ]
+        unique = list(triplets)
+        values = self.cached_segments(
+            [t[0] for t in unique] if aligned else src,
+            [t[1] for t in unique],
+            [t[2] for t in unique],
+            self.segment_values,
+        )
+        results = {}
+        for name, output in systems_output.items():
+            system_values = [values[c] for c in codes[name]]
+            results[name] = self.result_from_segments(src, output, ref, system_values)
+        total = sum(len(c) for c in codes.values())
+        return results, (1 - len(unique) / total) if total else 0.0
+
+    def shard_values(self, result: MetricResult) -> list:
+        """ `segment_values` of each segment. """
+        return result.values
+
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> MetricResult:
+        return self.result_from_segments(src, cand, ref, values)
+
+
+def result_statistics(results: List[MetricResult]) -> List[np.ndarray]:
+    """ Statistics matrices stored on the results, or None if any result has none. """
+    stats = [getattr(result, "stats", None) for result in results]
+    if not stats or any(s is None for s in stats):
+        return None
+    return stats
+
+
+def rescore_partitions(
+    metric: type,
+    language: str,
+    src: List[str],
+    ref: List[str],
+    systems_output: Dict[str, List[str]],
+    indices: np.ndarray,
+) -> np.ndarray:
+    """
+    Rescores the systems from raw strings on each partition. Used by bootstrap for
+    metrics without precomputed segment scores or sufficient statistics.
+
+    :return: (rows, len(systems_output)) matrix with the system-level scores.
+    """
+    scores = []
+    for reduced_ids in indices:
+        result = metric(language, [" "]).multiple_comparison(
+            MultipleTestset(
+                take(src, reduced_ids),
+                take(ref, reduced_ids),
+                {system: take(output, reduced_ids) for system, output in systems_output.items()},
+                filenames=[],
+            )
+        )
+        scores.append(
+            [result.systems_metric_results[system].sys_score for system in systems_output]
+        )
+    return np.array(scores)
@@ -1,17 +1,8 @@
-from typing import List
+from telescope.metrics.classification import MacroAveragedMetric
 
-from telescope.metrics.metric import Metric
-from telescope.metrics.result import MetricResult
 
-from sklearn.metrics import precision_score
-
-
-class Precision(Metric):
+class Precision(MacroAveragedMetric):
 
     name = "Precision"
     segment_level = False
-
-    def score(self, src: List[str], cand: List[str], ref: List[str]) -> MetricResult:
-        score = precision_score(ref, cand, average='macro', zero_division=0)
-
-        return MetricResult(score, [], src, cand, ref, self.name)
+    average = "precision"
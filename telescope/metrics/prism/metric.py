@@ -27,7 +27,7 @@ import sentencepiece as spm
 import torch
 from fairseq import checkpoint_utils, utils
 from fairseq.data import LanguagePairDataset
-from telescope.metrics.metric import Metric
+from telescope.metrics.metric import IndependentSegments, Metric
 from telescope.metrics.prism.result import PrismResult
 from telescope.utils import telescope_cache_folder
 from torchnlp.download import download_file_maybe_extract
@@ -239,7 +239,7 @@ class SequenceScorer(object):
         return hypos
 
 
-class Prism(Metric):
+class Prism(IndependentSegments, Metric):
 
     name = "Prism"
     segment_level = True
@@ -270,6 +270,7 @@ class Prism(Metric):
         self.sp.Load(model_dir + "/spm.model")
 
         self.lang = language
+        self.language = language
         self.temperature = temperature
 
         # this prints things and I can't figure out how to disable it
@@ -419,25 +420,21 @@ class Prism(Metric):
 
         return np.array(results)
 
+    @property
+    def model_id(self) -> str:
+        return self.model_hash
+
     def score(self, src, cand, ref):
         if len(cand) != len(ref):
             raise Exception(
                 f"Length of cand ({len(cand)}) does not match length of ref ({len(ref)})"
             )
-
-        tokenized_cand = [self._encode(sentence, prepend=False) for sentence in cand]
-        tokenized_cand_prep = [
-            self._encode(sentence, prepend=True) for sentence in cand
-        ]
-        tokenized_ref = [self._encode(sentence, prepend=False) for sentence in ref]
-        tokenized_ref_prep = [self._encode(sentence, prepend=True) for sentence in ref]
-
-        forward_scores = self._score_forward(
-            tok_sents_in=tokenized_ref, tok_sents_out=tokenized_cand_prep
-        )
-        reverse_scores = self._score_forward(
-            tok_sents_in=tokenized_cand, tok_sents_out=tokenized_ref_prep
+        return self.result_from_segments(
+            src, cand, ref, self.cached_segments(src, cand, ref, self.segment_values)
         )
+
+    def result_from_segments(self, src, cand, ref, values):
+        forward_scores, reverse_scores = map(np.array, zip(*values))
         scores = (0.5 * forward_scores + 0.5 * reverse_scores).tolist()
 
         forward_score = sum(forward_scores.tolist()) / len(scores)
@@ -451,4 +448,22 @@ class Prism(Metric):
             self.name,
             forward_score,
             reverse_score,
+            values,
+        )
+
+    def segment_values(self, src, cand, ref):
+        """ [forward score, reverse score] of each segment. """
+        tokenized_cand = [self._encode(sentence, prepend=False) for sentence in cand]
+        tokenized_cand_prep = [
+            self._encode(sentence, prepend=True) for sentence in cand
+        ]
+        tokenized_ref = [self._encode(sentence, prepend=False) for sentence in ref]
+        tokenized_ref_prep = [self._encode(sentence, prepend=True) for sentence in ref]
+
+        forward_scores = self._score_forward(
+            tok_sents_in=tokenized_ref, tok_sents_out=tokenized_cand_prep
+        )
+        reverse_scores = self._score_forward(
+            tok_sents_in=tokenized_cand, tok_sents_out=tokenized_ref_prep
         )
+        return [list(scores) for scores in zip(forward_scores.tolist(), reverse_scores.tolist())]
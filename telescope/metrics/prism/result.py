@@ -28,8 +28,9 @@ class PrismResult(MetricResult):
         metric: str,
         forward_score: float,
         reverse_score: float,
+        values: list = None,
     ) -> None:
-        super().__init__(sys_score, seg_scores, src, cand, ref, metric)
+        super().__init__(sys_score, seg_scores, src, cand, ref, metric, values)
         self.forward_score = forward_score
         self.reverse_score = reverse_score
 
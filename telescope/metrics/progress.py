@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Progress hooks
+==============
+Metrics report their progress as (metric name, segments done, total segments)
+instead of printing to stdout. Progress is logged at debug level and passed to
+every registered hook, e.g. a progress bar in the web interface:
+
+    with progress_hook(lambda metric, done, total: bar.progress(done / total)):
+        metric.score(src, cand, ref)
+"""
+import logging
+from contextlib import contextmanager
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+ProgressHook = Callable[[str, int, int], None]
+
+_HOOKS: List[ProgressHook] = []
+
+
+def add_progress_hook(hook: ProgressHook) -> None:
+    _HOOKS.append(hook)
+
+
+def remove_progress_hook(hook: ProgressHook) -> None:
+    if hook in _HOOKS:
+        _HOOKS.remove(hook)
+
+
+@contextmanager
+def progress_hook(hook: ProgressHook):
+    """ Registers a hook for the duration of a with block. """
+    add_progress_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_progress_hook(hook)
+
+
+def report_progress(metric: str, done: int, total: int) -> None:
+    logger.debug("%s: %d/%d segments", metric, done, total)
+    for hook in list(_HOOKS):
+        hook(metric, done, total)
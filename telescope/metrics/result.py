@@ -18,6 +18,8 @@ from typing import List, Tuple, Dict
 import numpy as np
 import pandas as pd
 
+from telescope.metrics.bootstrap import count_wins
+
 
 class MetricResult(metaclass=abc.ABCMeta):
     def __init__(
@@ -28,13 +30,19 @@ class MetricResult(metaclass=abc.ABCMeta):
         cand: List[str],
         ref: List[str],
         metric: str,
+        values: list = None,
     ) -> None:
+        """
+        :param values: Per-segment values the result was built from, for metrics with
+            independent segments (see `Metric.segment_values`).
+        """
         self.sys_score = sys_score
         self.seg_scores = seg_scores
         self.src = src
         self.ref = ref
         self.cand = cand
         self.metric = metric
+        self.values = values
 
     def segment_level(self):
         if not self.seg_scores:
@@ -114,13 +122,68 @@ class BootstrapResult:
         }
 
 
+class AllPairsBootstrapResult:
+    def __init__(
+        self,
+        systems: List[str],
+        scores: np.ndarray,
+        metric: str,
+        higher_is_better: bool = True,
+    ):
+        """
+        :param systems: Ids of the resampled systems.
+        :param scores: (num_samples, len(systems)) matrix with the resampled scores.
+        :param metric: Metric name.
+        :param higher_is_better: False if the lower score wins (e.g. TER).
+        """
+        self.systems = systems
+        self.scores = np.asarray(scores)
+        self.metric = metric
+        self.higher_is_better = higher_is_better
+        # Compared so that the greater value is always the better one.
+        oriented = self.scores if higher_is_better else -self.scores
+        x_scores, y_scores = oriented[:, :, None], oriented[:, None, :]
+        num_samples = self.scores.shape[0]
+        # win_rate[i][j]: % of partitions where system i is better than system j.
+        self.win_rate = (x_scores > y_scores).sum(axis=0) / num_samples
+        self.tie_rate = (x_scores == y_scores).sum(axis=0) / num_samples
+        # p_value[i][j]: % of partitions where system i is not better than system j.
+        self.p_value = 1 - self.win_rate
+
+    def pairwise(self, system_x: str, system_y: str) -> BootstrapResult:
+        x = self.systems.index(system_x)
+        y = self.systems.index(system_y)
+        x_scores, y_scores = self.scores[:, x], self.scores[:, y]
+        win_count = count_wins(x_scores, y_scores, self.higher_is_better)
+        return BootstrapResult(x_scores.tolist(), y_scores.tolist(), win_count, self.metric)
+
+    def results_to_dataframe(self, systems_names: Dict[str, str], stat: str = "win_rate") -> pd.DataFrame:
+        names = [systems_names[sys_id] for sys_id in self.systems]
+        return pd.DataFrame(getattr(self, stat), index=names, columns=names)
+
+    def results_to_dict(self, systems_names: Dict[str, str]) -> dict:
+        names = [systems_names[sys_id] for sys_id in self.systems]
+        return {
+            "mean": dict(zip(names, self.scores.mean(axis=0).tolist())),
+            "win_rate": self.results_to_dataframe(systems_names, "win_rate").to_dict(orient="index"),
+            "tie_rate": self.results_to_dataframe(systems_names, "tie_rate").to_dict(orient="index"),
+            "p_value": self.results_to_dataframe(systems_names, "p_value").to_dict(orient="index"),
+        }
+
+
 class MultipleResult:
     def __init__(
         self,
         systems_metric_results: Dict[str, MetricResult],
+        dedup_ratio: float = 0.0,
     ) -> None:
-
+        """
+        :param systems_metric_results: Result of each system.
+        :param dedup_ratio: Share of the segments of all systems that were identical to
+            another segment and therefore scored only once.
+        """
         self.systems_metric_results = systems_metric_results
+        self.dedup_ratio = dedup_ratio
         systems_metric_results_list = list(self.systems_metric_results.values())
         x_result = systems_metric_results_list[0]
 
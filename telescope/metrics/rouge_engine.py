@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+ROUGE engine
+==============
+Computes ROUGE-1, ROUGE-2 and ROUGE-L for every segment of a corpus in a single
+pass, with the same definitions as the rouge package (`Rouge().get_scores`):
+    - segments are split into sentences on "." and sentences into words;
+    - ROUGE-N counts distinct n-grams of the words of the whole segment;
+    - ROUGE-L is the summary level LCS: the distinct words of the union of the
+      LCS of every (reference sentence, candidate sentence) pair, over the
+      distinct words of each side.
+The corpus score is the average of the segment scores.
+
+Segments are tokenized once through the shared token cache and only the
+requested variants are computed. The LCS tables of all sentence pairs are filled
+together, row by row, in length-sorted batches of at most LCS_MAX_CELLS cells.
+
+The ROUGE metrics (`ROUGEMetric`) read their variant from the scores of all
+variants, computed once per (candidates, references) pair of columns in an
+evaluation run (`shared_rouge_scores`).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from telescope.metrics.metric import MergeableShards, Metric
+from telescope.metrics.result import MetricResult
+from telescope.metrics.tokenization import SENTENCE_BREAK, register_run_cache, token_cache
+from telescope.metrics.utils import length_batches
+from telescope.testset import column_digest
+
+if "LCS_MAX_CELLS" in os.environ:
+    LCS_MAX_CELLS = int(os.environ["LCS_MAX_CELLS"])
+else:
+    LCS_MAX_CELLS = 2 ** 24
+
+VARIANTS = ("rouge-1", "rouge-2", "rouge-l")
+
+# Scores of the last corpora of a run, by digest of their columns.
+MAX_SHARED_SCORES = 8
+_SHARED_SCORES = OrderedDict()
+_SHARED_SCORES_LOCK = threading.Lock()
+register_run_cache(_SHARED_SCORES)
+
+
+class ROUGEScores:
+    def __init__(self, scores: Dict[str, np.ndarray]):
+        """
+        :param scores: Array with the F-score, precision and recall (columns) of each
+            segment (rows) for each ROUGE variant (all variants or some of them).
+        """
+        self.scores = scores
+
+    def __len__(self) -> int:
+        return len(next(iter(self.scores.values())))
+
+    def segments(self, variant: str, stat: str = "f") -> List[float]:
+        """ Segment scores of a variant. stat is one of "f", "p" or "r". """
+        return self.scores[variant][:, "fpr".index(stat)].tolist()
+
+    def corpus(self, variant: str) -> Dict[str, float]:
+        """ Average F-score, precision and recall of a variant. """
+        if len(self) == 0:
+            return {"f": 0.0, "p": 0.0, "r": 0.0}
+        # Sequential sums, as the rouge package averages the segment scores.
+        return {stat: sum(self.segments(variant, stat)) / len(self) for stat in "fpr"}
+
+
+def f_p_r(overlap: np.ndarray, evaluated: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """ F-score, precision and recall columns (0 when a count is 0). """
+    precision = np.divide(overlap, evaluated, out=np.zeros(len(overlap)), where=evaluated > 0)
+    recall = np.divide(overlap, reference, out=np.zeros(len(overlap)), where=reference > 0)
+    fscore = 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+    return np.stack([fscore, precision, recall], axis=1)
+
+
+def distinct_ngrams(words: List[np.ndarray], order: int) -> Tuple[np.ndarray, int]:
+    """
+    Distinct n-grams of each sequence.
+
+    :return: Sorted keys (sequence id * number of n-grams + n-gram id) and the
+        number of distinct n-grams.
+    """
+    lengths = np.array([len(w) for w in words], dtype=np.int64)
+    tokens = np.concatenate(words) if words else np.zeros(0, dtype=np.int64)
+    remaining = np.repeat(np.cumsum(lengths), lengths) - np.arange(len(tokens))
+    starts = np.flatnonzero(remaining >= order)
+
+    tokens = np.unique(tokens, return_inverse=True)[1].astype(np.int64)
+    keys = np.zeros(len(starts), dtype=np.int64)
+    for k in range(order):
+        keys = keys * (tokens.max(initial=0) + 1) + tokens[starts + k]
+    keys = np.unique(keys, return_inverse=True)[1].astype(np.int64)
+    num_keys = int(keys.max(initial=-1)) + 1
+    sequences = np.repeat(np.arange(len(words)), lengths)[starts]
+    return np.unique(sequences * num_keys + keys), num_keys
+
+
+def ngram_counts(
+    hyp_words: List[np.ndarray], ref_words: List[np.ndarray], order: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Distinct n-grams of each segment.
+
+    :return: Number of n-grams of the candidates that are in the references, of
+        n-grams of the candidates and of n-grams of the references.
+    """
+    n = len(hyp_words)
+    keys, num_keys = distinct_ngrams(hyp_words + ref_words, order)
+    sequences = keys // max(num_keys, 1)
+    evaluated = np.bincount(sequences[sequences < n], minlength=n)
+    reference = np.bincount(sequences[sequences >= n] - n, minlength=n)
+    # The same n-gram of the same segment on both sides.
+    hyp_keys = keys[sequences < n]
+    ref_keys = keys[sequences >= n] - n * num_keys
+    overlap = np.intersect1d(hyp_keys, ref_keys, assume_unique=True) // max(num_keys, 1)
+    return np.bincount(overlap, minlength=n), evaluated, reference
+
+
+def split_sentences(
+    segments: List[np.ndarray], break_id: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: Words of all segments, start and length (in words) of each sentence
+        and number of sentences of each segment.
+    """
+    lengths = np.array([len(s) for s in segments], dtype=np.int64)
+    ids = np.concatenate(segments) if segments else np.zeros(0, dtype=np.int64)
+    is_break = ids == break_id
+    first = np.zeros(len(ids), dtype=bool)
+    first[(np.cumsum(lengths) - lengths)[lengths > 0]] = True
+    first[1:] |= is_break[:-1]
+
+    sentence_lengths = np.bincount((np.cumsum(first) - 1)[~is_break], minlength=first.sum())
+    sentence_starts = np.cumsum(sentence_lengths) - sentence_lengths
+    sentences = np.bincount(np.repeat(np.arange(len(segments)), lengths)[first], minlength=len(segments))
+    return ids[~is_break], sentence_starts, sentence_lengths, sentences
+
+
+def padded(words: np.ndarray, starts: np.ndarray, lengths: np.ndarray, pad: int) -> np.ndarray:
+    """ Matrix with a sequence of words in each row, padded to the longest one. """
+    columns = np.arange(lengths.max(initial=0))
+    inside = columns < lengths[:, None]
+    rows = np.full(inside.shape, pad, dtype=np.int64)
+    rows[inside] = words[(starts[:, None] + columns)[inside]]
+    return rows
+
+
+def lcs_tokens(
+    x: Tuple[np.ndarray, np.ndarray, np.ndarray], y: Tuple[np.ndarray, np.ndarray, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Longest common subsequence of pairs of sequences, reconstructed as the rouge
+    package does: walking back from the end of both sequences, a match is taken
+    when the last words are equal, otherwise x moves back only when that keeps a
+    strictly longer LCS.
+
+    :param x: Words, and start and length of the first sequence of each pair.
+    :param y: Words, and start and length of the second sequence of each pair.
+    :return: Pair index and word of every element of the reconstructed LCS.
+    """
+    x_words, x_starts, x_lengths = x
+    y_words, y_starts, y_lengths = y
+    sizes = np.maximum(x_lengths, y_lengths) ** 2
+    pairs, tokens = [], []
+    for batch in length_batches(sizes.tolist(), len(sizes), LCS_MAX_CELLS):
+        batch = np.array(batch)
+        # Padding of both sides never matches anything.
+        X = padded(x_words, x_starts[batch], x_lengths[batch], -1)
+        Y = padded(y_words, y_starts[batch], y_lengths[batch], -2)
+
+        # table[:, i, j] is the LCS of x[:i] and y[:j]. A match always gives the
+        # maximum of the row so far, so each row is a running maximum.
+        table = np.zeros((len(batch), X.shape[1] + 1, Y.shape[1] + 1), dtype=np.int32)
+        for i in range(1, X.shape[1] + 1):
+            previous = table[:, i - 1]
+            candidates = np.where(X[:, i - 1 : i] == Y, previous[:, :-1] + 1, previous[:, 1:])
+            table[:, i, 1:] = np.maximum.accumulate(candidates, axis=1)
+
+        rows = np.arange(len(batch))
+        i, j = x_lengths[batch].copy(), y_lengths[batch].copy()
+        active = (i > 0) & (j > 0)
+        while active.any():
+            i_1, j_1 = np.maximum(i - 1, 0), np.maximum(j - 1, 0)
+            x_last = X[rows, i_1]
+            match = active & (x_last == Y[rows, j_1])
+            pairs.append(batch[match])
+            tokens.append(x_last[match])
+            up = active & ~match & (table[rows, i_1, j] > table[rows, i, j_1])
+            left = active & ~match & ~up
+            i -= match | up
+            j -= match | left
+            active = (i > 0) & (j > 0)
+
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pairs), np.concatenate(tokens)
+
+
+def lcs_overlap(hyp_ids: List[np.ndarray], ref_ids: List[np.ndarray], break_id: int) -> np.ndarray:
+    """
+    Summary level LCS of each segment: number of distinct words of the union of
+    the LCS of every (reference sentence, candidate sentence) pair.
+    """
+    n = len(hyp_ids)
+    hyp_words, hyp_starts, hyp_lengths, hyp_sentences = split_sentences(hyp_ids, break_id)
+    ref_words, ref_starts, ref_lengths, ref_sentences = split_sentences(ref_ids, break_id)
+
+    # Every reference sentence of a segment is paired with every candidate sentence.
+    num_pairs = ref_sentences * hyp_sentences
+    pair_segments = np.repeat(np.arange(n), num_pairs)
+    k = np.arange(len(pair_segments)) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+    per_row = hyp_sentences[pair_segments]
+    ref_pairs = (np.cumsum(ref_sentences) - ref_sentences)[pair_segments] + k // np.maximum(per_row, 1)
+    hyp_pairs = (np.cumsum(hyp_sentences) - hyp_sentences)[pair_segments] + k % np.maximum(per_row, 1)
+
+    pairs, tokens = lcs_tokens(
+        (ref_words, ref_starts[ref_pairs], ref_lengths[ref_pairs]),
+        (hyp_words, hyp_starts[hyp_pairs], hyp_lengths[hyp_pairs]),
+    )
+    vocab_size = int(tokens.max(initial=0)) + 1
+    union = np.unique(pair_segments[pairs] * vocab_size + tokens)
+    return np.bincount(union // vocab_size, minlength=n)
+
+
+def rouge_scores(cand: List[str], ref: List[str], variants: Sequence[str] = VARIANTS) -> ROUGEScores:
+    """ ROUGE variants (ROUGE-1, ROUGE-2 and/or ROUGE-L) of each segment of a corpus. """
+    cache = token_cache()
+    hyp_ids = cache.token_ids("rouge", False, cand)
+    ref_ids = cache.token_ids("rouge", False, ref)
+    break_id = int(cache.intern([SENTENCE_BREAK])[0])
+
+    hyp_words = [ids[ids != break_id] for ids in hyp_ids]
+    ref_words = [ids[ids != break_id] for ids in ref_ids]
+    scores = {}
+    if "rouge-1" in variants or "rouge-l" in variants:
+        unigrams = ngram_counts(hyp_words, ref_words, 1)
+    if "rouge-1" in variants:
+        scores["rouge-1"] = f_p_r(*unigrams)
+    if "rouge-2" in variants:
+        scores["rouge-2"] = f_p_r(*ngram_counts(hyp_words, ref_words, 2))
+    if "rouge-l" in variants:
+        # ROUGE-L divides by the number of distinct words, i.e. of distinct unigrams.
+        _, evaluated, reference = unigrams
+        scores["rouge-l"] = f_p_r(lcs_overlap(hyp_ids, ref_ids, break_id), evaluated, reference)
+    return ROUGEScores(scores)
+
+
+def shared_rouge_scores(cand: List[str], ref: List[str]) -> ROUGEScores:
+    """
+    All ROUGE variants of each segment of a corpus, computed once per (cand, ref)
+    pair of columns and shared by the ROUGE metrics until the end of the run.
+    """
+    key = (column_digest(cand), column_digest(ref))
+    with _SHARED_SCORES_LOCK:
+        if key in _SHARED_SCORES:
+            _SHARED_SCORES.move_to_end(key)
+            return _SHARED_SCORES[key]
+    scores = rouge_scores(cand, ref)
+    with _SHARED_SCORES_LOCK:
+        _SHARED_SCORES[key] = scores
+        if len(_SHARED_SCORES) > MAX_SHARED_SCORES:
+            _SHARED_SCORES.popitem(last=False)
+    return scores
+
+
+class ROUGEMetric(MergeableShards, Metric):
+    """ A ROUGE variant, read from the scores of all variants of the corpus. """
+
+    segment_level = True
+    # Variant (see VARIANTS) and result class of the metric.
+    variant = None
+    result_class = MetricResult
+
+    def score(self, src: List[str], cand: List[str], ref: List[str]) -> MetricResult:
+        return self.result_from_scores(src, cand, ref, shared_rouge_scores(cand, ref))
+
+    def result_from_scores(
+        self, src: List[str], cand: List[str], ref: List[str], scores: ROUGEScores
+    ) -> MetricResult:
+        corpus = scores.corpus(self.variant)
+        return self.result_class(
+            corpus["f"], scores.segments(self.variant), src, cand, ref, self.name,
+            corpus["p"], corpus["r"], scores.scores[self.variant])
+
+    def shard_values(self, result: MetricResult) -> list:
+        """ F-score, precision and recall of each segment. """
+        return np.asarray(result.seg_fpr).tolist()
+
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> MetricResult:
+        scores = ROUGEScores({self.variant: np.array(values, dtype=np.float64).reshape(-1, 3)})
+        return self.result_from_scores(src, cand, ref, scores)
@@ -1,5 +1,6 @@
 from typing import List
 
+import numpy as np
 from telescope.metrics.result import MetricResult
 
 
@@ -13,11 +14,17 @@ class ROUGETwoResult(MetricResult):
         ref: List[str],
         metric: str,
         precision: float,
-        recall: float
+        recall: float,
+        seg_fpr: np.ndarray = None,
     ) -> None:
+        """
+        :param seg_fpr: (segments, 3) matrix with the F-score, precision and recall
+            of each segment.
+        """
         super().__init__(sys_score, seg_scores, src, cand, ref, metric)
         self.precision = precision
         self.recall = recall
+        self.seg_fpr = seg_fpr
 
     def __str__(self):
         return f"{self.metric}({self.sys_score}), Precision = {self.precision}, Recall = {self.recall}"
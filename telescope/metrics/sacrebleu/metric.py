@@ -14,19 +14,83 @@
 # limitations under the License.
 from typing import List
 
-from telescope.metrics.metric import Metric
+import numpy as np
+from telescope.metrics.metric import Metric, SufficientStatistics
 from telescope.metrics.sacrebleu.result import BLEUResult
+from telescope.metrics.tokenization import token_cache
 
-import sacrebleu
+from sacrebleu.metrics import BLEU
 
+MAX_NGRAM_ORDER = 4
 
-class sacreBLEU(Metric):
+
+def ngram_statistics(hyp_ids: List[np.ndarray], ref_ids: List[np.ndarray]) -> np.ndarray:
+    """
+    BLEU statistics of each (hypothesis, reference) pair of token id arrays, in the
+    sacrebleu layout: hypothesis and reference lengths, clipped n-gram matches and
+    hypothesis n-grams of each order. All segments are counted at once: at each
+    order, the n-grams are numbered by extending the (n-1)-grams with their next
+    token and the counts of equal (segment, n-gram) keys are compared on both sides.
+    """
+    n = len(hyp_ids)
+    lengths = np.array([len(ids) for ids in hyp_ids + ref_ids], dtype=np.int64)
+    tokens = np.concatenate(hyp_ids + ref_ids) if n else np.zeros(0, dtype=np.int64)
+    tokens = np.unique(tokens, return_inverse=True)[1].astype(np.int64)
+    vocab_size = int(tokens.max(initial=0)) + 1
+    sequences = np.repeat(np.arange(2 * n), lengths)
+    remaining = np.repeat(np.cumsum(lengths), lengths) - np.arange(len(tokens))
+
+    stats = np.zeros((n, 2 + 2 * MAX_NGRAM_ORDER), dtype=np.int64)
+    stats[:, 0], stats[:, 1] = lengths[:n], lengths[n:]
+    keys = tokens
+    for order in range(1, MAX_NGRAM_ORDER + 1):
+        if order > 1:
+            following = tokens[np.minimum(np.arange(len(tokens)) + order - 1, len(tokens) - 1)]
+            keys = np.unique(keys * vocab_size + following, return_inverse=True)[1].astype(np.int64)
+        starts = remaining >= order
+        num_keys = int(keys.max(initial=0)) + 1
+        segment_keys = (sequences[starts] % max(n, 1)) * num_keys + keys[starts]
+        is_hyp = sequences[starts] < n
+        hyp_keys, hyp_counts = np.unique(segment_keys[is_hyp], return_counts=True)
+        ref_keys, ref_counts = np.unique(segment_keys[~is_hyp], return_counts=True)
+        shared, hyp_index, ref_index = np.intersect1d(
+            hyp_keys, ref_keys, assume_unique=True, return_indices=True
+        )
+        matches = np.minimum(hyp_counts[hyp_index], ref_counts[ref_index])
+        stats[:, 1 + order] = np.bincount(shared // num_keys, weights=matches, minlength=n)
+        stats[:, 1 + MAX_NGRAM_ORDER + order] = np.maximum(lengths[:n] - order + 1, 0)
+    return stats
+
+
+class sacreBLEU(SufficientStatistics, Metric):
 
     name = "BLEU"
-    segment_level = False
+    segment_level = True
+
+    @staticmethod
+    def token_ids(segments: List[str]) -> List[np.ndarray]:
+        """ Segments tokenized with the 13a tokenizer through the shared token cache. """
+        return token_cache().token_ids("13a", False, segments)
 
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> BLEUResult:
-        bleu = sacrebleu.corpus_bleu(cand, [ref])
+        return self.result_from_statistics(src, cand, ref, self.segment_statistics(src, cand, ref))
+
+    def result_from_statistics(
+        self, src: List[str], cand: List[str], ref: List[str], stats: np.ndarray
+    ) -> BLEUResult:
+        bleu = BLEU(tokenize="none")._compute_score_from_stats(stats.sum(axis=0).tolist())
+        # Sentence BLEU with effective order, as sacrebleu.sentence_bleu.
+        sentence_bleu = BLEU(tokenize="none", effective_order=True)
+        seg_scores = [
+            sentence_bleu._compute_score_from_stats(row).score / 100 for row in stats.tolist()
+        ]
         return BLEUResult(
-            bleu.score / 100, [], src, cand, ref, self.name, bleu.precisions, bleu.bp
+            bleu.score / 100, seg_scores, src, cand, ref, self.name, bleu.precisions, bleu.bp, stats
         )
+
+    def segment_statistics(self, src: List[str], cand: List[str], ref: List[str]) -> np.ndarray:
+        """ Hypothesis/reference lengths and n-gram matches/totals of each segment. """
+        return ngram_statistics(self.token_ids(cand), self.token_ids(ref)).astype(np.int32)
+
+    def score_from_statistics(self, stats: np.ndarray) -> float:
+        return BLEU()._compute_score_from_stats(stats.tolist()).score / 100
@@ -14,6 +14,7 @@
 # limitations under the License.
 from typing import List
 
+import numpy as np
 from telescope.metrics.result import MetricResult
 
 
@@ -28,10 +29,16 @@ class BLEUResult(MetricResult):
         metric: str,
         precisions: List[float],
         brevity_penalty: float,
+        stats: np.ndarray = None,
     ) -> None:
+        """
+        :param stats: (segments, statistics) matrix with the sacrebleu sufficient
+            statistics of each segment.
+        """
         super().__init__(sys_score, seg_scores, src, cand, ref, metric)
         self.precisions = precisions
         self.brevity_penalty = brevity_penalty
+        self.stats = stats
 
     def __str__(self):
         return f"{self.metric}({self.sys_score}, Precisions = {self.precisions}, Brevity Penalty = {self.brevity_penalty})"
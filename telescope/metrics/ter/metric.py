@@ -12,18 +12,93 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 
-import sacrebleu
-from telescope.metrics.metric import Metric
+import numpy as np
+from sacrebleu.metrics import TER as SacreTER
+from sacrebleu.metrics.lib_ter import translation_edit_rate
+from telescope.metrics.metric import Metric, SufficientStatistics
 from telescope.metrics.ter.result import TERResult
+from telescope.metrics.tokenization import token_cache
 
+if "TER_WORKERS" in os.environ:
+    WORKERS = int(os.environ["TER_WORKERS"])
+else:
+    WORKERS = 1
 
-class TER(Metric):
+# Shards per worker: the pool hands them out as workers become free.
+SHARDS_PER_WORKER = 8
+
+
+def shard_statistics(shard: Tuple[List[List[int]], List[List[int]]]) -> list:
+    """
+    Edit statistics of a shard of (candidate, reference) segments given as token ids.
+    The edit distance only compares tokens, so ids give the same edits as words.
+    """
+    cand, ref = shard
+    return [translation_edit_rate(c, r) for c, r in zip(cand, ref)]
+
+
+class TER(SufficientStatistics, Metric):
 
     name = "TER"
-    segment_level = False
+    segment_level = True
+    higher_is_better = False
+
+    def __init__(self, language: str = "X", labels: List[str] = [" "], workers: int = WORKERS):
+        """
+        :param language: Language of the evaluated text.
+        :param labels: Unused, kept for the common metric signature.
+        :param workers: Number of processes used to compute the edits of shards of segments.
+        """
+        super().__init__(language, labels)
+        self.workers = workers
+
+    @staticmethod
+    def token_ids(segments: List[str]) -> List[List[int]]:
+        """
+        Token ids of the segments tokenized and lowercased (as the default case
+        insensitive TER does) through the shared token cache.
+        """
+        return [ids.tolist() for ids in token_cache().token_ids("tercom", True, segments)]
 
     def score(self, src: List[str], cand: List[str], ref: List[str]) -> TERResult:
-        ter = sacrebleu.corpus_ter(cand, [ref])
-        return TERResult(ter.score/100, [], src, cand, ref, self.name, ter.num_edits)
+        return self.result_from_statistics(src, cand, ref, self.segment_statistics(src, cand, ref))
+
+    def result_from_statistics(
+        self, src: List[str], cand: List[str], ref: List[str], stats: np.ndarray
+    ) -> TERResult:
+        ter = SacreTER()
+        seg_scores = [ter._compute_score_from_stats(row).score / 100 for row in stats.tolist()]
+        corpus = ter._compute_score_from_stats(stats.sum(axis=0).tolist())
+        return TERResult(corpus.score / 100, seg_scores, src, cand, ref, self.name, corpus.num_edits, stats)
+
+    def segment_statistics(self, src: List[str], cand: List[str], ref: List[str]) -> np.ndarray:
+        """
+        Number of edits and reference length of each segment. With several workers
+        the segments are dealt, longest first, into shards of similar cost that are
+        processed in parallel.
+        """
+        cand, ref = self.token_ids(cand), self.token_ids(ref)
+        num_shards = min(self.workers * SHARDS_PER_WORKER, len(cand))
+        if self.workers <= 1 or num_shards <= 1:
+            return np.array(shard_statistics((cand, ref)), dtype=np.float64).reshape(-1, 2)
+
+        # The shift search grows with the length of both segments.
+        cost = [len(c) * len(r) for c, r in zip(cand, ref)]
+        order = sorted(range(len(cand)), key=lambda i: -cost[i])
+        shards = [order[i::num_shards] for i in range(num_shards)]
+        with ProcessPoolExecutor(max_workers=min(self.workers, num_shards)) as executor:
+            shard_stats = executor.map(
+                shard_statistics,
+                [([cand[i] for i in shard], [ref[i] for i in shard]) for shard in shards],
+            )
+            stats = np.zeros((len(cand), 2), dtype=np.float64)
+            for shard, rows in zip(shards, shard_stats):
+                stats[shard] = rows
+        return stats
+
+    def score_from_statistics(self, stats: np.ndarray) -> float:
+        return SacreTER()._compute_score_from_stats(stats.tolist()).score / 100
@@ -14,6 +14,7 @@
 # limitations under the License.
 from typing import List
 
+import numpy as np
 from telescope.metrics.result import MetricResult
 
 
@@ -27,9 +28,15 @@ class TERResult(MetricResult):
         ref: List[str],
         metric: str,
         num_edits: float,
+        stats: np.ndarray = None,
     ) -> None:
+        """
+        :param stats: (segments, 2) matrix with the number of edits and the reference
+            length of each segment.
+        """
         super().__init__(sys_score, seg_scores, src, cand, ref, metric)
         self.num_edits = num_edits
+        self.stats = stats
 
     def __str__(self):
         return f"{self.metric}({self.sys_score}, num_edits={self.num_edits})"
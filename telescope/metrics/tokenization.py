@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Shared tokenization cache
+==============
+String metrics (BLEU, TER, GLEU, ...) tokenize the same candidates and references
+over and over: once per metric and, for references, once per system. Tokenized
+segments are kept in a process-wide cache keyed by (tokenizer, lowercase, text)
+and stored as arrays of interned token ids, so every distinct segment is
+tokenized once per evaluation run.
+
+Tokenizers are named:
+    - any sacrebleu tokenizer ("13a", "intl", "zh", "ja-mecab", ...): its tokens;
+    - "<sacrebleu tokenizer>-chars": the characters of the tokenized segment;
+    - "tercom": the tokens of the (case sensitive) TER tokenizer;
+    - "space": the segment split on single spaces;
+    - "rouge": the words of the sentences of the segment (split on "." as the rouge
+      package does), with a SENTENCE_BREAK token between sentences.
+
+Lowercasing is applied to the tokenized segment. The cache keeps at most
+TELESCOPE_TOKEN_CACHE segments (least recently used ones are dropped) and is
+released at the end of a `tokenization_run` block.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, List
+
+import numpy as np
+from sacrebleu.metrics.bleu import _get_tokenizer
+from sacrebleu.tokenizers.tokenizer_ter import TercomTokenizer
+
+if "TELESCOPE_TOKEN_CACHE" in os.environ:
+    CACHE_SEGMENTS = int(os.environ["TELESCOPE_TOKEN_CACHE"])
+else:
+    CACHE_SEGMENTS = 1000000
+
+# Words never contain whitespace, so a newline cannot be confused with a word.
+SENTENCE_BREAK = "\n"
+
+
+def rouge_words(text: str) -> List[str]:
+    words = []
+    for sentence in text.split("."):
+        if len(sentence) > 0:
+            if words:
+                words.append(SENTENCE_BREAK)
+            words.extend(" ".join(sentence.split()).split(" "))
+    return words
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str, lowercase: bool = False) -> Callable[[str], List[str]]:
+    """ Function that splits a segment into the tokens of the named tokenizer. """
+    lower = str.lower if lowercase else str
+    if name == "space":
+        return lambda text: lower(text.strip("\n")).split(" ")
+    if name == "rouge":
+        return lambda text: rouge_words(lower(text))
+    if name == "tercom":
+        tokenizer = TercomTokenizer(case_sensitive=True)
+        return lambda text: lower(tokenizer(text.rstrip())).split()
+    if name.endswith("-chars"):
+        tokenizer = _get_tokenizer(name[: -len("-chars")])()
+        return lambda text: list(lower(tokenizer(text.strip("\n"))))
+    tokenizer = _get_tokenizer(name)()
+    return lambda text: lower(tokenizer(text.rstrip())).split()
+
+
+class TokenCache:
+    def __init__(self, max_segments: int = CACHE_SEGMENTS):
+        """
+        :param max_segments: Maximum number of tokenized segments kept in memory.
+        """
+        self.max_segments = max_segments
+        self.hits = 0
+        self.misses = 0
+        self._vocab = {}
+        self._tokens = []
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    @property
+    def vocab_size(self) -> int:
+        return len(self._tokens)
+
+    def intern(self, tokens: List[str]) -> np.ndarray:
+        """ Ids of the tokens, adding the new ones to the vocabulary. """
+        vocab = self._vocab
+        ids = np.empty(len(tokens), dtype=np.int32)
+        for i, token in enumerate(tokens):
+            token_id = vocab.get(token)
+            if token_id is None:
+                token_id = vocab[token] = len(self._tokens)
+                self._tokens.append(token)
+            ids[i] = token_id
+        return ids
+
+    def token_ids(self, tokenizer: str, lowercase: bool, segments: List[str]) -> List[np.ndarray]:
+        """
+        Token ids of each segment, tokenizing only the segments that are not cached.
+
+        :param tokenizer: Name of the tokenizer.
+        :param lowercase: Lowercase the tokenized segments.
+        :param segments: Segments to tokenize.
+        """
+        # Any truthy flag shares the cached tokenizer (and tokens) of True.
+        lowercase = bool(lowercase)
+        tokenize = get_tokenizer(tokenizer, lowercase)
+        result = []
+        with self._lock:
+            for text in segments:
+                key = (tokenizer, lowercase, text)
+                ids = self._segments.get(key)
+                if ids is None:
+                    self.misses += 1
+                    ids = self.intern(tokenize(text))
+                    ids.setflags(write=False)
+                    self._segments[key] = ids
+                    if len(self._segments) > self.max_segments:
+                        self._segments.popitem(last=False)
+                else:
+                    self.hits += 1
+                    self._segments.move_to_end(key)
+                result.append(ids)
+        return result
+
+    def tokens(self, ids: np.ndarray) -> List[str]:
+        """ Tokens of an array of ids. """
+        if len(ids) == 0:
+            return []
+        if len(ids) == 1:
+            return [self._tokens[ids[0]]]
+        return list(itemgetter(*ids.tolist())(self._tokens))
+
+    def tokenized(self, tokenizer: str, lowercase: bool, segments: List[str]) -> List[str]:
+        """ Segments tokenized (tokens joined by spaces) by the named tokenizer. """
+        return [" ".join(self.tokens(ids)) for ids in self.token_ids(tokenizer, lowercase, segments)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._segments.clear()
+            self._vocab.clear()
+            self._tokens.clear()
+
+
+_TOKEN_CACHE = TokenCache()
+_RUN_DEPTH = 0
+# Other caches released with the tokens at the end of a run (see `register_run_cache`).
+_RUN_CACHES = []
+
+
+def token_cache() -> TokenCache:
+    """ Tokenization cache shared by all string metrics. """
+    return _TOKEN_CACHE
+
+
+def register_run_cache(cache) -> None:
+    """ Clears a cache (any object with a clear method) when the outermost run exits. """
+    _RUN_CACHES.append(cache)
+
+
+@contextmanager
+def tokenization_run():
+    """
+    Scope of an evaluation run: tokenizations are shared inside the block and
+    released when the outermost block exits.
+    """
+    global _RUN_DEPTH
+    _RUN_DEPTH += 1
+    try:
+        yield _TOKEN_CACHE
+    finally:
+        _RUN_DEPTH -= 1
+        if _RUN_DEPTH == 0:
+            _TOKEN_CACHE.clear()
+            for cache in _RUN_CACHES:
+                cache.clear()
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import os
+from typing import List
 
 
 def telescope_cache_folder():
@@ -23,3 +24,25 @@ def telescope_cache_folder():
         return cache_directory
     else:
         raise Exception("HOME environment variable is not defined.")
+
+
+def length_batches(lengths: List[int], batch_size: int, max_tokens: int) -> List[List[int]]:
+    """
+    Groups the segment ids by length. Batches have at most batch_size segments and
+    at most max_tokens tokens once padded to their longest segment (a segment
+    longer than max_tokens gets a batch of its own).
+
+    :param lengths: Length (in tokens) of each segment.
+    :return: List with the ids of the segments of each batch.
+    """
+    batches, batch, longest = [], [], 0
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        longest_with_i = max(longest, lengths[i])
+        if batch and (len(batch) >= batch_size or (len(batch) + 1) * longest_with_i > max_tokens):
+            batches.append(batch)
+            batch, longest_with_i = [], lengths[i]
+        batch.append(i)
+        longest = longest_with_i
+    if batch:
+        batches.append(batch)
+    return batches
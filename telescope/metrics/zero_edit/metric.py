@@ -14,11 +14,11 @@
 # limitations under the License.
 from typing import List
 
-from telescope.metrics.metric import Metric
+from telescope.metrics.metric import MergeableShards, Metric
 from telescope.metrics.zero_edit.result import ZeroEditResult
 
 
-class ZeroEdit(Metric):
+class ZeroEdit(MergeableShards, Metric):
 
     name = "ZeroEdit"
     segment_level = True
@@ -31,3 +31,8 @@ class ZeroEdit(Metric):
         return ZeroEditResult(
             sum(scores) / len(scores), scores, src, cand, ref, self.name, sum(scores)
         )
+
+    def merge_shards(self, src: List[str], cand: List[str], ref: List[str], values: list) -> ZeroEditResult:
+        return ZeroEditResult(
+            sum(values) / len(values), values, src, cand, ref, self.name, sum(values)
+        )
@@ -3,10 +3,13 @@ import os
 import streamlit as st
 import numpy as np
 
+from functools import partial
 from typing import List, Dict
+from telescope.metrics.bootstrap import new_seed, run_bootstraps
 from telescope.collection_testsets import CollectionTestsets, NLGTestsets, ClassTestsets
 from telescope.plotting import (
     plot_bootstraping_result,
+    plot_all_pairs_bootstrap,
     plot_bucket_multiple_comparison,
     plot_multiple_distributions,
     plot_multiple_segment_comparison,
@@ -58,11 +61,13 @@ class NLGPlot(Plot):
         task: str,
         num_samples: float,
         sample_ratio: float,
+        workers: int = 1,
     ) -> None:
 
         super().__init__(metric, metrics, available_metrics, results, collection_testsets, ref_filename, task)
         self.num_samples = num_samples
         self.sample_ratio = sample_ratio
+        self.workers = workers
 
 
     def display_plots(self) -> None:
@@ -120,15 +125,36 @@ class NLGPlot(Plot):
                     )
                     st.subheader("Bootstrap resampling results:")
                     with st.spinner("Running bootstrap resampling..."):
-                        for self.metric in self.metrics:
-                            bootstrap_result = self.available_metrics[self.metric].multiple_bootstrap_resampling(
+                        bootstraps = [
+                            partial(self.available_metrics[metric].multiple_bootstrap_resampling,
                                 self.collection_testsets.testsets[self.ref_filename], int(self.num_samples), 
-                                self.sample_ratio, system_x_id, system_y_id, self.collection_testsets.target_language, self.results[self.metric])
-
+                                self.sample_ratio, system_x_id, system_y_id, self.collection_testsets.target_language, 
+                                self.results[metric], seed=new_seed())
+                            for metric in self.metrics
+                        ]
+                        for bootstrap_result in run_bootstraps(bootstraps, int(self.workers)):
                             plot_bootstraping_result(bootstrap_result)
 
-
-    def display_plots_cli(self, saving_dir:str, system_x:str, system_y:str) -> None:
+            st.header(":blue[All-pairs bootstrap resampling:]")
+            _, middle, _ = st.columns(3)
+            if middle.button("Perform All-Pairs Bootstrap Resampling", key = self.ref_filename + "_all_pairs"):
+                with st.spinner("Running bootstrap resampling between all systems..."):
+                    for bootstrap_result in self.all_pairs_bootstrap():
+                        plot_all_pairs_bootstrap(bootstrap_result, self.collection_testsets.systems_names)
+
+    def all_pairs_bootstrap(self) -> list:
+        """ Bootstrap resampling between every pair of systems, for each metric. """
+        bootstraps = [
+            partial(self.available_metrics[metric].all_pairs_bootstrap_resampling,
+                self.collection_testsets.testsets[self.ref_filename], int(self.num_samples), 
+                self.sample_ratio, self.collection_testsets.target_language, 
+                self.results[metric], seed=new_seed())
+            for metric in self.metrics
+        ]
+        return run_bootstraps(bootstraps, int(self.workers))
+
+
+    def display_plots_cli(self, saving_dir:str, system_x:str, system_y:str, all_pairs_results: list = None) -> None:
         
         if self.metric == "COMET" or self.metric == "BERTScore":
             plot_bucket_multiple_comparison(self.results[self.metric], self.collection_testsets.names_of_systems(), 
@@ -139,10 +165,10 @@ class NLGPlot(Plot):
                                     saving_dir)
         
         if len(self.collection_testsets.systems_indexes.values()) > 1: 
-            if ((system_x.name in self.collection_testsets.systems_indexes) 
-                and (system_y.name in list(self.collection_testsets.systems_indexes))):
-                x_id = self.collection_testsets.systems_indexes[system_x.name]
-                y_id = self.collection_testsets.systems_indexes[system_y.name]
+            if (system_x and system_y and (system_x in self.collection_testsets.systems_indexes) 
+                and (system_y in list(self.collection_testsets.systems_indexes))):
+                x_id = self.collection_testsets.systems_indexes[system_x]
+                y_id = self.collection_testsets.systems_indexes[system_y]
             
             else:
                 x_id = self.collection_testsets.indexes_of_systems()[0]
@@ -155,6 +181,10 @@ class NLGPlot(Plot):
             else:
                 plot_multiple_segment_comparison(self.results[self.metric],x,y,saving_dir=saving_dir)
 
+        if all_pairs_results:
+            for bootstrap_result in all_pairs_results:
+                plot_all_pairs_bootstrap(bootstrap_result, self.collection_testsets.systems_names, saving_dir)
+
 class ClassificationPlot(Plot):
     def __init__(
         self,
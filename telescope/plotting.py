@@ -20,13 +20,15 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import plotly.figure_factory as ff
+import plotly.graph_objects as go
 import streamlit as st
 import random
 
 from streamlit import runtime
-from sklearn.metrics import confusion_matrix, multilabel_confusion_matrix, ConfusionMatrixDisplay
+from sklearn.metrics import ConfusionMatrixDisplay
+from telescope.metrics.classification import confusion_matrix
 from telescope.testset import MultipleTestset
-from telescope.metrics.result import BootstrapResult, PairwiseResult, MultipleResult
+from telescope.metrics.result import BootstrapResult, PairwiseResult, MultipleResult, AllPairsBootstrapResult
 
 T1_COLOR = "#9ACD32"
 T2_COLOR = "#56C3FF"
@@ -662,11 +664,45 @@ def plot_multiple_segment_comparison(multiple_result: MultipleResult, system_x:
     if runtime.exists():
         st.altair_chart(c, use_container_width=True)
 
+def plot_all_pairs_bootstrap(bootstrap_result: AllPairsBootstrapResult, systems_names: Dict[str, str],
+                            saving_dir: str = None) -> None:
+    win_rate = bootstrap_result.results_to_dataframe(systems_names, "win_rate")
+    p_value = bootstrap_result.results_to_dataframe(systems_names, "p_value")
+
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=win_rate.values,
+            x=list(win_rate.columns),
+            y=list(win_rate.index),
+            customdata=p_value.values,
+            zmin=0,
+            zmax=1,
+            colorscale="RdYlGn",
+            text=win_rate.values,
+            texttemplate="%{text:.2f}",
+            hovertemplate="%{y} better than %{x}: %{z:.2%}<br>p-value: %{customdata:.3f}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        title=bootstrap_result.metric + ": % of partitions where the row system beats the column system",
+        xaxis_title="System",
+        yaxis_title="System",
+        yaxis_autorange="reversed",
+    )
+
+    if saving_dir is not None:
+        if not os.path.exists(saving_dir):
+            os.makedirs(saving_dir)
+        fig.write_html(saving_dir + "/" + bootstrap_result.metric + "_all-pairs-bootstrap.html")
+
+    if runtime.exists():
+        st.plotly_chart(fig)
+
 def overall_confusion_matrix_table(testset:MultipleTestset ,system:str, labels: List[str], system_name:str,
                                 saving_dir: str = None):    
     true = testset.ref
     pred = testset.systems_output[system]
-    matrix = confusion_matrix(true, pred, labels=labels)
+    matrix = confusion_matrix(true, pred, labels).reindexed(labels)
     conf_mat = ConfusionMatrixDisplay(confusion_matrix=matrix,display_labels=labels)
     conf_mat.plot()
     plt.title("Confusion Matrix of " + system_name)
@@ -683,11 +719,10 @@ def singular_confusion_matrix_table(testset:MultipleTestset ,system:str, labels:
                                 label: List[str], system_name:str, saving_dir: str = None): 
     true = testset.ref
     pred = testset.systems_output[system] 
-    matrix = multilabel_confusion_matrix(true, pred, labels=labels)
-    index = labels.index(label)
+    matrix = confusion_matrix(true, pred, labels).label_matrix(label)
     name = ["other labels"] + [label] 
     
-    conf_mat = ConfusionMatrixDisplay(confusion_matrix=matrix[index],display_labels=name)
+    conf_mat = ConfusionMatrixDisplay(confusion_matrix=matrix,display_labels=name)
     conf_mat.plot()
     plt.title("Confusion Matrix of " + system_name)
 
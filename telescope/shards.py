@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""
+Sharded evaluation
+==============
+Large testsets can be scored in shards, e.g. on several machines. A shard run
+reads and filters the whole collection, scores the i-th of N contiguous slices of
+the segments of each reference and writes a partial result file with:
+    - the texts of the slice (sources, reference and system outputs);
+    - for every metric and system, the per-segment values from which the result
+      of the whole testset is rebuilt (`MergeableShards.shard_values`): sufficient
+      statistics for corpus-level metrics, segment scores for the others;
+    - the digest of the whole (filtered) testset and the collection settings.
+
+Merging concatenates the shards of each reference in order, checks that the
+texts have the digest recorded by every shard and rebuilds the results of every
+metric (`MergeableShards.merge_shards`), exactly as an unsharded run computes them.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+from telescope.collection_testsets import NLGTestsets
+from telescope.metrics.metric import Metric
+from telescope.metrics.result import MultipleResult
+from telescope.testset import MultipleTestset, TextColumn
+
+SHARD_FILENAME = "shard-{}-of-{}.json"
+SHARD_PATTERN = re.compile(r"shard-(\d+)-of-(\d+)\.json$")
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """ Index (from 1) and number of shards of an "i/N" string. """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", shard)
+    if match is None:
+        raise ValueError(f"{shard} is not of the form i/N (e.g. 2/8).")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"The shard index must be between 1 and {count}.")
+    return index, count
+
+
+def shard_bounds(size: int, index: int, count: int) -> Tuple[int, int]:
+    """
+    First and last (excluded) rows of the index-th of count contiguous slices of a
+    testset. Slice sizes differ by one segment at most.
+    """
+    each, extra = divmod(size, count)
+    start = (index - 1) * each + min(index - 1, extra)
+    return start, start + each + (index <= extra)
+
+
+def write_shard(
+    saving_dir: str,
+    collection: NLGTestsets,
+    ref_filename: str,
+    testset: MultipleTestset,
+    results: Dict[str, MultipleResult],
+    metrics: Dict[str, Metric],
+    seg_metric: str,
+    task: str,
+    shard: Tuple[int, int],
+    bounds: Tuple[int, int],
+    digest: str,
+    size: int,
+) -> str:
+    """
+    Writes the partial results of a shard.
+
+    :param saving_dir: Folder of the results of the reference.
+    :param testset: Rows of the shard.
+    :param results: Result of each metric on the rows of the shard (none if it is empty).
+    :param metrics: Metric object of each metric.
+    :param shard: Index and number of shards.
+    :param bounds: First and last (excluded) rows of the shard in the whole testset.
+    :param digest: Digest of the whole testset.
+    :param size: Number of segments of the whole testset.
+    :return: Path of the shard file.
+    """
+    index, count = shard
+    data = {
+        "shard": {"index": index, "count": count, "rows": list(bounds)},
+        "testset": {"digest": digest, "segments": size},
+        "task": task,
+        "seg_metric": seg_metric,
+        "ref_filename": ref_filename,
+        "collection": {
+            "src_name": collection.src_name,
+            "refs_names": list(collection.refs_names),
+            "refs_indexes": collection.refs_indexes,
+            "systems_indexes": collection.systems_indexes,
+            "systems_names": collection.systems_names,
+            "language_pair": collection.language_pair,
+        },
+        "src": list(testset.src),
+        "ref": list(testset.ref),
+        "systems_output": {name: list(output) for name, output in testset.systems_output.items()},
+        "metrics": {
+            name: {
+                system: metric.shard_values(results[name].systems_metric_results[system])
+                if len(testset) else []
+                for system in testset.systems_output
+            }
+            for name, metric in metrics.items()
+        },
+    }
+    path = os.path.join(saving_dir, SHARD_FILENAME.format(index, count))
+    with open(path, "w") as shard_file:
+        json.dump(data, shard_file)
+    return path
+
+
+def find_shards(paths: List[str]) -> List[str]:
+    """ Shard files among the given files and folders (folders are searched recursively). """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, filenames in sorted(os.walk(path)):
+                files += [os.path.join(folder, f) for f in sorted(filenames) if SHARD_PATTERN.search(f)]
+        else:
+            files.append(path)
+    return files
+
+
+def settings(data: dict, key: str):
+    """ Setting of a shard that must be the same in all the shards of a run. """
+    if key == "metrics":
+        return list(data["metrics"])
+    if key == "collection":
+        # Reference ids are numbered per process, so they may differ between runs.
+        return {k: v for k, v in data["collection"].items() if k != "refs_indexes"}
+    return data[key]
+
+
+def load_shards(paths: List[str]) -> Dict[str, List[dict]]:
+    """
+    Reads shard files and checks that they can be merged: every reference has all
+    its shards, from the same testset, and all shards share the same settings.
+
+    :param paths: Shard files or folders with shard files.
+    :return: Shards of each reference, sorted by index.
+    """
+    shards, first = {}, None
+    for path in find_shards(paths):
+        with open(path) as shard_file:
+            data = json.load(shard_file)
+        first = first or data
+        for key in ("task", "seg_metric", "metrics", "collection"):
+            if settings(data, key) != settings(first, key):
+                raise ValueError(f"{path} was not created with the same {key} as the other shards.")
+
+        ref_shards = shards.setdefault(data["ref_filename"], {})
+        index, count = data["shard"]["index"], data["shard"]["count"]
+        if index in ref_shards:
+            raise ValueError(f"Shard {index}/{count} of {data['ref_filename']} was found twice ({path}).")
+        ref_shards[index] = data
+
+    if not shards:
+        raise ValueError("No shard files were found.")
+    for ref_filename, ref_shards in shards.items():
+        first = next(iter(ref_shards.values()))
+        count, testset = first["shard"]["count"], first["testset"]
+        for data in ref_shards.values():
+            if data["shard"]["count"] != count or data["testset"] != testset:
+                raise ValueError(f"The shards of {ref_filename} come from different runs or testsets.")
+        missing = sorted(set(range(1, count + 1)) - set(ref_shards))
+        if missing:
+            raise ValueError(
+                f"Missing shards of {ref_filename}: " + ", ".join(f"{i}/{count}" for i in missing)
+            )
+        shards[ref_filename] = [ref_shards[index] for index in range(1, count + 1)]
+    return shards
+
+
+def concatenate(shards: List[dict], *keys: str) -> list:
+    """ Values of a (nested) key of every shard, in order. """
+    values = []
+    for data in shards:
+        for key in keys:
+            data = data[key]
+        values.extend(data)
+    return values
+
+
+def merge_shards(
+    shards: Dict[str, List[dict]], available_metrics: dict
+) -> Tuple[NLGTestsets, Dict[str, Dict[str, MultipleResult]]]:
+    """
+    Rebuilds the collection and the results of an unsharded run.
+
+    :param shards: Shards of each reference, sorted by index (see `load_shards`).
+    :param available_metrics: Metric class of each metric name.
+    :return: Collection with the testset of each reference and the result of each
+        metric for each reference.
+    """
+    first = next(iter(shards.values()))[0]
+    settings = first["collection"]
+    language = settings["language_pair"].split("-")[1]
+    metrics = {name: available_metrics[name](language=language) for name in first["metrics"]}
+    refs_names = [ref_filename for ref_filename in settings["refs_names"] if ref_filename in shards]
+
+    testsets, results = {}, {}
+    for ref_filename in refs_names:
+        ref_shards = shards[ref_filename]
+        src = TextColumn.from_lines(concatenate(ref_shards, "src"))
+        ref = TextColumn.from_lines(concatenate(ref_shards, "ref"))
+        outputs = {
+            system: TextColumn.from_lines(concatenate(ref_shards, "systems_output", system))
+            for system in ref_shards[0]["systems_output"]
+        }
+        testset = MultipleTestset(src, ref, outputs, [])
+        if testset.digest != ref_shards[0]["testset"]["digest"]:
+            raise ValueError(f"The segments of the shards of {ref_filename} do not match their testset.")
+        testsets[ref_filename] = testset
+
+        results[ref_filename] = {}
+        for name, metric in metrics.items():
+            results[ref_filename][name] = MultipleResult(
+                {
+                    system: metric.merge_shards(
+                        src, output, ref, concatenate(ref_shards, "metrics", name, system)
+                    )
+                    for system, output in outputs.items()
+                }
+            )
+
+    systems_indexes = settings["systems_indexes"]
+    collection = NLGTestsets(
+        settings["src_name"],
+        refs_names,
+        {ref_filename: settings["refs_indexes"][ref_filename] for ref_filename in refs_names},
+        systems_indexes,
+        settings["systems_names"],
+        [settings["src_name"]] + refs_names + list(systems_indexes.values()),
+        testsets,
+        settings["language_pair"],
+    )
+    return collection, results
@@ -10,8 +10,8 @@ class NLG(Task):
     @classmethod
     def plots_interface(cls, metric:str, metrics:list, available_metrics:dict, results:dict, 
                         collection_testsets: CollectionTestsets, ref_file: str,
-                        num_samples: int, sample_ratio: float) -> None:
+                        num_samples: int, sample_ratio: float, workers: int = 1) -> None:
         """ Interfave to display the plots"""
         return NLGPlot(metric,metrics,available_metrics,results,collection_testsets,
-                        ref_file,cls.name,num_samples,sample_ratio).display_plots()
+                        ref_file,cls.name,num_samples,sample_ratio,workers).display_plots()
 
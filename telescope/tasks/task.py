@@ -19,6 +19,6 @@ class Task(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def plots_interface(cls,metric:str, metrics:list, available_metrics:dict, results:dict, 
                         collection_testsets: CollectionTestsets, ref_file: str, 
-                        num_samples: int, sample_ratio: float) -> None:
+                        num_samples: int, sample_ratio: float, workers: int = 1) -> None:
         """ Interfave to display the plots"""
         pass
\ No newline at end of file
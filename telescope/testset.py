@@ -12,13 +12,235 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List, Tuple, Dict
+from collections.abc import Sequence
+from functools import cached_property
+from typing import List, Tuple, Dict, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 import streamlit as st
 
-from telescope.utils import read_lines
+from telescope.utils import LineFile, content_digest, read_lines, text_digest
+
+
+# Number of rows decoded at once when iterating over a text column.
+DECODE_CHUNK = 65536
+
+
+class TextColumn(Sequence):
+    def __init__(self, array: pa.Array) -> None:
+        """
+        Column of texts stored once in an Arrow string array. Reads as a sequence of
+        strings, decoded in chunks when iterated.
+
+        :param array: Arrow (large) string array with the text of each segment.
+        """
+        self.array = array
+
+    @classmethod
+    def from_lines(cls, lines: List[str]) -> "TextColumn":
+        if isinstance(lines, TextColumn):
+            return lines
+        if isinstance(lines, LineFile):
+            return cls(lines.to_arrow())
+        return cls(pa.array(lines, type=pa.large_string()))
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, i) -> Union[str, "TextColumn", "ColumnView"]:
+        if isinstance(i, (int, np.integer)):
+            return self.array[int(i)].as_py()
+        if isinstance(i, slice) and i.step in (None, 1):
+            # Arrow slices share the buffers of the array.
+            start, stop, _ = i.indices(len(self))
+            return TextColumn(self.array.slice(start, max(stop - start, 0)))
+        if isinstance(i, slice):
+            i = np.arange(len(self))[i]
+        return ColumnView(self, np.asarray(i, dtype=np.int64))
+
+    def __iter__(self):
+        for start in range(0, len(self), DECODE_CHUNK):
+            yield from self.array.slice(start, DECODE_CHUNK).to_pylist()
+
+    def iter_rows(self, rows: np.ndarray):
+        """ Texts of the given rows, decoded in chunks. """
+        for start in range(0, len(rows), DECODE_CHUNK):
+            yield from self.array.take(pa.array(rows[start : start + DECODE_CHUNK])).to_pylist()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TextColumn):
+            return self.array.equals(other.array)
+        return isinstance(other, (list, tuple, Sequence)) and self.tolist() == list(other)
+
+    def __add__(self, other) -> list:
+        return self.tolist() + list(other)
+
+    def __radd__(self, other) -> list:
+        return list(other) + self.tolist()
+
+    def __repr__(self) -> str:
+        return f"TextColumn({len(self)} rows, {self.nbytes} bytes)"
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+    @cached_property
+    def digest(self) -> str:
+        return text_digest(self.array)
+
+    def tolist(self) -> List[str]:
+        return self.array.to_pylist()
+
+
+class LabelColumn(Sequence):
+    def __init__(self, codes: np.ndarray, vocabulary: List[str]) -> None:
+        """
+        Column of labels stored as integer codes. Reads as a sequence of strings.
+
+        :param codes: Code of the label of each segment.
+        :param vocabulary: Label of each code.
+        """
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i) -> Union[str, "LabelColumn"]:
+        if isinstance(i, (int, np.integer)):
+            return self.vocabulary[self.codes[i]]
+        if isinstance(i, list):
+            i = np.asarray(i, dtype=np.int64)
+        return LabelColumn(self.codes[i], self.vocabulary)
+
+    def __iter__(self):
+        return map(self.vocabulary.__getitem__, self.codes.tolist())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, LabelColumn) and other.vocabulary == self.vocabulary:
+            return np.array_equal(self.codes, other.codes)
+        return isinstance(other, (list, tuple, LabelColumn)) and self.tolist() == list(other)
+
+    def __repr__(self) -> str:
+        return f"LabelColumn({self.tolist()})"
+
+    @cached_property
+    def digest(self) -> str:
+        # The digest of the labels, not of the codes: it does not depend on the vocabulary.
+        return text_digest(pa.array(self.vocabulary, type=pa.large_string()).take(pa.array(self.codes)))
+
+    def tolist(self) -> List[str]:
+        """ String view of the column. """
+        return list(self)
+
+
+def label_columns(columns: List[List[str]], labels: List[str] = ()) -> List[LabelColumn]:
+    """
+    Encodes columns of labels with one vocabulary: the given labels followed by
+    the other labels found in the columns, sorted.
+    """
+    if columns and all(isinstance(column, TextColumn) for column in columns):
+        encoded = pa.concat_arrays([column.array for column in columns]).dictionary_encode()
+        codes = encoded.indices.to_numpy(zero_copy_only=False)
+        uniques = encoded.dictionary.to_pylist()
+    else:
+        values = np.empty(sum(len(column) for column in columns), dtype=object)
+        values[:] = [label for column in columns for label in column]
+        codes, uniques = pd.factorize(values)
+        uniques = uniques.tolist()
+
+    given = set(labels)
+    vocabulary = list(labels) + sorted(set(uniques) - given)
+    index = {label: i for i, label in enumerate(vocabulary)}
+    dtype = np.min_scalar_type(max(len(vocabulary) - 1, 0))
+    codes = np.array([index[label] for label in uniques], dtype=dtype)[codes]
+
+    bounds = np.cumsum([len(column) for column in columns])[:-1]
+    return [LabelColumn(split, vocabulary) for split in np.split(codes, bounds)]
+
+
+class ColumnView(Sequence):
+    def __init__(self, base: List[str], rows: np.ndarray) -> None:
+        """
+        Rows of a column, read from the original list without copying it.
+
+        :param base: Original column.
+        :param rows: Indexes of the rows of the view in base.
+        """
+        self.base = base
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i) -> Union[str, "ColumnView"]:
+        if isinstance(i, (int, np.integer)):
+            return self.base[self.rows[i]]
+        if isinstance(i, list):
+            i = np.asarray(i, dtype=np.int64)
+        return ColumnView(self.base, self.rows[i])
+
+    def __iter__(self):
+        if isinstance(self.base, TextColumn):
+            return self.base.iter_rows(self.rows)
+        return map(self.base.__getitem__, self.rows.tolist())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, (list, tuple, Sequence)) and self.tolist() == list(other)
+
+    def __add__(self, other) -> list:
+        return self.tolist() + list(other)
+
+    def __radd__(self, other) -> list:
+        return list(other) + self.tolist()
+
+    def __reduce__(self):
+        # Processes receive the rows of the view, not the whole original column.
+        return list, (self.tolist(),)
+
+    def __repr__(self) -> str:
+        return f"ColumnView({self.tolist()})"
+
+    @cached_property
+    def digest(self) -> str:
+        if isinstance(self.base, TextColumn):
+            return text_digest(self.base.array.take(pa.array(self.rows)))
+        return column_digest(self.tolist())
+
+    def tolist(self) -> List[str]:
+        return list(self)
+
+
+def column_digest(column: Sequence) -> str:
+    """
+    Content digest of a column: columns with the same texts have the same digest,
+    whatever their storage.
+    """
+    if isinstance(column, (TextColumn, LabelColumn, ColumnView, LineFile)):
+        return column.digest
+    return text_digest(pa.array(list(column), type=pa.large_string()))
+
+
+def take(column: Sequence, rows: np.ndarray) -> Sequence:
+    """
+    Rows of a column. Label columns keep their codes; other columns become views
+    over the original list (views of views index the original list directly).
+    """
+    if isinstance(column, LabelColumn):
+        return column[rows]
+    if isinstance(column, ColumnView):
+        return ColumnView(column.base, column.rows[rows])
+    return ColumnView(column, rows)
 
 
 class Testset:
+
+    # References and their length buckets (see `LengthFilter.buckets`).
+    length_buckets = None
+
     def __init__(
         self,
         src: List[str],
@@ -45,10 +267,25 @@ class Testset:
         return self.src[i], self.mt[i], self.ref[i]
 
     def apply_filter(self, filter):
-        to_keep = filter.apply_filter()
-        self.src = [self.src[idx] for idx in to_keep]
-        self.mt = [self.mt[idx] for idx in to_keep]
-        self.ref = [self.ref[idx] for idx in to_keep]
+        self.apply_mask(filter.mask())
+
+    def apply_mask(self, mask: np.ndarray) -> None:
+        """ Keeps the rows selected by a boolean mask, as views over the current columns. """
+        self.take_rows(np.flatnonzero(mask))
+
+    def take_rows(self, rows: np.ndarray) -> None:
+        self.src = take(self.src, rows)
+        self.mt = take(self.mt, rows)
+        self.ref = take(self.ref, rows)
+
+    @property
+    def digest(self) -> str:
+        """ Identity of the testset: a digest of the content of its columns. """
+        return content_digest([column_digest(self.src), column_digest(self.mt), column_digest(self.ref)])
+
+    @staticmethod
+    def hash_func(testset):
+        return testset.digest
     
     @property
     def source_language(self):
@@ -92,9 +329,10 @@ class PairwiseTestset(Testset):
             len(system_x), len(ref)
         )
 
-    @staticmethod
-    def hash_func(testset):
-        return " ".join(testset.filenames)
+    @property
+    def digest(self) -> str:
+        columns = [self.src, self.system_x, self.system_y, self.ref]
+        return content_digest([self.language_pair] + [column_digest(column) for column in columns])
 
     @classmethod
     def read_data(cls):
@@ -140,12 +378,11 @@ class PairwiseTestset(Testset):
     def __getitem__(self, i) -> Tuple[str]:
         return self.src[i], self.system_x[i], self.system_y[i], self.ref[i]
 
-    def apply_filter(self, filter):
-        to_keep = filter.apply_filter()
-        self.src = [self.src[idx] for idx in to_keep]
-        self.system_x = [self.system_x[idx] for idx in to_keep]
-        self.system_y = [self.system_y[idx] for idx in to_keep]
-        self.ref = [self.ref[idx] for idx in to_keep]
+    def take_rows(self, rows: np.ndarray) -> None:
+        self.src = take(self.src, rows)
+        self.system_x = take(self.system_x, rows)
+        self.system_y = take(self.system_y, rows)
+        self.ref = take(self.ref, rows)
 
 
 class MultipleTestset(Testset):
@@ -165,9 +402,14 @@ class MultipleTestset(Testset):
         return tuple([self.src[i]] + [self.ref[i]]+ [output[i] 
             for output in list(self.systems_output.values())])
 
-    def apply_filter(self, filter):
-        to_keep = filter.apply_filter()
-        self.src = [self.src[idx] for idx in to_keep]
-        self.ref = [self.ref[idx] for idx in to_keep]
-        self.systems_output = {name: [output[idx] for idx in to_keep] 
-                                for name,output in self.systems_output.items()}
\ No newline at end of file
+    def take_rows(self, rows: np.ndarray) -> None:
+        self.src = take(self.src, rows)
+        self.ref = take(self.ref, rows)
+        self.systems_output = {name: take(output, rows) for name, output in self.systems_output.items()}
+
+    @property
+    def digest(self) -> str:
+        parts = [column_digest(self.src), column_digest(self.ref)]
+        for name, output in self.systems_output.items():
+            parts += [name, column_digest(output)]
+        return content_digest(parts)
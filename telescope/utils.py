@@ -13,8 +13,56 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import mmap
 import os
-from io import StringIO
+from collections.abc import Sequence
+from typing import List, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Bytes scanned at once when indexing the lines of a file.
+SCAN_CHUNK = 64 * 2 ** 20
+# Lines decoded at once when iterating over a file.
+DECODE_LINES = 65536
+
+
+def content_hasher():
+    """ Incremental hash of test set contents: xxh3 when xxhash is installed, blake2b otherwise. """
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_digest(parts: List[str]) -> str:
+    """ Digest of a sequence of strings (e.g. the digests of several columns). """
+    hasher = content_hasher()
+    hasher.update("\x1f".join(parts).encode())
+    return hasher.hexdigest()
+
+
+def text_digest(array: pa.Array) -> str:
+    """
+    Digest of the texts of an Arrow string array, computed over its offsets and
+    UTF-8 data buffers. Slices of an array and copies of the same texts have the
+    same digest.
+    """
+    array = array.cast(pa.large_string())
+    hasher = content_hasher()
+    hasher.update(np.int64(len(array)).tobytes())
+    if len(array) > 0:
+        _, offsets, data = array.buffers()
+        offsets = np.frombuffer(offsets, np.int64, len(array) + 1, 8 * array.offset)
+        hasher.update((offsets - offsets[0]).tobytes())
+        hasher.update(memoryview(data)[offsets[0] : offsets[-1]])
+    return hasher.hexdigest()
 
 
 def telescope_cache_folder():
@@ -27,9 +75,115 @@ def telescope_cache_folder():
         raise Exception("HOME environment variable is not defined.")
 
 
+class LineFile(Sequence):
+    def __init__(
+        self,
+        buffer: Union[bytes, memoryview, mmap.mmap],
+        path: str = None,
+        universal_newlines: bool = True,
+    ) -> None:
+        """
+        Stripped lines of a UTF-8 text, read from its buffer without copying it. The
+        offsets of the lines are found once, on first use, and lines are decoded
+        lazily (one at a time or in chunks when iterated).
+
+        :param buffer: Bytes of the text, e.g. a memory-mapped file.
+        :param path: Path of the file, used to reopen it in other processes.
+        :param universal_newlines: Lines end with "\n", "\r\n" or a lone "\r", as when
+            reading a file in text mode. Otherwise lines only end with "\n".
+        """
+        self.buffer = buffer
+        self.path = path
+        self.universal_newlines = universal_newlines
+        self._offsets = None
+        self._digest = None
+
+    @classmethod
+    def open(cls, path: str) -> "LineFile":
+        """ Lines of a file on disk, memory-mapped. """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return cls(b"", path)
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), path)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """ Start of each line and end of the last one (line i spans offsets[i]:offsets[i + 1]). """
+        if self._offsets is None:
+            size = len(self.buffer)
+            ends = [np.zeros(1, dtype=np.int64)]
+            for start in range(0, size, SCAN_CHUNK):
+                # The byte after the chunk tells whether its last "\r" starts a "\r\n".
+                count = min(SCAN_CHUNK + 1, size - start)
+                chunk = np.frombuffer(self.buffer, np.uint8, count, start)
+                breaks = newlines = chunk == ord("\n")
+                if self.universal_newlines:
+                    breaks = newlines | ((chunk == ord("\r")) & ~np.append(newlines[1:], False))
+                ends.append(np.flatnonzero(breaks[:SCAN_CHUNK]).astype(np.int64) + start + 1)
+            offsets = np.concatenate(ends)
+            # The last line may not end with a newline.
+            if offsets[-1] != size:
+                offsets = np.append(offsets, size)
+            self._offsets = offsets
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = range(len(self))[i]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.buffer[start:end]).decode("utf-8").strip()
+
+    def __iter__(self):
+        offsets = self.offsets
+        for first in range(0, len(self), DECODE_LINES):
+            last = min(first + DECODE_LINES, len(self))
+            text = bytes(self.buffer[offsets[first] : offsets[last]]).decode("utf-8")
+            if self.universal_newlines:
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            yield from (line.strip() for line in text.split("\n")[: last - first])
+
+    def __reduce__(self):
+        # Memory maps can not be pickled: other processes map the file again.
+        if self.path is not None:
+            return LineFile.open, (self.path,)
+        return list, (list(self),)
+
+    def __repr__(self) -> str:
+        return f"LineFile({self.path or 'buffer'}, {len(self.buffer)} bytes)"
+
+    @property
+    def digest(self) -> str:
+        """ Digest of the stripped lines (the same as for any column with these texts). """
+        if self._digest is None:
+            self._digest = text_digest(self.to_arrow())
+        return self._digest
+
+    def to_arrow(self) -> pa.Array:
+        """ Arrow string array with the stripped lines, built straight from the buffer. """
+        lines = pa.LargeStringArray.from_buffers(
+            len(self), pa.py_buffer(self.offsets), pa.py_buffer(self.buffer)
+        )
+        lines.validate(full=True)
+        return pc.utf8_trim_whitespace(lines)
+
+
+def file_lines(file) -> Sequence:
+    """
+    Stripped lines of an opened file. Files on disk are memory-mapped, other
+    streams (e.g. stdin) are read.
+    """
+    name = getattr(file, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return LineFile.open(name)
+    return [line.strip() for line in file.readlines()]
+
+
 def read_lines(file):
     if file is not None:
-        file = StringIO(file.getvalue().decode())
-        lines = [line.strip() for line in file.readlines()]
-        return lines
+        # Uploaded files only break lines on "\n", as they always did.
+        return LineFile(file.getbuffer(), universal_newlines=False)
     return None
@@ -12,10 +12,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
 import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
 from click.testing import CliRunner
+from telescope.metrics.cache import SegmentCache
 from telescope.cli import compare
 from tests.data import DATA_PATH
 
@@ -30,6 +34,19 @@ class TestCompareCli(unittest.TestCase):
     def setUp(self):
         self.runner = CliRunner()
 
+    def test_reports_segment_cache_stats(self):
+        args = ["-s", self.src, "-x", self.system_x, "-y", self.system_y, "-r", self.ref, "-l", "en",
+                "-m", "chrF", "--seg_metric", "GLEU"]
+        with tempfile.TemporaryDirectory() as folder:
+            cache = SegmentCache(os.path.join(folder, "cache.sqlite"))
+            with patch("telescope.cli.segment_cache", return_value=cache):
+                result = self.runner.invoke(compare, args, catch_exceptions=False)
+                self.assertNotIn("Segment cache", result.output)
+
+                cache.hits, cache.misses = 3, 2
+                result = self.runner.invoke(compare, args, catch_exceptions=False)
+                self.assertIn("Segment cache: 3 hits, 2 misses", result.output)
+
     def test_with_seg_metric(self):
         args = [
             "-s",
@@ -127,7 +144,10 @@ class TestCompareCli(unittest.TestCase):
         self.assertTrue(
             os.path.isfile(os.path.join(DATA_PATH, "results.json"))
         )
+        with open(os.path.join(DATA_PATH, "testset.json")) as testset_file:
+            self.assertEqual(json.load(testset_file)["segments"], 400)
         os.remove(DATA_PATH + "/segment-comparison.html")
         os.remove(DATA_PATH + "/scores-distribution.html")
         os.remove(DATA_PATH + "/bucket-analysis.png")
         os.remove(DATA_PATH + "/results.json")
+        os.remove(DATA_PATH + "/testset.json")
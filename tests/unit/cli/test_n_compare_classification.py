@@ -187,5 +187,6 @@ class TestCompareCli(unittest.TestCase):
             os.rmdir(DATA_PATH + "/" + self.ref.replace("/","_") + "/" + sys_name + "/" )
 
         os.remove(DATA_PATH + "/" + self.ref.replace("/","_") + "/results.json")
+        os.remove(DATA_PATH + "/" + self.ref.replace("/","_") + "/testset.json")
         os.remove(DATA_PATH + "/" + self.ref.replace("/","_") + "/analysis-labels-bucket.png")
         os.rmdir(DATA_PATH + "/" + self.ref.replace("/","_"))
@@ -12,11 +12,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
 import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
 from click.testing import CliRunner
-from telescope.cli import n_compare_nlg
+from telescope.metrics.cache import SegmentCache
+from telescope.cli import merge, n_compare_nlg
 from tests.data import DATA_PATH
 
 
@@ -36,6 +40,19 @@ class TestCompareCli(unittest.TestCase):
     def setUp(self):
         self.runner = CliRunner()
 
+    def test_reports_segment_cache_stats(self):
+        args = ["-t", self.task, "-s", self.src, "-c", self.system_a, "-c", self.system_b, "-r", self.ref_b,
+                "-l", "cs", "-m", "chrF", "--seg_metric", "GLEU"]
+        with tempfile.TemporaryDirectory() as folder:
+            cache = SegmentCache(os.path.join(folder, "cache.sqlite"))
+            with patch("telescope.cli.segment_cache", return_value=cache):
+                result = self.runner.invoke(n_compare_nlg, args, catch_exceptions=False)
+                self.assertNotIn("Segment cache", result.output)
+
+                cache.hits, cache.misses = 3, 2
+                result = self.runner.invoke(n_compare_nlg, args, catch_exceptions=False)
+                self.assertIn("Segment cache: 3 hits, 2 misses", result.output)
+
     def test_with_seg_metric(self):
         args = [
             "-t",
@@ -125,6 +142,81 @@ class TestCompareCli(unittest.TestCase):
         result = self.runner.invoke(n_compare_nlg, args, catch_exceptions=False)
         self.assertEqual(result.exit_code, 0)
 
+    def test_with_bootstrap_workers(self):
+        args = [
+            "-t",
+            self.task,
+            "-s",
+            self.src,
+            "-c",
+            self.system_a,
+            "-c",
+            self.system_b,
+            "-r",
+            self.ref_b,
+            "-l",
+            "cs",
+            "-m",
+            "chrF",
+            "--seg_metric",
+            "GLEU",
+            "--bootstrap",
+            "-x",
+            self.system_a,
+            "-y",
+            self.system_b,
+            "--num_splits",
+            10,
+            "--sample_ratio",
+            0.3,
+            "--workers",
+            2
+        ]
+        result = self.runner.invoke(n_compare_nlg, args, catch_exceptions=False)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Bootstrap resampling results", result.stdout)
+
+    def test_with_all_pairs(self):
+        args = [
+            "-t",
+            self.task,
+            "-s",
+            self.src,
+            "-c",
+            self.system_a,
+            "-c",
+            self.system_b,
+            "-c",
+            self.system_g,
+            "-r",
+            self.ref_b,
+            "-l",
+            "cs",
+            "-m",
+            "chrF",
+            "--seg_metric",
+            "GLEU",
+            "--all_pairs",
+            "--num_splits",
+            10,
+            "--sample_ratio",
+            0.3,
+            "-n",
+            self.sys_names_file,
+            "--output_folder",
+            DATA_PATH
+        ]
+        result = self.runner.invoke(n_compare_nlg, args, catch_exceptions=False)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("All-pairs bootstrap resampling results", result.stdout)
+
+        ref_dir = os.path.join(DATA_PATH, self.ref_b.replace("/","_"))
+        self.assertTrue(os.path.isfile(os.path.join(ref_dir, "all_pairs_bootstrap_results.json")))
+        self.assertTrue(os.path.isfile(os.path.join(ref_dir, "chrF_all-pairs-bootstrap.html")))
+        for filename in os.listdir(ref_dir):
+            os.remove(os.path.join(ref_dir, filename))
+        os.rmdir(ref_dir)
+
     def test_length_filter(self):
         args = [
             "-t",
@@ -159,6 +251,54 @@ class TestCompareCli(unittest.TestCase):
         self.assertEqual(result.exit_code, 0)
 
     
+    def test_shards_merge_to_unsharded_results(self):
+        args = [
+            "-t",
+            self.task,
+            "-s",
+            self.src,
+            "-c",
+            self.system_a,
+            "-c",
+            self.system_b,
+            "-r",
+            self.ref_b,
+            "-r",
+            self.ref_c,
+            "-l",
+            "cs",
+            "-m",
+            "chrF",
+            "-m",
+            "BLEU",
+            "--seg_metric",
+            "GLEU",
+        ]
+        with tempfile.TemporaryDirectory() as folder:
+            full, shards, merged = (os.path.join(folder, name) for name in ("full", "shards", "merged"))
+            for output_folder in (full, shards, merged):
+                os.mkdir(output_folder)
+            result = self.runner.invoke(n_compare_nlg, args + ["-o", full], catch_exceptions=False)
+            self.assertEqual(result.exit_code, 0)
+            for shard in ["1/3", "2/3", "3/3"]:
+                result = self.runner.invoke(
+                    n_compare_nlg, args + ["-o", shards, "--shard", shard], catch_exceptions=False
+                )
+                self.assertEqual(result.exit_code, 0)
+
+            result = self.runner.invoke(merge, ["-i", shards, "-o", merged], catch_exceptions=False)
+            self.assertEqual(result.exit_code, 0)
+            for ref in self.refs:
+                for filename in ["results.json", "testset.json"]:
+                    with open(os.path.join(full, ref.replace("/","_"), filename)) as expected:
+                        with open(os.path.join(merged, ref.replace("/","_"), filename)) as actual:
+                            self.assertEqual(json.load(actual), json.load(expected))
+
+            os.remove(os.path.join(shards, self.ref_c.replace("/","_"), "shard-2-of-3.json"))
+            result = self.runner.invoke(merge, ["-i", shards, "-o", merged])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("Missing shards", result.output)
+
     def test_with_seg_level_comparison(self):
         args = [
             "-t",
@@ -245,6 +385,7 @@ class TestCompareCli(unittest.TestCase):
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/multiple-scores-distribution.html")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/multiple-bucket-analysis.png")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/results.json")
+            os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/testset.json")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/Sys B-Sys C_bootstrap_results.json")
             os.rmdir(DATA_PATH + "/" + ref.replace("/","_"))
 
@@ -300,5 +441,6 @@ class TestCompareCli(unittest.TestCase):
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/multiple-scores-distribution.html")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/multiple-bucket-analysis.png")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/results.json")
+            os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/testset.json")
             os.remove(DATA_PATH + "/" + ref.replace("/","_") +  "/Sys 2-Sys 3_bootstrap_results.json")
             os.rmdir(DATA_PATH + "/" + ref.replace("/","_"))
\ No newline at end of file
@@ -45,6 +45,31 @@ class TestScoreCli(unittest.TestCase):
         result = self.runner.invoke(score, args, catch_exceptions=False)
         self.assertEqual(result.exit_code, 0)
 
+    def test_model_batch_options(self):
+        args = [
+            "-s",
+            self.src,
+            "-t",
+            self.hyp,
+            "-r",
+            self.ref,
+            "-l",
+            "en",
+            "-m",
+            "chrF",
+            "--comet_batch_size",
+            8,
+            "--comet_max_tokens",
+            1024,
+            "--bertscore_batch_size",
+            16,
+        ]
+        result = self.runner.invoke(score, args, catch_exceptions=False)
+        self.assertEqual(result.exit_code, 0)
+
+        result = self.runner.invoke(score, args[:-2] + ["--bertscore_batch_size", 0])
+        self.assertEqual(result.exit_code, 2)
+
     # TODO: conflict with flags
     # def test_correct_cli_with_bleurt(self):
     #    args = ["-s", self.src, "-h", self.hyp, "-r", self.ref, "-l", "en", "-m", "BLEURT"]
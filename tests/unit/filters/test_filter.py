@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import numpy as np
+from telescope.filters.duplicates import DuplicatesFilter
+from telescope.filters.filter import combine_masks, reduction
+from telescope.filters.length import LengthFilter
+from telescope.testset import PairwiseTestset
+
+
+class TestFilterMasks(unittest.TestCase):
+
+    src = ["a", "b", "a", "c", "b", "d"]
+    ref = ["x" * i for i in [1, 5, 2, 6, 3, 0]]
+    testset = PairwiseTestset(src, src, src, ref, "en-de", ["src", "x", "y", "ref"])
+
+    def test_combine_masks(self):
+        filters = [DuplicatesFilter(self.testset), LengthFilter(self.testset, 50, 100)]
+        np.testing.assert_array_equal(
+            combine_masks(filters), [False, True, False, True, False, False]
+        )
+        np.testing.assert_array_equal(
+            combine_masks(filters, "or"), [True, True, False, True, True, True]
+        )
+        with self.assertRaises(Exception):
+            combine_masks(filters, "xor")
+
+    def test_reduction(self):
+        self.assertEqual(reduction(np.array([True, False, False, False])), 75.0)
+        self.assertEqual(reduction(np.array([], dtype=bool)), 0.0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from telescope.filters.length import LengthFilter, length_buckets
+from telescope.testset import PairwiseTestset
+
+
+class TestLengthFilter(unittest.TestCase):
+
+    def make_testset(self, refs):
+        return PairwiseTestset(refs, refs, refs, refs, "en-de", ["src", "x", "y", "ref"])
+
+    def test_matches_qcut(self):
+        random = np.random.RandomState(3)
+        for n in [2, 3, 19, 20, 21, 40, 41, 101, 997]:
+            lengths = random.randint(0, 12, size=n)
+            expected = list(pd.qcut(pd.Series(lengths).rank(method="first"), 20, labels=range(0, 100, 5)))
+            self.assertListEqual(length_buckets(lengths).tolist(), expected)
+
+    def test_matches_qcut_edges(self):
+        # Sizes where percentile edges are off by one ulp from the pandas quantiles.
+        for n in [91, 171, 181]:
+            lengths = np.arange(n)
+            expected = list(pd.qcut(pd.Series(lengths).rank(method="first"), 20, labels=range(0, 100, 5)))
+            self.assertListEqual(length_buckets(lengths).tolist(), expected)
+
+    def test_single_segment(self):
+        self.assertListEqual(length_buckets(np.array([7])).tolist(), [95])
+        self.assertListEqual(length_buckets(np.array([0])).tolist(), [0])
+        self.assertListEqual(length_buckets(np.array([], dtype=np.int64)).tolist(), [])
+
+    def test_apply_filter(self):
+        refs = ["a" * (i % 7) for i in range(60)]
+        testset = self.make_testset(refs)
+        testset.apply_filter(LengthFilter(testset, 50, 100))
+        self.assertEqual(len(testset), 30)
+        self.assertTrue(all(len(ref) >= 3 for ref in testset.ref))
+
+    def test_buckets_are_cached(self):
+        testset = self.make_testset(["a" * i for i in range(40)])
+        buckets = LengthFilter(testset, 0, 50).buckets()
+        self.assertIs(LengthFilter(testset, 25, 75).buckets(), buckets)
+        testset.apply_filter(LengthFilter(testset, 0, 50))
+        self.assertEqual(len(LengthFilter(testset, 0, 50).buckets()), 20)
+
+    def test_buckets_are_cached_by_digest(self):
+        refs = ["a" * i for i in range(40)]
+        buckets = LengthFilter(self.make_testset(refs), 0, 50).buckets()
+        with mock.patch("telescope.filters.length.length_buckets") as compute:
+            self.assertIs(LengthFilter(self.make_testset(list(refs)), 25, 75).buckets(), buckets)
+        compute.assert_not_called()
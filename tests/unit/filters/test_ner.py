@@ -14,8 +14,10 @@
 # limitations under the License.
 import os
 import unittest
+import tempfile
+from unittest import mock
 
-from telescope.filters.ner import NERFilter
+from telescope.filters.ner import EntityCache, NERFilter, model_version
 from telescope.testset import PairwiseTestset
 from tests.data import DATA_PATH
 
@@ -46,3 +48,87 @@ class TestNERFilter(unittest.TestCase):
             NERFilter(self.testset, self.testset.source_language, self.testset.target_language)
         the_exception = cm.exception
         self.assertEqual(str(the_exception), "pt-ja is not supperted by Stanza NER.")
+
+
+class FakePipeline:
+    """ Finds an entity in every capitalized word after the first one. """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, docs):
+        self.calls.append(len(docs))
+        for doc in docs:
+            doc.ents = [
+                mock.Mock(start_char=doc.text.index(w), end_char=doc.text.index(w) + len(w), type="LOC")
+                for w in doc.text.split()[1:]
+                if w[:1].isupper()
+            ]
+        return docs
+
+
+class TestBatchedNERFilter(unittest.TestCase):
+
+    src = ["Hello Lisbon", "", "no entities here", "We met Ana", "  ", "I love Porto"] * 3
+    testset = PairwiseTestset(src, src, src, src, "en-de", ["src", "x", "y", "ref"])
+    serial = [i for i, s in enumerate(src) if s.strip() and s.split()[-1][:1].isupper()]
+
+    def setUp(self):
+        self.engine = FakePipeline()
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = EntityCache(os.path.join(self.folder.name, "entities.sqlite"))
+        self.version = "model.pt:1:1"
+        patches = [
+            mock.patch("telescope.filters.ner.load_pipeline", return_value=self.engine),
+            mock.patch("telescope.filters.ner.entity_cache", return_value=self.cache),
+            mock.patch("telescope.filters.ner.model_version", lambda language: self.version),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_batches_match_serial(self):
+        progress = []
+        with mock.patch("telescope.filters.ner.report_progress", lambda *args: progress.append(args)):
+            filter = NERFilter(self.testset, "en", "de", batch_size=4)
+            self.assertListEqual(filter.apply_filter(), self.serial)
+        # Distinct segments are computed once and blank ones are not sent to the pipeline.
+        self.assertListEqual(self.engine.calls, [3, 1])
+        self.assertListEqual([p[1] for p in progress], [4, 6])
+
+    def test_cached_entities(self):
+        NERFilter(self.testset, "en", "de").apply_filter()
+        self.assertEqual(len(self.engine.calls), 1)
+        with mock.patch("stanza.download") as download:
+            filter = NERFilter(self.testset, "en", "de")
+            self.assertListEqual(filter.apply_filter(), self.serial)
+        download.assert_not_called()
+        self.assertEqual(len(self.engine.calls), 1)
+        key = self.cache.entity_key("en", self.version, "We met Ana")
+        self.assertListEqual(self.cache.get_many([key])[key], [[7, 10, "LOC"]])
+        self.assertEqual(self.cache.stats()["entries"], 6)
+
+    def test_new_models_are_not_cached(self):
+        NERFilter(self.testset, "en", "de").apply_filter()
+        self.version = "model.pt:2:2"
+        NERFilter(self.testset, "en", "de").apply_filter()
+        self.assertEqual(len(self.engine.calls), 2)
+        # Until the models are downloaded, the entities are not cached.
+        self.version = ""
+        NERFilter(self.testset, "en", "de").apply_filter()
+        self.assertEqual(len(self.engine.calls), 3)
+        self.assertEqual(self.cache.stats()["entries"], 12)
+
+    def test_model_version(self):
+        self.assertEqual(model_version("en", self.folder.name), "")
+        os.makedirs(os.path.join(self.folder.name, "en", "ner"))
+        with open(os.path.join(self.folder.name, "en", "ner", "model.pt"), "w") as model:
+            model.write("weights")
+        version = model_version("en", self.folder.name)
+        self.assertTrue(version.startswith("model.pt:7:"))
+        with open(os.path.join(self.folder.name, "en", "ner", "model.pt"), "a") as model:
+            model.write("!")
+        self.assertNotEqual(model_version("en", self.folder.name), version)
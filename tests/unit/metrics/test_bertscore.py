@@ -12,9 +12,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import tempfile
 import unittest
+from collections import defaultdict
+from unittest.mock import patch
 
+import torch
+from bert_score.utils import bert_cos_score_idf
+from telescope.metrics.bertscore.embeddings import EmbeddingCache
 from telescope.metrics.bertscore.metric import BERTScore
+from telescope.metrics.progress import progress_hook
+from telescope.testset import MultipleTestset
 
 cands = [
     "28-year-old chef found dead in San Francisco mall",
@@ -58,3 +66,119 @@ class TestBertScore(unittest.TestCase):
 
     def test_name_property(self):
         self.assertEqual(self.bertscore.name, "BERTScore")
+
+
+class FakeTokenizer:
+    """ Whitespace tokenizer with a fixed vocabulary of hashed ids. """
+
+    cls_token_id, sep_token_id, pad_token_id = 1, 2, 0
+    model_max_length = 512
+
+    def encode(self, sentence, add_special_tokens=True, **kwargs):
+        return [1] + [3 + sum(map(ord, word)) % 97 for word in sentence.split()] + [2]
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [1] + ids + [2]
+
+
+class FakeModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.embedding = torch.nn.Embedding(100, 8)
+        self.mixer = torch.nn.Conv1d(8, 8, 3, padding=1)
+
+    def forward(self, x, attention_mask=None, output_hidden_states=False):
+        # Padding is masked so embeddings do not depend on the batch, as in BERT.
+        emb = (self.embedding(x) * attention_mask.unsqueeze(-1)).transpose(1, 2)
+        return (self.mixer(emb).transpose(1, 2),)
+
+
+class FakeScorer:
+    model_type, num_layers, device = "fake", 1, "cpu"
+
+    def __init__(self):
+        self._tokenizer = FakeTokenizer()
+        self._model = FakeModel()
+
+
+@patch("telescope.metrics.metric.segment_cache", return_value=None)
+class TestBertScoreBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.scorer = FakeScorer()
+        self.cache = EmbeddingCache()
+        patch("telescope.metrics.bertscore.metric.get_scorer", return_value=self.scorer).start()
+        patch("telescope.metrics.bertscore.metric.get_embedding_cache", return_value=self.cache).start()
+        self.addCleanup(patch.stopall)
+
+    def expected(self, cand, ref):
+        idf_dict = defaultdict(lambda: 1.0)
+        idf_dict[2] = idf_dict[1] = 0
+        return bert_cos_score_idf(
+            self.scorer._model, ref, cand, self.scorer._tokenizer, idf_dict, device="cpu"
+        )
+
+    def test_matches_bert_score(self, _):
+        result = BERTScore(language="en", batch_size=2, max_tokens=50).score([], cands, refs)
+        expected = self.expected(cands, refs)
+        for i in range(3):
+            self.assertAlmostEqual(result.precision[i], expected[i, 0].item(), places=5)
+            self.assertAlmostEqual(result.recall[i], expected[i, 1].item(), places=5)
+            self.assertAlmostEqual(result.f1[i], expected[i, 2].item(), places=5)
+
+    def test_references_are_encoded_once(self, _):
+        encoded = []
+        encode = self.scorer._tokenizer.encode
+        self.scorer._tokenizer.encode = lambda sentence, **kwargs: encoded.append(sentence) or encode(sentence)
+
+        testset = MultipleTestset(
+            ["a", "b", "c"], refs, {"Sys 1": cands, "Sys 2": refs}, ["src", "ref", "Sys 1", "Sys 2"]
+        )
+        result = BERTScore(language="en").multiple_comparison(testset)
+
+        # Tokenized once to measure it and once to encode it.
+        self.assertEqual(encoded.count(refs[0]), 2)
+        self.assertEqual(len(self.cache), 6)
+        for f1 in result.systems_metric_results["Sys 2"].seg_scores:
+            self.assertAlmostEqual(f1, 1.0, places=5)
+
+        BERTScore(language="en").score([], cands, refs)
+        self.assertEqual(encoded.count(refs[0]), 2)
+
+    def test_progress(self, _):
+        progress = []
+        with progress_hook(lambda metric, done, total: progress.append((metric, done, total))):
+            BERTScore(language="en", batch_size=3).score([], cands, refs)
+        self.assertListEqual(progress, [("BERTScore", 3, 9), ("BERTScore", 6, 9), ("BERTScore", 9, 9)])
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def stats(self, value, length=4):
+        return torch.full((length, 8), float(value)), torch.ones(length)
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_size=2 * EmbeddingCache.nbytes(*self.stats(0)))
+        cache.put("a", *self.stats(1))
+        cache.put("b", *self.stats(2))
+        cache.get("a")
+        cache.put("c", *self.stats(3))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_spill_to_memory_map(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = EmbeddingCache(max_size=EmbeddingCache.nbytes(*self.stats(0)), spill_dir=folder)
+            cache.put("a", *self.stats(1, 3))
+            cache.put("b", *self.stats(2, 5))
+            cache.put("c", *self.stats(3))
+            self.assertEqual(len(cache), 3)
+
+            emb, idf = cache.get("b")
+            self.assertTrue(torch.equal(emb, torch.full((5, 8), 2.0)))
+            self.assertTrue(torch.equal(idf, torch.ones(5)))
+            emb, _ = cache.get("a")
+            self.assertTrue(torch.equal(emb, torch.full((3, 8), 1.0)))
+            cache._spill_file.close()
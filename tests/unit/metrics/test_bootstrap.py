@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from functools import partial
+from unittest import mock
+
+import numpy as np
+
+from telescope.metrics.bootstrap import (
+    count_wins,
+    partition_ids,
+    resample_means,
+    run_bootstraps,
+    sample_counts,
+)
+from telescope.metrics.chrf.metric import chrF
+from telescope.metrics.ter.metric import TER
+from telescope.metrics.zero_edit.metric import ZeroEdit
+from telescope.testset import MultipleTestset
+
+
+class TestBootstrap(unittest.TestCase):
+
+    x = [0.1, 0.9, 0.4, 0.3, 0.8, 0.2, 0.7]
+    y = [0.2, 0.5, 0.4, 0.6, 0.1, 0.9, 0.3]
+
+    def test_sample_counts(self):
+        counts = sample_counts(np.array([[0, 0, 2], [1, 2, 2]]), 3)
+        np.testing.assert_array_equal(counts, [[2, 0, 1], [0, 1, 2]])
+
+    def test_resample_means(self):
+        means = resample_means([self.x, self.y], 50, 4, seed=42)
+
+        ids = partition_ids(len(self.x), 4, 42, 0, 50)
+        expected_x = [sum(self.x[i] for i in row) / 4 for row in ids]
+        expected_y = [sum(self.y[i] for i in row) / 4 for row in ids]
+
+        np.testing.assert_allclose(means[:, 0], expected_x)
+        np.testing.assert_allclose(means[:, 1], expected_y)
+
+    def test_chunking_does_not_change_partitions(self):
+        full = resample_means([self.x, self.y], 30, 5, seed=7)
+        chunked = resample_means([self.x, self.y], 30, 5, seed=7, max_elements=10)
+        np.testing.assert_allclose(full, chunked)
+
+    def test_workers_do_not_change_partitions(self):
+        serial = resample_means([self.x, self.y], 30, 5, seed=7)
+        parallel = resample_means([self.x, self.y], 30, 5, seed=7, workers=3, max_elements=10)
+        np.testing.assert_allclose(serial, parallel)
+
+    def test_workers_give_identical_sums(self):
+        # Floating point sums must not depend on how partitions are spread.
+        scores = list(np.random.RandomState(0).rand(3, 500))
+        bootstraps = [
+            partial(resample_means, scores, 300, sample_size, seed=seed)
+            for seed, sample_size in [(7, 500), (8, 250)]
+        ]
+        serial = run_bootstraps(bootstraps)
+        for expected, parallel in zip(serial, run_bootstraps(bootstraps, workers=4)):
+            self.assertTrue(np.array_equal(expected, parallel))
+        self.assertTrue(np.array_equal(serial[0], bootstraps[0](workers=4)))
+
+    def test_shared_pool_does_not_change_partitions(self):
+        bootstraps = [
+            partial(resample_means, [self.x, self.y], 30, 5, seed=seed, max_elements=10)
+            for seed in (7, 8, 9)
+        ]
+        serial = run_bootstraps(bootstraps)
+        for expected, parallel in zip(serial, run_bootstraps(bootstraps, workers=4)):
+            np.testing.assert_allclose(expected, parallel)
+
+    def test_global_seed(self):
+        np.random.seed(11)
+        first = resample_means([self.x, self.y], 10, 5)
+        np.random.seed(11)
+        np.testing.assert_allclose(first, resample_means([self.x, self.y], 10, 5))
+
+    def test_count_wins(self):
+        self.assertListEqual(count_wins([1, 2, 3, 3], [2, 1, 3, 0]), [2, 1, 1])
+        self.assertListEqual(count_wins([1, 2, 3, 3], [2, 1, 3, 0], higher_is_better=False), [1, 2, 1])
+
+    def test_lower_is_better(self):
+        src = ["a", "b", "c", "d"]
+        ref = ["the cat sat", "on the mat", "a dog", "the end"]
+        outputs = {"Sys 1": ref, "Sys 2": ["a cat sat", "in a mat", "dog", "end"]}
+        testset = MultipleTestset(src, ref, outputs, ["src", "ref", "Sys 1", "Sys 2"])
+        result = TER(language="en").multiple_comparison(testset)
+
+        all_pairs = TER.all_pairs_bootstrap_resampling(testset, 20, 0.5, "en", result, seed=5)
+        pairwise = TER.multiple_bootstrap_resampling(
+            testset, 20, 0.5, "Sys 1", "Sys 2", "en", result, seed=5
+        )
+        # Sys 1 has no edits, so its TER is never higher than the TER of Sys 2.
+        self.assertEqual(pairwise.win_count[1], 0)
+        self.assertListEqual(all_pairs.pairwise("Sys 1", "Sys 2").win_count, pairwise.win_count)
+        self.assertEqual(all_pairs.win_rate[0, 1], pairwise.win_count[0] / 20)
+        self.assertEqual(all_pairs.win_rate[1, 0], 0.0)
+
+    def test_multiple_bootstrap_resampling(self):
+        src = ["a", "b", "c", "d"]
+        ref = ["a", "b", "c", "d"]
+        outputs = {"Sys 1": ["a", "b", "x", "d"], "Sys 2": ["a", "y", "x", "z"]}
+        testset = MultipleTestset(src, ref, outputs, ["src", "ref", "Sys 1", "Sys 2"])
+        result = ZeroEdit().multiple_comparison(testset)
+
+        bootstrap = ZeroEdit.multiple_bootstrap_resampling(
+            testset, 20, 0.5, "Sys 1", "Sys 2", "X", result
+        )
+        self.assertEqual(len(bootstrap.x_scores), 20)
+        self.assertEqual(sum(bootstrap.win_count), 20)
+        self.assertTrue(all(x >= y for x, y in zip(bootstrap.x_scores, bootstrap.y_scores)))
+
+    def test_statistics_match_rescoring(self):
+        src = ["a", "b", "c", "d", "e"]
+        ref = ["Hello world.", "This is a test.", "Another one.", "Fine.", "The end."]
+        cand = ["Hi world.", "This is a Test.", "Another one!", "Good.", "The end."]
+        metric = chrF(language="en")
+
+        scores = metric.resample_statistics(src, [cand, ref], ref, 10, 3, seed=3)
+
+        for row, ids in zip(scores, partition_ids(len(ref), 3, 3, 0, 10)):
+            reduced_ref = [ref[i] for i in ids]
+            expected = metric.score([], [cand[i] for i in ids], reduced_ref).sys_score
+            self.assertAlmostEqual(row[0], expected)
+            self.assertAlmostEqual(row[1], 1.0)
+
+    def test_all_pairs_matches_pairwise(self):
+        src = ["a", "b", "c", "d"]
+        ref = ["a", "b", "c", "d"]
+        outputs = {
+            "Sys 1": ["a", "b", "x", "d"],
+            "Sys 2": ["a", "y", "x", "z"],
+            "Sys 3": ["a", "b", "c", "z"],
+        }
+        testset = MultipleTestset(src, ref, outputs, ["src", "ref", "Sys 1", "Sys 2", "Sys 3"])
+        result = ZeroEdit().multiple_comparison(testset)
+
+        all_pairs = ZeroEdit.all_pairs_bootstrap_resampling(testset, 20, 0.5, "X", result, seed=5)
+        pairwise = ZeroEdit.multiple_bootstrap_resampling(
+            testset, 20, 0.5, "Sys 1", "Sys 3", "X", result, seed=5
+        )
+        self.assertListEqual(all_pairs.pairwise("Sys 1", "Sys 3").win_count, pairwise.win_count)
+        np.testing.assert_allclose(all_pairs.win_rate + all_pairs.win_rate.T + all_pairs.tie_rate, 1.0)
+
+    def test_statistics_of_results_are_reused(self):
+        src = ["a", "b", "c", "d"]
+        ref = ["Hello world.", "This is a test.", "Another one.", "Fine."]
+        outputs = {"Sys 1": ["Hi world.", "This is a Test.", "Another one!", "Good."], "Sys 2": ref}
+        testset = MultipleTestset(src, ref, outputs, ["src", "ref", "Sys 1", "Sys 2"])
+        result = chrF(language="en").multiple_comparison(testset)
+
+        rescored = chrF.resample_systems(testset, 10, 0.5, ["Sys 1", "Sys 2"], "en", seed=3)
+        with mock.patch.object(chrF, "segment_statistics", side_effect=AssertionError):
+            reused = chrF.resample_systems(testset, 10, 0.5, ["Sys 1", "Sys 2"], "en", result, seed=3)
+        np.testing.assert_allclose(rescored, reused)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+
+from telescope.metrics.cache import SegmentCache
+
+
+class TestSegmentCache(unittest.TestCase):
+
+    namespace = ("COMET", "wmt20-comet-da", "en")
+    src = ["a", "b", "c", "a"]
+    ref = ["A", "B", "C", "A"]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = SegmentCache(os.path.join(self.folder.name, "segments.sqlite"))
+        self.calls = []
+
+    def tearDown(self):
+        self.cache.connection.close()
+        self.folder.cleanup()
+
+    def compute(self, src, cand, ref):
+        self.calls.append(list(cand))
+        return [len(c) / 10 for c in cand]
+
+    def test_only_uncached_segments_are_computed(self):
+        first = self.cache.fetch(self.namespace, self.src, ["x", "yy", "zzz", "x"], self.ref, self.compute)
+        self.assertListEqual(first, [0.1, 0.2, 0.3, 0.1])
+        # The repeated segment is computed once.
+        self.assertListEqual(self.calls, [["x", "yy", "zzz"]])
+
+        second = self.cache.fetch(self.namespace, self.src, ["x", "yy", "wwww", "x"], self.ref, self.compute)
+        self.assertListEqual(second, [0.1, 0.2, 0.4, 0.1])
+        self.assertListEqual(self.calls[1], ["wwww"])
+        self.assertEqual(self.cache.hits, 1 + 3)
+        self.assertEqual(self.cache.misses, 3 + 1)
+
+    def test_namespace_is_part_of_the_key(self):
+        self.cache.fetch(self.namespace, self.src, ["x", "y", "z", "x"], self.ref, self.compute)
+        other = ("COMET", "wmt21-cometinho-da", "en")
+        self.cache.fetch(other, self.src, ["x", "y", "z", "x"], self.ref, self.compute)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_values_persist_across_instances(self):
+        self.cache.fetch(self.namespace, self.src, ["x", "y", "z", "x"], self.ref, self.compute)
+        cache = SegmentCache(self.cache.path)
+        self.assertListEqual(
+            cache.fetch(self.namespace, self.src, ["x", "y", "z", "x"], self.ref, self.compute),
+            [0.1, 0.1, 0.1, 0.1],
+        )
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(cache.stats()["entries"], 3)
+        cache.connection.close()
+
+    def test_lru_eviction(self):
+        for s, c, r in zip(self.src[:3], ["x", "y", "z"], self.ref[:3]):
+            self.cache.fetch(self.namespace, [s], [c], [r], self.compute)
+        entry_size = self.cache.stats()["size"] // 3
+        self.cache.max_size = 3 * entry_size
+        # Touch "x" so "y" becomes the least recently used entry.
+        self.cache.fetch(self.namespace, ["a"], ["x"], ["A"], self.compute)
+        self.cache.fetch(self.namespace, ["d"], ["w"], ["D"], self.compute)
+
+        self.assertEqual(self.cache.stats()["entries"], 3)
+        self.cache.fetch(self.namespace, ["b"], ["y"], ["B"], self.compute)
+        self.assertListEqual(self.calls[-1], ["y"])
@@ -14,6 +14,7 @@
 # limitations under the License.
 import unittest
 
+import sacrebleu
 from telescope.metrics.chrf.metric import chrF
 
 
@@ -30,7 +31,9 @@ class TestchrF(unittest.TestCase):
         expected_sys = 0.528
         result = self.chrf.score(src, cand, ref)
         self.assertAlmostEqual(result.sys_score, expected_sys, places=2)
-        self.assertFalse(result.seg_scores)
+        expected_seg = [sacrebleu.sentence_chrf(c, [r]).score / 100 for c, r in zip(cand, ref)]
+        self.assertListEqual(result.seg_scores, expected_seg)
+        self.assertEqual(result.stats.shape, (len(cand), 18))
         self.assertListEqual(result.ref, ref)
         self.assertListEqual(result.src, src)
         self.assertListEqual(result.cand, cand)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest import mock
+
+import numpy as np
+from sklearn import metrics
+
+from telescope.metrics.accuracy.metric import Accuracy
+from telescope.metrics.classification import confusion_matrix, encode_labels, label_statistics
+from telescope.metrics.f1_score.metric import F1Score
+from telescope.metrics.precision.metric import Precision
+from telescope.metrics.recall.metric import Recall
+from telescope.metrics.tokenization import tokenization_run
+from telescope.testset import label_columns
+
+
+class TestConfusionMatrix(unittest.TestCase):
+
+    labels = ["positive", "neutral", "negative", "unseen"]
+
+    def setUp(self):
+        random = np.random.RandomState(7)
+        self.ref = random.choice(self.labels[:3], size=500).tolist()
+        self.cand = random.choice(self.labels[:3] + ["other"], size=500).tolist()
+
+    def test_encode_labels(self):
+        vocabulary, true, pred = encode_labels(["b", "c"], ["a", "b"], ["c", "x"])
+        self.assertListEqual(vocabulary, ["c", "x", "a", "b"])
+        self.assertListEqual(true.tolist(), [3, 0])
+        self.assertListEqual(pred.tolist(), [2, 3])
+
+    def test_matches_sklearn(self):
+        matrix = confusion_matrix(self.ref, self.cand, self.labels)
+        self.assertAlmostEqual(matrix.accuracy(), metrics.accuracy_score(self.ref, self.cand))
+        for score, function in [
+            ("precision", metrics.precision_score),
+            ("recall", metrics.recall_score),
+            ("f1", metrics.f1_score),
+        ]:
+            expected = function(self.ref, self.cand, average="macro", zero_division=0)
+            self.assertAlmostEqual(matrix.macro_average(score), expected)
+
+        np.testing.assert_array_equal(
+            matrix.reindexed(self.labels),
+            metrics.confusion_matrix(self.ref, self.cand, labels=self.labels),
+        )
+        expected = metrics.multilabel_confusion_matrix(self.ref, self.cand, labels=self.labels)
+        for label, label_matrix in zip(self.labels, expected):
+            np.testing.assert_array_equal(matrix.label_matrix(label), label_matrix)
+
+    def test_statistics_match_segment_statistics(self):
+        matrix = confusion_matrix(self.ref, self.cand)
+        np.testing.assert_array_equal(
+            matrix.statistics(), label_statistics(self.ref, self.cand).sum(axis=0)
+        )
+
+    def test_results_from_statistics(self):
+        for metric in [Precision(), Recall(), F1Score()]:
+            expected = metric.score([], self.cand, self.ref)
+            values = metric.shard_values(expected)
+            self.assertEqual(len(values), len(self.cand))
+            merged = metric.merge_shards([], self.cand, self.ref, values)
+            self.assertAlmostEqual(merged.sys_score, expected.sys_score)
+
+    def test_metrics_share_the_matrix(self):
+        matrix = confusion_matrix(self.ref, self.cand, self.labels)
+        metrics = [Accuracy, Precision, Recall, F1Score]
+        with tokenization_run(), mock.patch(
+            "telescope.metrics.classification.confusion_matrix", return_value=matrix
+        ) as build:
+            expected = [cls(labels=self.labels).score([], self.cand, self.ref) for cls in metrics]
+            build.assert_called_once()
+        for cls, result in zip(metrics, expected):
+            computed = cls(labels=self.labels).result_from_matrix([], self.cand, self.ref, matrix)
+            self.assertEqual(computed.sys_score, result.sys_score)
+            self.assertListEqual(computed.seg_scores, result.seg_scores)
+        # Matrices are released at the end of the run.
+        with tokenization_run(), mock.patch(
+            "telescope.metrics.classification.confusion_matrix", return_value=matrix
+        ) as build:
+            Accuracy(labels=self.labels).score([], self.cand, self.ref)
+            build.assert_called_once()
+
+    def test_empty(self):
+        matrix = confusion_matrix([], [], ["a"])
+        self.assertEqual(matrix.accuracy(), 0.0)
+        self.assertEqual(matrix.label_accuracy("a"), 0.0)
+        self.assertEqual(matrix.macro_average("f1"), 0.0)
+
+    def test_label_columns(self):
+        ref, cand = label_columns([self.ref, self.cand], self.labels)
+        expected = confusion_matrix(self.ref, self.cand, self.labels)
+        matrix = confusion_matrix(ref, cand, self.labels + ["missing"])
+        np.testing.assert_array_equal(matrix.reindexed(self.labels), expected.reindexed(self.labels))
+        self.assertEqual(matrix.accuracy(), expected.accuracy())
+        self.assertEqual(matrix.macro_average("f1"), expected.macro_average("f1"))
+        np.testing.assert_array_equal(
+            label_statistics(ref, cand).sum(axis=0)[: len(self.labels)],
+            expected.statistics()[: len(self.labels)],
+        )
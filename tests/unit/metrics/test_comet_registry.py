@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+from telescope.metrics.comet import registry
+
+
+@patch("telescope.metrics.comet.registry.download_model", side_effect=lambda name: name)
+@patch("telescope.metrics.comet.registry.load_from_checkpoint", side_effect=lambda path: MagicMock())
+class TestCOMETRegistry(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear_registry()
+
+    def tearDown(self):
+        registry.clear_registry()
+
+    def test_models_are_loaded_once(self, load, _):
+        first = registry.get_runner("wmt21-cometinho-da")
+        second = registry.get_runner("wmt21-cometinho-da")
+        self.assertIs(first, second)
+        self.assertEqual(load.call_count, 1)
+
+    @patch("telescope.metrics.comet.registry.REGISTRY_SIZE", 2)
+    def test_least_recently_used_model_is_released(self, load, _):
+        registry.get_runner("model-a")
+        registry.get_runner("model-b")
+        registry.get_runner("model-a")
+        registry.get_runner("model-c")
+        self.assertListEqual(list(registry._RUNNERS), ["model-a", "model-c"])
+
+        registry.get_runner("model-b")
+        self.assertEqual(load.call_count, 4)
+
+    def test_trainer_is_reused(self, load, _):
+        runner = registry.get_runner("wmt21-cometinho-da")
+        with patch("telescope.metrics.comet.registry.Trainer") as trainer:
+            self.assertIs(runner.trainer, runner.trainer)
+            self.assertEqual(trainer.call_count, 1)
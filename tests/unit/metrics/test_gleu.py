@@ -14,11 +14,28 @@
 # limitations under the License.
 import os
 import unittest
+from collections import Counter
 
-from telescope.metrics.gleu.metric import GLEU
+import numpy as np
+
+from telescope.metrics.gleu.metric import GLEU, segment_gleu, tokenize_segments
 from tests.data import DATA_PATH
 
 
+def nltk_sentence_gleu(reference, hypothesis, min_len=1, max_len=4):
+    """ Reference implementation (NLTK sentence_gleu) with Counters of tuple n-grams. """
+    def everygrams(sequence):
+        return Counter(
+            tuple(sequence[i : i + n])
+            for n in range(min_len, max_len + 1)
+            for i in range(len(sequence) - n + 1)
+        )
+
+    hyp_ngrams, ref_ngrams = everygrams(hypothesis), everygrams(reference)
+    n_all = max(sum(hyp_ngrams.values()), sum(ref_ngrams.values()))
+    return sum((ref_ngrams & hyp_ngrams).values()) / n_all if n_all > 0 else 0.0
+
+
 class TestGLEU(unittest.TestCase):
     cand = [l.strip() for l in open(os.path.join(DATA_PATH, "hyp1_100.no")).readlines()]
     ref = [l.strip() for l in open(os.path.join(DATA_PATH, "ref_100.no")).readlines()]
@@ -40,3 +57,39 @@ class TestGLEU(unittest.TestCase):
         gleu = GLEU(language="en", lowercase=False, tokenize=False)
         result = gleu.score([], ref, hyp1)
         self.assertAlmostEqual(expected_result, result.sys_score, places=3)
+
+    def test_matches_reference_implementation(self):
+        for lowercase, tokenize in [(False, True), (True, True), (False, False), (True, False)]:
+            cand = tokenize_segments(self.cand, "en", lowercase, tokenize)
+            ref = tokenize_segments(self.ref, "en", lowercase, tokenize)
+            expected = [nltk_sentence_gleu(r, h) for r, h in zip(ref, cand)]
+
+            result = GLEU(language="en", lowercase=lowercase, tokenize=tokenize).score([], self.cand, self.ref)
+            self.assertListEqual(result.seg_scores, expected)
+            self.assertEqual(result.sys_score, sum(expected) / len(expected))
+
+    def test_min_len_and_empty_segments(self):
+        hyp = [["a", "b", "a", "b"], [], ["c"], ["a", "a", "a"]]
+        ref = [["a", "b", "a"], ["a"], [], ["a", "a"]]
+        for min_len, max_len in [(1, 4), (2, 3), (3, 3)]:
+            expected = [nltk_sentence_gleu(r, h, min_len, max_len) for r, h in zip(ref, hyp)]
+            self.assertListEqual(segment_gleu(hyp, ref, min_len, max_len).tolist(), expected)
+
+    def test_large_vocabulary(self):
+        # A vocabulary this large does not fit the rolling keys of 4-grams in int64.
+        random = np.random.RandomState(3)
+        hyp = [[str(w) for w in random.randint(0, 5, size=random.randint(0, 12))] + ["x%d" % i] for i in range(70000)]
+        ref = [[str(w) for w in random.randint(0, 5, size=random.randint(0, 12))] for _ in range(70000)]
+        expected = [nltk_sentence_gleu(r, h) for r, h in zip(ref, hyp)]
+        self.assertListEqual(segment_gleu(hyp, ref).tolist(), expected)
+
+    def test_common_metric_signature(self):
+        # Bootstrap rescoring builds metrics as metric(language, labels).
+        expected = GLEU(language="en").score([], self.cand, self.ref)
+        result = GLEU("en", [" "]).score([], self.cand, self.ref)
+        self.assertEqual(result.sys_score, expected.sys_score)
+
+    def test_parallel_chunks(self):
+        serial = GLEU(language="en").score([], self.cand, self.ref)
+        parallel = GLEU(language="en", workers=3).score([], self.cand, self.ref)
+        self.assertListEqual(serial.seg_scores, parallel.seg_scores)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+
+from telescope.metrics import AVAILABLE_METRICS
+from telescope.metrics.metric import (
+    IndependentSegments,
+    MergeableShards,
+    Metric,
+    SufficientStatistics,
+)
+from telescope.metrics.result import MetricResult
+from telescope.testset import MultipleTestset
+
+
+class LengthMetric(IndependentSegments, Metric):
+
+    name = "Length"
+
+    def __init__(self, language="X"):
+        super().__init__(language)
+        self.scored = []
+
+    def score(self, src, cand, ref):
+        return self.result_from_segments(src, cand, ref, self.segment_values(src, cand, ref))
+
+    def result_from_segments(self, src, cand, ref, values):
+        return MetricResult(sum(values) / len(values), values, src, cand, ref, self.name, values)
+
+    def segment_values(self, src, cand, ref):
+        self.scored.extend(cand)
+        return [float(len(c)) for c in cand]
+
+
+@patch("telescope.metrics.metric.segment_cache", return_value=None)
+class TestMultipleComparison(unittest.TestCase):
+
+    src = ["a", "b", "c", "d"]
+    ref = ["A", "B", "C", "D"]
+    outputs = {
+        "Sys 1": ["x", "yy", "zzz", "w"],
+        "Sys 2": ["x", "yy", "z", "w"],
+        "Sys 3": ["x", "y", "zzz", "w"],
+    }
+
+    def test_identical_segments_are_scored_once(self, _):
+        testset = MultipleTestset(self.src, self.ref, self.outputs, ["src", "ref", "Sys 1", "Sys 2", "Sys 3"])
+        metric = LengthMetric()
+        result = metric.multiple_comparison(testset)
+
+        self.assertEqual(len(metric.scored), 6)
+        self.assertAlmostEqual(result.dedup_ratio, 0.5)
+        for name, output in self.outputs.items():
+            expected = LengthMetric().score(self.src, output, self.ref)
+            self.assertListEqual(result.systems_metric_results[name].seg_scores, expected.seg_scores)
+            self.assertEqual(result.systems_metric_results[name].sys_score, expected.sys_score)
+            self.assertListEqual(result.systems_metric_results[name].cand, output)
+
+    def test_same_segment_with_other_source_is_not_shared(self, _):
+        testset = MultipleTestset(
+            ["a", "a"], ["A", "B"], {"Sys 1": ["x", "x"]}, ["src", "ref", "Sys 1"]
+        )
+        metric = LengthMetric()
+        result = metric.multiple_comparison(testset)
+        self.assertEqual(len(metric.scored), 2)
+        self.assertEqual(result.dedup_ratio, 0.0)
+
+    def test_shard_values_of_any_result(self, _):
+        metric = LengthMetric()
+        result = metric.score(self.src, self.outputs["Sys 1"], self.ref)
+        self.assertListEqual(metric.shard_values(result), [1.0, 2.0, 3.0, 1.0])
+        merged = metric.merge_shards(self.src, self.outputs["Sys 1"], self.ref, metric.shard_values(result))
+        self.assertListEqual(metric.shard_values(merged), metric.shard_values(result))
+
+
+class TestCapabilities(unittest.TestCase):
+    def test_flags_match_mixins(self):
+        for cls in AVAILABLE_METRICS + [LengthMetric]:
+            statistics = issubclass(cls, SufficientStatistics)
+            self.assertEqual(cls.sufficient_statistics, statistics, cls.name)
+            self.assertEqual(cls.independent_segments, issubclass(cls, IndependentSegments), cls.name)
+
+    def test_mixin_methods_are_abstract(self):
+        for mixin in [MergeableShards, SufficientStatistics, IndependentSegments]:
+            incomplete = type("Incomplete", (mixin, Metric), {"score": LengthMetric.score})
+            with self.assertRaises(TypeError):
+                incomplete()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest import mock
+
+import numpy as np
+from rouge import Rouge
+
+from telescope.metrics import ROUGEL, ROUGEOne, ROUGETwo
+from telescope.metrics.rouge_engine import VARIANTS, rouge_scores
+from telescope.metrics.tokenization import tokenization_run
+
+
+class TestROUGEEngine(unittest.TestCase):
+
+    words = ["the", "a", "cat", "dog", "sat", "on", "mat", ".", ",", "of", "x", ""]
+
+    def random_corpus(self, size, seed):
+        random = np.random.RandomState(seed)
+        segments = []
+        while len(segments) < size:
+            segment = " ".join(random.choice(self.words, size=random.randint(1, 40)))
+            if any(segment.split(".")):
+                segments.append(segment)
+        return segments
+
+    def test_matches_rouge_package(self):
+        cand = self.random_corpus(300, 1)
+        ref = self.random_corpus(300, 2)
+        expected = Rouge().get_scores(cand, ref)
+        expected_avg = Rouge().get_scores(cand, ref, avg=True)
+
+        scores = rouge_scores(cand, ref)
+        for variant in VARIANTS:
+            for stat in "fpr":
+                self.assertListEqual(
+                    scores.segments(variant, stat), [s[variant][stat] for s in expected]
+                )
+            self.assertDictEqual(scores.corpus(variant), expected_avg[variant])
+
+    def test_variants(self):
+        cand = self.random_corpus(40, 5)
+        ref = self.random_corpus(40, 6)
+        scores = rouge_scores(cand, ref)
+        for variant in VARIANTS:
+            only = rouge_scores(cand, ref, [variant])
+            self.assertListEqual(list(only.scores), [variant])
+            np.testing.assert_array_equal(only.scores[variant], scores.scores[variant])
+
+    def test_small_batches(self):
+        cand = self.random_corpus(50, 3)
+        ref = self.random_corpus(50, 4)
+        expected = Rouge().get_scores(cand, ref)
+        with mock.patch("telescope.metrics.rouge_engine.LCS_MAX_CELLS", 64):
+            scores = rouge_scores(cand + ["another"], ref + ["corpus"])
+        self.assertListEqual(scores.segments("rouge-l")[:50], [s["rouge-l"]["f"] for s in expected])
+
+    def test_empty_segments(self):
+        scores = rouge_scores(["", "the cat.", "..."], ["the cat", "", "the"])
+        for variant in VARIANTS:
+            self.assertListEqual(scores.segments(variant), [0.0, 0.0, 0.0])
+        self.assertDictEqual(rouge_scores([], []).corpus("rouge-l"), {"f": 0.0, "p": 0.0, "r": 0.0})
+
+    def test_variants_are_shared_in_a_run(self):
+        cand = self.random_corpus(30, 7)
+        ref = self.random_corpus(30, 8)
+        metrics = [ROUGEOne(), ROUGETwo(), ROUGEL()]
+        with mock.patch("telescope.metrics.rouge_engine.rouge_scores", wraps=rouge_scores) as compute:
+            with tokenization_run():
+                results = [metric.score([], cand, ref) for metric in metrics]
+                metrics[0].score([], list(cand), list(ref))
+            self.assertEqual(compute.call_count, 1)
+            # The shared scores are released at the end of the run.
+            with tokenization_run():
+                metrics[0].score([], cand, ref)
+            self.assertEqual(compute.call_count, 2)
+
+        expected = rouge_scores(cand, ref)
+        for result, variant in zip(results, VARIANTS):
+            self.assertListEqual(result.seg_scores, expected.segments(variant))
@@ -18,7 +18,7 @@ class TestROUGEOne(unittest.TestCase):
 
         result = self.rouge_one.score([], cand, ref)
         self.assertEqual(result.sys_score, expected_sys)
-        self.assertFalse(result.seg_scores)
+        self.assertListEqual(result.seg_scores, [expected_sys])
         self.assertListEqual(result.ref, ref)
         self.assertListEqual(result.src, [])
         self.assertListEqual(result.cand, cand)
@@ -14,6 +14,7 @@
 # limitations under the License.
 import unittest
 
+import sacrebleu
 from telescope.metrics.sacrebleu.metric import sacreBLEU
 
 
@@ -30,10 +31,19 @@ class TestSacreBLEU(unittest.TestCase):
         expected_sys = 0.3913
         result = self.bleu.score(src, cand, ref)
         self.assertAlmostEqual(result.sys_score, expected_sys, places=3)
-        self.assertFalse(result.seg_scores)
+        expected_seg = [sacrebleu.sentence_bleu(c, [r]).score / 100 for c, r in zip(cand, ref)]
+        self.assertListEqual(result.seg_scores, expected_seg)
+        self.assertEqual(result.stats.shape, (2, 10))
         self.assertListEqual(result.ref, ref)
         self.assertListEqual(result.src, src)
         self.assertListEqual(result.cand, cand)
 
+    def test_statistics_match_sacrebleu(self):
+        cand = ["the cat the cat on the mat", "", "a a a a", "It's a test, isn't it?"]
+        ref = ["the cat is on the mat", "nothing", "a a", "It is a test, isn't it?"]
+        expected = sacrebleu.BLEU()._extract_corpus_statistics(cand, [ref])
+        self.assertListEqual(self.bleu.segment_statistics([], cand, ref).tolist(), expected)
+        self.assertEqual(self.bleu.segment_statistics([], [], []).shape, (0, 10))
+
     def test_name_property(self):
         self.assertEqual(self.bleu.name, "BLEU")
@@ -30,10 +30,20 @@ class TestTER(unittest.TestCase):
         expected_sys = (0 + 3 + 1) / 15
         result = self.ter.score(src, cand, ref)
         self.assertAlmostEqual(result.sys_score, expected_sys, places=2)
-        self.assertFalse(result.seg_scores)
+        self.assertListEqual(result.seg_scores, [0.0, 1.0, 1 / 8])
+        self.assertListEqual(result.stats.tolist(), [[0, 4], [3, 3], [1, 8]])
         self.assertListEqual(result.ref, ref)
         self.assertListEqual(result.src, src)
         self.assertListEqual(result.cand, cand)
 
     def test_name_property(self):
         self.assertEqual(self.ter.name, "TER")
+
+    def test_parallel_shards(self):
+        cand = ["aaaa bbbb cccc dddd", "aaaa bbbb cccc", "d e f g h a b c", "", "x y"] * 3
+        ref = ["aaaa bbbb cccc dddd", "dddd eeee ffff", "a b c d e f g h", "a", "y x z"] * 3
+        serial = self.ter.score([], cand, ref)
+        parallel = TER(language="en", workers=2).score([], cand, ref)
+        self.assertEqual(parallel.sys_score, serial.sys_score)
+        self.assertListEqual(parallel.seg_scores, serial.seg_scores)
+        self.assertEqual(parallel.num_edits, serial.num_edits)
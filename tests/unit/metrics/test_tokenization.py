@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import sacrebleu
+from telescope.metrics.sacrebleu.metric import sacreBLEU
+from telescope.metrics.ter.metric import TER
+from telescope.metrics.tokenization import TokenCache, token_cache, tokenization_run
+
+
+class TestTokenCache(unittest.TestCase):
+
+    segments = ["Hello, world!", "It's a TEST.", "Hello, world!"]
+
+    def test_token_ids(self):
+        cache = TokenCache()
+        first, second, third = cache.token_ids("13a", False, self.segments)
+        self.assertListEqual(cache.tokens(first), ["Hello", ",", "world", "!"])
+        self.assertIs(first, third)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        # Tokens are interned: the same token has the same id in every segment.
+        self.assertEqual(first[0], cache.token_ids("13a", False, ["Hello"])[0][0])
+
+    def test_tokenizer_and_lowercase_are_part_of_the_key(self):
+        cache = TokenCache()
+        self.assertListEqual(cache.tokenized("13a", True, self.segments[1:2]), ["it's a test ."])
+        self.assertListEqual(cache.tokenized("13a", False, self.segments[1:2]), ["It's a TEST ."])
+        self.assertListEqual(cache.tokenized("space", False, ["a  b\n"]), ["a  b"])
+        self.assertEqual(len(cache), 3)
+
+    def test_chars(self):
+        cache = TokenCache()
+        ids = cache.token_ids("13a-chars", False, ["ab, a"])[0]
+        self.assertListEqual(cache.tokens(ids), ["a", "b", " ", ",", " ", "a"])
+
+    def test_lru_bound(self):
+        cache = TokenCache(max_segments=2)
+        cache.token_ids("13a", False, ["a", "b", "a", "c"])
+        self.assertEqual(len(cache), 2)
+        cache.token_ids("13a", False, ["a"])
+        self.assertEqual(cache.misses, 3)
+
+    def test_tokenization_run(self):
+        with tokenization_run() as cache:
+            with tokenization_run():
+                cache.token_ids("13a", False, self.segments)
+            self.assertEqual(len(token_cache()), 2)
+        self.assertEqual(len(token_cache()), 0)
+        self.assertEqual(token_cache().vocab_size, 0)
+
+    def test_metrics_match_sacrebleu(self):
+        cand = ["The CAT sat on the mat.", "Hello &amp; world", ""]
+        ref = ["The cat sat on the mat.", "hello and world", "Nothing"]
+        with tokenization_run():
+            bleu = sacreBLEU(language="en").score([], cand, ref)
+            ter = TER(language="en").score([], cand, ref)
+        self.assertAlmostEqual(bleu.sys_score, sacrebleu.corpus_bleu(cand, [ref]).score / 100)
+        self.assertAlmostEqual(ter.sys_score, sacrebleu.corpus_ter(cand, [ref]).score / 100)
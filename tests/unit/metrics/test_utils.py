@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from telescope.metrics.utils import length_batches
+
+
+class TestLengthBatches(unittest.TestCase):
+
+    def test_batches_are_sorted_and_bounded(self):
+        lengths = [5, 50, 3, 40, 4, 6]
+        batches = length_batches(lengths, batch_size=2, max_tokens=100)
+        self.assertListEqual(batches, [[2, 4], [0, 5], [3, 1]])
+
+    def test_token_budget(self):
+        lengths = [10, 10, 10, 30, 200]
+        batches = length_batches(lengths, batch_size=16, max_tokens=60)
+        self.assertListEqual(batches, [[0, 1, 2], [3], [4]])
+        self.assertListEqual(sorted(i for b in batches for i in b), list(range(len(lengths))))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from telescope.metrics import GLEU, ROUGEL, TER, ROUGEOne, ROUGETwo, ZeroEdit, chrF, sacreBLEU
+from telescope.shards import load_shards, parse_shard, shard_bounds
+
+
+class TestShardBounds(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/8"), (2, 8))
+        self.assertEqual(parse_shard(" 1 / 1 "), (1, 1))
+        for shard in ["0/4", "5/4", "2", "a/b", "1/4/2"]:
+            with self.assertRaises(ValueError):
+                parse_shard(shard)
+
+    def test_bounds_match_array_split(self):
+        for size in [0, 1, 7, 400]:
+            for count in [1, 3, 8]:
+                expected = np.array_split(np.arange(size), count)
+                for index in range(1, count + 1):
+                    start, stop = shard_bounds(size, index, count)
+                    self.assertListEqual(list(range(start, stop)), expected[index - 1].tolist())
+
+
+class TestMergeShards(unittest.TestCase):
+
+    src = ["a b c", "d e f", "g h i", "j k l", "m n o"]
+    cand = ["the cat sat. on the mat", "a dog", "", "hello there world", "one two three."]
+    ref = ["the cat sat on a mat.", "the dog", "something", "hello world", "one two. three"]
+
+    def test_results_are_rebuilt(self):
+        for cls in [sacreBLEU, chrF, TER, ROUGEOne, ROUGETwo, ROUGEL, ZeroEdit, GLEU]:
+            metric = cls(language="en")
+            expected = metric.score(self.src, self.cand, self.ref)
+            values = []
+            for start, stop in [shard_bounds(len(self.cand), i, 3) for i in range(1, 4)]:
+                result = metric.score(self.src[start:stop], self.cand[start:stop], self.ref[start:stop])
+                values += metric.shard_values(result)
+            # Shard files are JSON: values must survive a round trip.
+            values = json.loads(json.dumps(values))
+            merged = metric.merge_shards(self.src, self.cand, self.ref, values)
+            self.assertEqual(merged.sys_score, expected.sys_score, cls.name)
+            self.assertListEqual(list(merged.seg_scores), list(expected.seg_scores), cls.name)
+
+
+class TestLoadShards(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, index, count, digest="x", ref_filename="ref.txt"):
+        data = {
+            "shard": {"index": index, "count": count, "rows": [0, 0]},
+            "testset": {"digest": digest, "segments": 0},
+            "task": "machine-translation",
+            "seg_metric": "GLEU",
+            "ref_filename": ref_filename,
+            "collection": {"refs_indexes": {ref_filename: f"Ref {index}"}},
+            "metrics": {"chrF": {}},
+        }
+        path = os.path.join(self.folder.name, f"{ref_filename}-shard-{index}-of-{count}.json")
+        with open(path, "w") as shard_file:
+            json.dump(data, shard_file)
+        return path
+
+    def test_shards_are_sorted(self):
+        for index in [3, 1, 2]:
+            self.write(index, 3)
+        shards = load_shards([self.folder.name])
+        self.assertListEqual([s["shard"]["index"] for s in shards["ref.txt"]], [1, 2, 3])
+
+    def test_missing_shard(self):
+        self.write(1, 3)
+        self.write(3, 3)
+        with self.assertRaisesRegex(ValueError, "Missing shards of ref.txt: 2/3"):
+            load_shards([self.folder.name])
+
+    def test_duplicate_shard(self):
+        path = self.write(1, 2)
+        self.write(2, 2)
+        with self.assertRaisesRegex(ValueError, "found twice"):
+            load_shards([self.folder.name, path])
+
+    def test_different_testsets(self):
+        self.write(1, 2, digest="x")
+        self.write(2, 2, digest="y")
+        with self.assertRaisesRegex(ValueError, "different runs or testsets"):
+            load_shards([self.folder.name])
+
+    def test_no_shards(self):
+        with self.assertRaisesRegex(ValueError, "No shard files"):
+            load_shards([self.folder.name])
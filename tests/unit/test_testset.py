@@ -12,10 +12,23 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import pickle
 import unittest
+from unittest import mock
 
-from telescope.testset import PairwiseTestset, MultipleTestset
-from telescope.collection_testsets import MTTestsets
+import numpy as np
+
+from telescope.testset import (
+    ColumnView,
+    LabelColumn,
+    MultipleTestset,
+    PairwiseTestset,
+    TextColumn,
+    column_digest,
+    label_columns,
+)
+from telescope.collection_testsets import ClassTestsets, CollectionTestsets, MTTestsets
+from telescope.utils import LineFile
 
 
 class TestTestset(unittest.TestCase):
@@ -126,4 +139,193 @@ class TestTestset(unittest.TestCase):
         self.assertEqual('fr', self.collection.source_language)
     
     def test_target_language(self):
-        self.assertEqual('en', self.collection.target_language)
\ No newline at end of file
+        self.assertEqual('en', self.collection.target_language)
+
+
+class TestLabelColumns(unittest.TestCase):
+
+    labels = ["positive", "negative"]
+
+    def collection(self):
+        outputs = {"Sys 1": ["positive", "neutral", "negative"], "Sys 2": ["negative"] * 3}
+        return ClassTestsets(
+            src_name="src.txt",
+            refs_names=["ref_1.txt", "ref_2.txt"],
+            refs_indexes={"ref_1.txt": "Ref 1", "ref_2.txt": "Ref 2"},
+            systems_indexes={"sys_1.txt": "Sys 1", "sys_2.txt": "Sys 2"},
+            systems_names={"Sys 1": "Sys 1", "Sys 2": "Sys 2"},
+            filenames=["src.txt", "ref_1.txt", "ref_2.txt", "Sys 1", "Sys 2"],
+            testsets={
+                "ref_1.txt": MultipleTestset(["a", "b", "c"], ["positive"] * 3, outputs, []),
+                "ref_2.txt": MultipleTestset(["a", "b", "c"], ["mixed", "negative", "positive"], outputs, []),
+            },
+            labels=self.labels,
+        )
+
+    def test_label_columns(self):
+        first, second = label_columns([["b", "a"], ["c", "b", "b"]], ["b", "x"])
+        self.assertListEqual(first.vocabulary, ["b", "x", "a", "c"])
+        self.assertEqual(first.codes.dtype, np.uint8)
+        self.assertListEqual(first.codes.tolist(), [0, 2])
+        self.assertListEqual(second.codes.tolist(), [3, 0, 0])
+        self.assertIs(first.vocabulary, second.vocabulary)
+
+    def test_string_view(self):
+        column = label_columns([["b", "a", "c"]])[0]
+        self.assertEqual(column[1], "a")
+        self.assertListEqual(list(column), ["b", "a", "c"])
+        self.assertIsInstance(column[[2, 0]], LabelColumn)
+        self.assertEqual(column[[2, 0]], ["c", "b"])
+        self.assertEqual(column[1:], ("a", "c"))
+        self.assertEqual(len(column[[]]), 0)
+
+    def test_collection_is_encoded(self):
+        collection = self.collection()
+        ref_1 = collection.testsets["ref_1.txt"]
+        ref_2 = collection.testsets["ref_2.txt"]
+        self.assertListEqual(
+            ref_1.ref.vocabulary, ["positive", "negative", "mixed", "neutral"]
+        )
+        self.assertEqual(ref_2.ref, ["mixed", "negative", "positive"])
+        self.assertIs(ref_1.systems_output["Sys 1"], ref_2.systems_output["Sys 1"])
+        self.assertEqual(ref_1.systems_output["Sys 1"], ["positive", "neutral", "negative"])
+        self.assertTupleEqual(ref_2[0], ("a", "mixed", "positive", "negative"))
+
+    def test_filter_keeps_codes(self):
+        testset = self.collection().testsets["ref_2.txt"]
+        filter = mock.Mock(mask=lambda: np.array([True, False, True]))
+        testset.apply_filter(filter)
+        self.assertIsInstance(testset.ref, LabelColumn)
+        self.assertEqual(testset.ref, ["mixed", "positive"])
+        self.assertEqual(testset.systems_output["Sys 1"], ["positive", "negative"])
+
+
+class TestColumnViews(unittest.TestCase):
+
+    def test_masks_create_views(self):
+        src = ["a", "b", "c", "d"]
+        outputs = {"Sys 1": ["w", "x", "y", "z"]}
+        testset = MultipleTestset(src, ["A", "B", "C", "D"], outputs, [])
+        testset.apply_mask(np.array([True, False, True, True]))
+        testset.apply_mask(np.array([False, True, True]))
+        self.assertIsInstance(testset.src, ColumnView)
+        # Views of views read the original lists.
+        self.assertIs(testset.src.base, src)
+        self.assertIs(testset.systems_output["Sys 1"].base, outputs["Sys 1"])
+        self.assertEqual(testset.src, ["c", "d"])
+        self.assertTupleEqual(testset[1], ("d", "D", "z"))
+        self.assertListEqual(outputs["Sys 1"], ["w", "x", "y", "z"])
+
+    def test_view_as_list(self):
+        view = ColumnView(["a", "b", "c"], np.array([2, 0]))
+        self.assertListEqual(view + ["d"], ["c", "a", "d"])
+        self.assertListEqual(["d"] + view, ["d", "c", "a"])
+        self.assertListEqual(pickle.loads(pickle.dumps(view)), ["c", "a"])
+        self.assertEqual(view[1:], ["a"])
+
+
+class TestTextColumns(unittest.TestCase):
+
+    lines = ["Hello world.", "", "Olá mundo!", "This is a test."]
+
+    def test_text_column(self):
+        column = TextColumn.from_lines(self.lines)
+        self.assertEqual(len(column), 4)
+        self.assertEqual(column[2], "Olá mundo!")
+        self.assertEqual(column[-1], "This is a test.")
+        self.assertEqual(column, self.lines)
+        self.assertIs(TextColumn.from_lines(column), column)
+        self.assertIsInstance(column[1:3], TextColumn)
+        self.assertEqual(column[1:3], ["", "Olá mundo!"])
+        self.assertEqual(column[::2], ["Hello world.", "Olá mundo!"])
+        self.assertListEqual(column + ["x"], self.lines + ["x"])
+
+    def test_chunked_decoding(self):
+        column = TextColumn.from_lines(self.lines)
+        with mock.patch("telescope.testset.DECODE_CHUNK", 3):
+            self.assertListEqual(list(column), self.lines)
+            self.assertListEqual(list(column[[3, 0, 2, 1]]), [self.lines[i] for i in [3, 0, 2, 1]])
+
+    def test_label_columns(self):
+        first, second = label_columns(
+            [TextColumn.from_lines(["b", "a"]), TextColumn.from_lines(["c", "b", "b"])], ["b", "x"]
+        )
+        self.assertListEqual(first.vocabulary, ["b", "x", "a", "c"])
+        self.assertListEqual(first.codes.tolist(), [0, 2])
+        self.assertListEqual(second.codes.tolist(), [3, 0, 0])
+
+    def test_columns_are_shared(self):
+        source = mock.Mock()
+        source.name = "src.txt"
+        files = [
+            source,
+            ["a", "b"],
+            None,
+            {"ref_1.txt": ["A", "B"], "ref_2.txt": ["C", "D"]},
+            None,
+            None,
+            {"sys.txt": "Sys 1"},
+            None,
+            {"Sys 1": ["x", "y"]},
+        ]
+        testsets = CollectionTestsets.create_testsets(files)
+        ref_1, ref_2 = testsets["ref_1.txt"], testsets["ref_2.txt"]
+        self.assertIsInstance(ref_1.src, TextColumn)
+        self.assertIs(ref_1.src, ref_2.src)
+        self.assertIs(ref_1.systems_output["Sys 1"], ref_2.systems_output["Sys 1"])
+        self.assertEqual(ref_2.ref, ["C", "D"])
+        self.assertTupleEqual(ref_2[1], ("b", "D", "y"))
+
+
+class TestDigests(unittest.TestCase):
+
+    lines = ["Hello world.", "", "Olá mundo!", "This is a test."]
+
+    def make_testset(self, ref, filenames):
+        return MultipleTestset(
+            TextColumn.from_lines(["a", "b", "c", "d"]),
+            TextColumn.from_lines(ref),
+            {"Sys 1": TextColumn.from_lines(self.lines)},
+            filenames,
+        )
+
+    def test_column_digest_ignores_storage(self):
+        column = TextColumn.from_lines(self.lines)
+        digest = column_digest(self.lines)
+        self.assertEqual(column.digest, digest)
+        self.assertEqual(column_digest(LineFile(" \n".join(self.lines).encode())), digest)
+        self.assertEqual(column_digest(column[[0, 1]]), column[:2].digest)
+        self.assertEqual(column_digest(ColumnView(self.lines, np.array([2, 3]))), column[2:].digest)
+        self.assertNotEqual(column_digest(self.lines[:3]), digest)
+        self.assertNotEqual(column_digest(["Hello world.Olá mundo!", "This is a test."]), column[::2].digest)
+
+    def test_label_digest_ignores_vocabulary(self):
+        first = LabelColumn(np.array([0, 1, 0]), ["a", "b"])
+        second = LabelColumn(np.array([1, 0, 1]), ["b", "a"])
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(first.digest, column_digest(["a", "b", "a"]))
+
+    def test_testset_identity(self):
+        testset = self.make_testset(["A", "B", "C", "D"], ["src.txt", "ref.txt", "sys.txt"])
+        renamed = self.make_testset(["A", "B", "C", "D"], ["other.txt", "names.txt", "out.txt"])
+        changed = self.make_testset(["A", "B", "C", "E"], ["src.txt", "ref.txt", "sys.txt"])
+        self.assertEqual(MultipleTestset.hash_func(testset), MultipleTestset.hash_func(renamed))
+        self.assertNotEqual(testset.digest, changed.digest)
+
+        digest = testset.digest
+        testset.apply_mask(np.array([True, False, True, True]))
+        self.assertNotEqual(testset.digest, digest)
+        rows = [0, 2, 3]
+        filtered = MultipleTestset(
+            ["a", "c", "d"], ["A", "C", "D"], {"Sys 1": [self.lines[i] for i in rows]}, []
+        )
+        self.assertEqual(testset.digest, filtered.digest)
+
+    def test_collection_identity(self):
+        testsets = {"ref.txt": self.make_testset(["A", "B", "C", "D"], [])}
+        collection = ClassTestsets("src.txt", ["ref.txt"], {}, {}, {}, [], testsets, ["A", "B"])
+        digest = CollectionTestsets.hash_func(collection)
+        self.assertEqual(digest, ClassTestsets("x", ["ref.txt"], {}, {}, {}, [], {
+            "ref.txt": self.make_testset(["A", "B", "C", "D"], [])}, ["A", "B"]).digest)
+        self.assertNotEqual(digest, ClassTestsets("src.txt", ["ref.txt"], {}, {}, {}, [], {
+            "ref.txt": self.make_testset(["A", "B", "C", "D"], [])}, ["B", "A"]).digest)
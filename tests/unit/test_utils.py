@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Unbabel
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import pyarrow as pa
+
+from telescope.testset import TextColumn
+from telescope.utils import LineFile, file_lines, read_lines, text_digest
+
+
+class TestLineFile(unittest.TestCase):
+
+    texts = [
+        b"",
+        b"a",
+        b"a\n",
+        b"a\nb",
+        b" a \r\n\n\tb\n",
+        b"x\ry\n",
+        b"\r\r\n\ra\r",
+        "olá\nmundo  \n\n".encode(),
+    ]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, text: bytes) -> str:
+        path = os.path.join(self.folder.name, "lines.txt")
+        with open(path, "wb") as file:
+            file.write(text)
+        return path
+
+    def test_matches_readlines(self):
+        for text in self.texts:
+            # Files opened in text mode.
+            expected = [line.strip() for line in io.TextIOWrapper(io.BytesIO(text)).readlines()]
+            lines = LineFile.open(self.write(text))
+            self.assertEqual(len(lines), len(expected))
+            self.assertListEqual(list(lines), expected)
+            self.assertListEqual([lines[i] for i in range(len(lines))], expected)
+            self.assertListEqual(lines.to_arrow().to_pylist(), expected)
+
+    def test_chunks(self):
+        text = "".join(f"  line {i}\n" for i in range(100)).encode()
+        with mock.patch("telescope.utils.SCAN_CHUNK", 7), mock.patch("telescope.utils.DECODE_LINES", 3):
+            lines = LineFile(text)
+            self.assertListEqual(list(lines), [f"line {i}" for i in range(100)])
+        self.assertEqual(lines[-1], "line 99")
+        self.assertListEqual(lines[2:4], ["line 2", "line 3"])
+        # A "\r\n" split across two chunks is a single line break.
+        text = "".join(f"line {i}\r\n" for i in range(100)).encode()
+        with mock.patch("telescope.utils.SCAN_CHUNK", 7), mock.patch("telescope.utils.DECODE_LINES", 3):
+            lines = LineFile(text)
+            self.assertListEqual(list(lines), [f"line {i}" for i in range(100)])
+
+    def test_pickle_reopens_file(self):
+        path = self.write(b"a\nb\n")
+        lines = pickle.loads(pickle.dumps(LineFile.open(path)))
+        self.assertIsInstance(lines, LineFile)
+        self.assertListEqual(list(lines), ["a", "b"])
+        self.assertListEqual(pickle.loads(pickle.dumps(LineFile(b"c\n"))), ["c"])
+
+    def test_file_lines(self):
+        with open(self.write(b"a \nb\n")) as file:
+            self.assertIsInstance(file_lines(file), LineFile)
+        self.assertListEqual(file_lines(io.StringIO("a \nb\n")), ["a", "b"])
+        self.assertListEqual(list(read_lines(io.BytesIO(b"x\ny"))), ["x", "y"])
+        # Uploads keep their "\n" line breaks: a stray "\r" is part of the line.
+        uploaded = read_lines(io.BytesIO(b"a\rb\r\nc\n"))
+        expected = [line.strip() for line in io.StringIO("a\rb\r\nc\n").readlines()]
+        self.assertListEqual(list(uploaded), expected)
+        self.assertListEqual(uploaded.to_arrow().to_pylist(), expected)
+        self.assertEqual(len(uploaded), 2)
+        self.assertIsNone(read_lines(None))
+
+    def test_text_column(self):
+        column = TextColumn.from_lines(LineFile(b" x\ny \n"))
+        self.assertListEqual(column.tolist(), ["x", "y"])
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(Exception):
+            LineFile(b"\xff\n").to_arrow()
+
+    def test_digest(self):
+        lines = LineFile(b" a\nb c \n\n")
+        self.assertEqual(lines.digest, text_digest(pa.array(["a", "b c", ""])))
+        self.assertEqual(text_digest(pa.array(["x", "a", "b c", ""]).slice(1)), lines.digest)
+        self.assertNotEqual(text_digest(pa.array(["a", "b", "c", ""])), lines.digest)
+        self.assertNotEqual(text_digest(pa.array([])), text_digest(pa.array([""])))